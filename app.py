@@ -1,16 +1,36 @@
+import time
+_run_started = time.perf_counter()
+
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
-from shapely.geometry import Polygon, Point
-from geopy.geocoders import Nominatim
-import pandas as pd
-import numpy as np
-import time
+from shapely.geometry import Polygon
+from shapely.ops import unary_union
+from shapely.errors import GEOSException
 from datetime import datetime, timedelta
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-import xml.etree.ElementTree as ET
-import io
+import os
+import uuid
+import html
 import json
+from collections import deque
+from contextlib import contextmanager
+from grid import generate_grid_points, estimate_grid_points, split_into_tiles, stratified_order
+from geocoding import (
+    NOMINATIM_USER_AGENT, RateLimiter, CircuitBreaker, HttpStats, Prefetcher, GeocoderBackend, BackendPool,
+    make_reverse_geocoder, make_forward_geocoder, geocode_with_retry, parse_backend_spec
+)
+from records import estimate_memory
+from density import DensityGrid
+from geocache import GeocodeCache, get_cache_key, get_query_key, export_snapshot, read_snapshot, import_snapshot
+from kml_parser import KmlValidationError, read_validated_kml, build_polygon_geometry
+from polygon_store import PolygonStore
+from result_store import ResultStore, result_key
+from streets import load_street_index, street_sample_points
+from engine import ExtractionEngine, Budget, tiled_sampler, join_points_to_polygons, repeated_lookups
+from profiling import PROFILING_ENABLED, profile_run
+
+# pandas and geopy are imported lazily where they are first needed
+_imports_done = time.perf_counter()
 
 # Set page config to wide mode
 st.set_page_config(layout="wide")
@@ -48,39 +68,185 @@ if 'last_request_time' not in st.session_state:
     st.session_state.last_request_time = datetime.min
 if 'request_count' not in st.session_state:
     st.session_state.request_count = 0
-if 'cache' not in st.session_state:
-    st.session_state.cache = {}
-if 'cache_timestamp' not in st.session_state:
-    st.session_state.cache_timestamp = datetime.now()
 if 'map_location' not in st.session_state:
     st.session_state.map_location = [33.14773, -96.88784]
 if 'map_zoom' not in st.session_state:
     st.session_state.map_zoom = 15
-if 'kml_polygons' not in st.session_state:
-    st.session_state.kml_polygons = []
 if 'selected_polygon_results' not in st.session_state:
     st.session_state.selected_polygon_results = {}
+if 'kml_hash' not in st.session_state:
+    st.session_state.kml_hash = None
+if 'prefetch_jobs' not in st.session_state:
+    st.session_state.prefetch_jobs = []
+if 'prefetch_key' not in st.session_state:
+    st.session_state.prefetch_key = None
+if 'kml_file_id' not in st.session_state:
+    st.session_state.kml_file_id = None
+if 'run_timings' not in st.session_state:
+    st.session_state.run_timings = deque(maxlen=50)
+if 'recent_searches' not in st.session_state:
+    st.session_state.recent_searches = {}
+if 'last_search' not in st.session_state:
+    st.session_state.last_search = (None, 0.0)
+if 'profiles' not in st.session_state:
+    st.session_state.profiles = deque(maxlen=10)
 
 # Constants
 MAX_AREA = 5.0  # Maximum area in square kilometers
 MAX_POINTS = 1000  # Maximum points per request
 COOLDOWN_MINUTES = 5  # Cooldown period between requests
 REQUESTS_PER_PERIOD = 3  # Number of requests allowed per period
-CACHE_DURATION = timedelta(hours=24)  # Cache duration
+CACHE_DURATION = timedelta(hours=24)  # Cache duration of each entry
+CACHE_MAX_ENTRIES = 50000  # Maximum geocode cache entries per session
+CACHE_MAX_BYTES = 32 * 1024 * 1024  # Maximum approximate geocode cache size per session
+MAX_TILED_AREA = 500.0  # Maximum area in square kilometers when tiling
+MAX_TILED_POINTS = 50000  # Maximum points per tiled request
+TILE_WORKERS = min(4, os.cpu_count() or 1)  # Processes generating tile grids
+GEOCODE_MIN_INTERVAL = float(os.environ.get('GEOCODE_MIN_INTERVAL', 1.0))  # Seconds between geocoder requests across all sessions
+NOMINATIM_DOMAIN = os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')  # Self-hosted or fake servers for testing
+NOMINATIM_SCHEME = os.environ.get('NOMINATIM_SCHEME', 'https')
+NOMINATIM_BACKENDS = os.environ.get('NOMINATIM_BACKENDS', '')  # Reverse-geocoding replicas, "URL [MIN_INTERVAL] [fallback], ..."
+GEOCODER_POOL_SIZE = int(os.environ.get('GEOCODER_POOL_SIZE', 10))  # Keep-alive connections to the geocoder, shared by all sessions
+GEOCODER_TIMEOUT = float(os.environ.get('GEOCODER_TIMEOUT', 1.0))  # Seconds before a geocoder request times out
+GEOCODER_COMPRESSION = os.environ.get('GEOCODER_COMPRESSION', '1') != '0'  # Ask the geocoder for gzip responses
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive geocoder failures that open the circuit breaker
+BREAKER_RESET_SECONDS = 30.0  # Seconds the breaker stays open before a trial request
+PROGRESS_UPDATE_INTERVAL = 0.5  # Minimum seconds between progress messages to the browser
+LIVE_MAP_UPDATE_INTERVAL = 3.0  # Minimum seconds between redraws of the live results map
+LIVE_MAP_HEIGHT = 350  # Height in pixels of the live results map
+DEFAULT_DENSITY_SHAPE = 'hex'  # Cell shape of the households-per-cell density grid
+DEFAULT_DENSITY_CELL_SIZE = 200  # Metres between density cell centres
+SEARCH_CACHE_MAX_ENTRIES = 5000  # Location searches cached for all sessions
+SEARCH_CACHE_MAX_BYTES = 4 * 1024 * 1024  # Maximum approximate size of the search cache
+SEARCH_DEBOUNCE_SECONDS = 2.0  # Repeat submissions of the same query within this window are ignored
+RECENT_SEARCHES = 5  # Recent searches offered for instant repeat
+CACHE_SNAPSHOT_PATH = os.environ.get('GEOCODE_CACHE_SNAPSHOT')  # Snapshot merged into every new session cache
+STREETS_OSM_PATH = os.environ.get('OSM_EXTRACT_PATH')  # Local OSM extract enabling street-guided sampling
+DEFAULT_STREET_SPACING = 20  # Metres between street-side sample points
+DEFAULT_STREET_OFFSET = 12  # Metres from a street's centerline to its sample points
+MAX_MAP_POLYGONS = 500  # Most KML polygons drawn on the map at once, taken from the visible area
+MAP_KEY = 'main_map'  # Session state key holding what the map last reported, viewport included
 
-# Initialize Nominatim geocoder
-geolocator = Nominatim(
-    user_agent="FlytrexAddressExtractor/1.0 (+https://www.flytrex.com) Contact: shaik@flytrex.com"
-)
+def make_geolocator(domain, scheme):
+    """Nominatim geocoder for one server, with its own pooled keep-alive HTTP session"""
+    from geopy.geocoders import Nominatim
+    from http_pool import pooled_adapter_factory
+    return Nominatim(
+        user_agent=NOMINATIM_USER_AGENT, domain=domain, scheme=scheme, timeout=GEOCODER_TIMEOUT,
+        adapter_factory=pooled_adapter_factory(GEOCODER_POOL_SIZE, compression=GEOCODER_COMPRESSION, stats=get_http_stats())
+    )
 
-def clear_expired_cache():
-    current_time = datetime.now()
-    if current_time - st.session_state.cache_timestamp > CACHE_DURATION:
-        st.session_state.cache = {}
-        st.session_state.cache_timestamp = current_time
+@st.cache_resource
+def get_geolocator():
+    """Nominatim geocoder, with its pooled keep-alive HTTP session, shared by every session and rerun"""
+    return make_geolocator(NOMINATIM_DOMAIN, NOMINATIM_SCHEME)
+
+@st.cache_resource
+def get_backend_pool():
+    """Reverse-geocoding backends shared by every session: those in NOMINATIM_BACKENDS, or NOMINATIM_DOMAIN alone.
+    
+    The NOMINATIM_DOMAIN backend uses the rate limiter and breaker of
+    location search, so together they never exceed that server's limit;
+    an interval its entry sets applies to both (see get_rate_limiter), and
+    a scheme other than NOMINATIM_SCHEME gets its own HTTP session. Other
+    backends get their own limiter and breaker, at GEOCODE_MIN_INTERVAL
+    unless the entry sets an interval.
+    """
+    specs = parse_backend_spec(NOMINATIM_BACKENDS) or [(NOMINATIM_SCHEME, NOMINATIM_DOMAIN, None, False)]
+    backends = []
+    for scheme, domain, min_interval, fallback in specs:
+        if domain == NOMINATIM_DOMAIN:
+            geolocator = get_geolocator() if scheme == NOMINATIM_SCHEME else make_geolocator(domain, scheme)
+            rate_limiter, breaker = get_rate_limiter(), get_circuit_breaker()
+        else:
+            geolocator = make_geolocator(domain, scheme)
+            rate_limiter = RateLimiter(GEOCODE_MIN_INTERVAL if min_interval is None else min_interval)
+            breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+        backends.append(GeocoderBackend(domain, make_reverse_geocoder(geolocator), rate_limiter, breaker, fallback))
+    return BackendPool(backends)
 
-def get_cache_key(lat, lon):
-    return f"{lat:.6f},{lon:.6f}"
+@st.cache_resource
+def get_http_stats():
+    """Request latency and connection reuse of the shared geocoder HTTP session"""
+    return HttpStats()
+
+@st.cache_resource
+def get_cold_start_seconds(_import_seconds):
+    """Import time of the first run in this process; later runs reuse loaded modules"""
+    return _import_seconds
+
+@st.cache_resource
+def load_startup_snapshot(path, mtime):
+    """Read the startup snapshot once per process (and again if the file changes)"""
+    with open(path, 'rb') as f:
+        return list(read_snapshot(f))
+
+# Per-session geocode cache; entries expire individually and are evicted LRU
+if 'cache' not in st.session_state:
+    st.session_state.cache = GeocodeCache(CACHE_DURATION.total_seconds(), CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+    if CACHE_SNAPSHOT_PATH and os.path.exists(CACHE_SNAPSHOT_PATH):
+        try:
+            snapshot = load_startup_snapshot(CACHE_SNAPSHOT_PATH, os.path.getmtime(CACHE_SNAPSHOT_PATH))
+            import_snapshot(st.session_state.cache, snapshot)
+        except Exception as e:
+            st.warning(f"Could not load geocode cache snapshot: {str(e)}")
+
+@st.cache_resource
+def get_rate_limiter():
+    """Process-wide limiter for NOMINATIM_DOMAIN shared by every session's geocoding.
+    
+    Its interval is GEOCODE_MIN_INTERVAL unless the NOMINATIM_BACKENDS
+    entry for that domain sets one.
+    """
+    intervals = [
+        min_interval for _, domain, min_interval, _ in parse_backend_spec(NOMINATIM_BACKENDS)
+        if domain == NOMINATIM_DOMAIN and min_interval is not None
+    ]
+    return RateLimiter(intervals[0] if intervals else GEOCODE_MIN_INTERVAL)
+
+@st.cache_resource
+def get_circuit_breaker():
+    """Process-wide breaker that pauses every session's geocoding while the geocoder is down"""
+    return CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+@st.cache_resource
+def get_result_store():
+    """Finished analyses shared by every session, keyed by geometry and sampling settings"""
+    return ResultStore(max_age=CACHE_DURATION.total_seconds())
+
+def get_analysis_key(geometry, grid_size):
+    """Result store key of analyzing a geometry with the grid sampler and this app's geocoder.
+    
+    Tiled runs sample exactly the same points as plain grid runs, so both
+    share the 'grid' sampler name.
+    """
+    try:
+        return result_key(geometry, grid_size, get_sampler_name(), f"nominatim:{get_backend_pool().name}")
+    except GEOSException:
+        # Geometry that cannot be hashed is still analyzed, just never stored
+        return None
+
+def load_stored_result(key):
+    """(addresses, created) stored for an analysis, or None if there is none, no key or Force refresh is set"""
+    if key is None or st.session_state.get('force_refresh'):
+        return None
+    return get_result_store().get(key)
+
+def format_age(timestamp):
+    """Human-readable time since a timestamp, e.g. '5 min' or '3 days'"""
+    seconds = max(time.time() - timestamp, 0)
+    if seconds < 60:
+        return "under a minute"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 86400:
+        return f"{seconds / 3600:.0f} h"
+    return f"{seconds / 86400:.0f} days"
+
+@st.cache_resource
+def get_prefetcher():
+    """Process-wide background worker that warms session caches at low priority"""
+    return Prefetcher()
 
 def check_polygon_size(polygon):
     bounds = polygon.bounds
@@ -106,106 +272,89 @@ def check_rate_limit():
     
     return True
 
-def parse_kml_file(kml_content):
-    """Parse KML file and extract polygon coordinates"""
+@st.cache_resource
+def get_polygon_store():
+    """Store of uploaded and pasted KML files shared by all sessions and the converter page"""
+    return PolygonStore()
+
+def store_kml_file(kml_file, name):
+    """Validate and store an uploaded KML file, reporting problems in the page; returns its hash or None"""
     try:
-        # Parse the KML content
-        root = ET.fromstring(kml_content)
-        
-        # Handle different KML namespace formats
-        namespaces = {
-            'kml': 'http://www.opengis.net/kml/2.2',
-            'kml20': 'http://earth.google.com/kml/2.0',
-            'kml21': 'http://earth.google.com/kml/2.1',
-            'kml22': 'http://earth.google.com/kml/2.2'
-        }
-        
-        polygons = []
-        
-        # Try to find polygons with different namespace approaches
-        for ns_name, ns_uri in namespaces.items():
-            # Look for Polygon elements
-            polygon_elements = root.findall(f".//{{{ns_uri}}}Polygon")
-            if polygon_elements:
-                break
-        else:
-            # If no namespaced elements found, try without namespace
-            polygon_elements = root.findall(".//Polygon")
-        
-        for i, polygon_elem in enumerate(polygon_elements):
-            try:
-                # Find the outer boundary coordinates
-                outer_boundary = None
-                for ns_name, ns_uri in namespaces.items():
-                    outer_boundary = polygon_elem.find(f".//{{{ns_uri}}}outerBoundaryIs//{{{ns_uri}}}coordinates")
-                    if outer_boundary is not None:
-                        break
-                
-                if outer_boundary is None:
-                    # Try without namespace
-                    outer_boundary = polygon_elem.find(".//outerBoundaryIs//coordinates")
-                
-                if outer_boundary is not None and outer_boundary.text:
-                    # Parse coordinates string
-                    coords_text = outer_boundary.text.strip()
-                    coord_pairs = []
-                    
-                    # Split by whitespace and newlines
-                    coords_list = coords_text.replace('\n', ' ').split()
-                    
-                    for coord in coords_list:
-                        coord = coord.strip()
-                        if coord:
-                            parts = coord.split(',')
-                            if len(parts) >= 2:
-                                try:
-                                    lon = float(parts[0])
-                                    lat = float(parts[1])
-                                    coord_pairs.append([lon, lat])
-                                except ValueError:
-                                    continue
-                    
-                    if len(coord_pairs) >= 3:  # Need at least 3 points for a polygon
-                        # Try to find a name for the polygon
-                        name = f"Polygon {i+1}"
-                        name_elem = polygon_elem.find(".//name")
-                        if name_elem is not None and name_elem.text:
-                            name = name_elem.text.strip()
-                        
-                        polygons.append({
-                            'name': name,
-                            'coordinates': coord_pairs,
-                            'id': f"kml_polygon_{i}"
-                        })
-            except Exception as e:
-                st.warning(f"Error parsing polygon {i+1}: {str(e)}")
-                continue
-        
-        return polygons
-    except Exception as e:
+        kml_hash, warnings = get_polygon_store().add(read_validated_kml(kml_file), name)
+        for message in warnings:
+            st.warning(message)
+        return kml_hash
+    except KmlValidationError as e:
         st.error(f"Error parsing KML file: {str(e)}")
-        return []
+    except ValueError:
+        st.error("No polygons found in the uploaded KML file")
+    return None
+
+@st.cache_resource(max_entries=16)
+def list_kml_polygons(kml_hash):
+    """(polygon id, name) of a stored KML's polygons, read once and shared by all sessions"""
+    return get_polygon_store().summaries(kml_hash)
+
+@st.cache_resource(max_entries=64)
+def load_kml_polygon(kml_hash, polygon_id):
+    """Load one stored polygon record; the read-only result is shared by all sessions"""
+    return get_polygon_store().get(kml_hash, polygon_id)
+
+def use_stored_kml(kml_hash):
+    """Make a stored KML the session's polygons and center the map on them"""
+    st.session_state.kml_hash = kml_hash
+    min_lon, min_lat, max_lon, max_lat = get_polygon_store().bounds(kml_hash)
+    st.session_state.map_location = [(min_lat + max_lat) / 2, (min_lon + max_lon) / 2]
+    # The last viewport may show none of the new polygons
+    st.session_state.pop(MAP_KEY, None)
 
-def extract_addresses_from_polygon(polygon_coords, grid_size):
+def get_map_viewport():
+    """(min_lon, min_lat, max_lon, max_lat) the map last reported, or None before it has"""
+    bounds = (st.session_state.get(MAP_KEY) or {}).get('bounds') or {}
+    south_west = bounds.get('_southWest') or {}
+    north_east = bounds.get('_northEast') or {}
+    viewport = (south_west.get('lng'), south_west.get('lat'), north_east.get('lng'), north_east.get('lat'))
+    return None if None in viewport else viewport
+
+@st.cache_resource(max_entries=2)
+def get_street_index(path, mtime):
+    """Street centerlines of the whole OSM extract, parsed once per extract version and queried by area"""
+    return load_street_index(path)
+
+def street_mode():
+    """Whether street-guided sampling is available and selected in Settings"""
+    return bool(STREETS_OSM_PATH) and st.session_state.get('sampler_mode') == 'streets'
+
+def get_sampler_name():
+    """Sampler part of the result store key; street sampling depends on its settings and extract"""
+    if not street_mode():
+        return 'grid'
+    return (
+        f"streets:{st.session_state.street_spacing}:{st.session_state.street_offset}:"
+        f"{os.path.basename(STREETS_OSM_PATH)}:{os.path.getmtime(STREETS_OSM_PATH):.0f}"
+    )
+
+def sample_points(polygon, grid_size):
+    """(lat, lon) points to geocode in a polygon: street-side points in street mode, else the grid"""
+    if street_mode():
+        lines = get_street_index(STREETS_OSM_PATH, os.path.getmtime(STREETS_OSM_PATH)).query(polygon.bounds)
+        return street_sample_points(
+            polygon, lines, st.session_state.street_spacing, st.session_state.street_offset
+        )
+    return generate_grid_points(polygon, grid_size)
+
+def extract_addresses_from_polygon(polygon, grid_size):
     """Extract addresses from a polygon using the existing logic"""
     try:
-        polygon = Polygon([(coord[0], coord[1]) for coord in polygon_coords])
-        
         # Check polygon size
         is_valid_size, area = check_polygon_size(polygon)
         if not is_valid_size:
             return None, f"Selected area is too large ({area:.2f} km²). Please select an area smaller than {MAX_AREA} km²."
         
-        # Generate grid points
-        min_x, min_y, max_x, max_y = polygon.bounds
-        x_points = np.arange(min_x, max_x, grid_size)
-        y_points = np.arange(min_y, max_y, grid_size)
-        
-        grid_points = []
-        for y in y_points:
-            for x in x_points:
-                if Point(x, y).within(polygon):
-                    grid_points.append((y, x))
+        # Generate grid (or street-side) points
+        grid_points = sample_points(polygon, grid_size)
+        if not grid_points and street_mode():
+            return None, "No residential streets found in this area of the OSM extract."
         
         # Check points limit
         is_valid_points, point_count = check_points_limit(grid_points)
@@ -221,77 +370,385 @@ def extract_addresses_from_polygon(polygon_coords, grid_size):
     except Exception as e:
         return None, f"Error processing polygon: {str(e)}"
 
-def process_kml_polygon_addresses(grid_points, progress_container):
-    """Process grid points to extract addresses with progress tracking"""
-    st.session_state.request_count += 1
-    st.session_state.last_request_time = datetime.now()
-    
-    with progress_container:
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+def prepare_tiled_job(polygon, grid_size):
+    """Validate a large polygon for tiled processing and split it into tiles"""
+    try:
+        is_valid_size, area = check_polygon_size(polygon)
+        if area > MAX_TILED_AREA:
+            return None, f"Selected area is too large ({area:.2f} km²). Tiled mode supports areas up to {MAX_TILED_AREA} km²."
         
-        addresses = []
-        seen_addresses = set()
+        estimated_points = estimate_grid_points(polygon, grid_size)
+        if estimated_points > MAX_TILED_POINTS:
+            return None, f"Too many points (about {estimated_points}). Tiled mode supports up to {MAX_TILED_POINTS} points; increase grid size."
         
-        for idx, (lat, lon) in enumerate(grid_points):
-            try:
-                location = reverse_geocode_with_retry(lat, lon)
-                
-                if location and location.address not in seen_addresses:
-                    seen_addresses.add(location.address)
-                    address_info = location.raw['address']
-                    addresses.append({
-                        'Latitude': lat,
-                        'Longitude': lon,
-                        'Address': location.address,
-                        'Postal Code': address_info.get('postcode', ''),
-                        'City': address_info.get('city', ''),
-                        'State': address_info.get('state', ''),
-                        'Country': address_info.get('country', '')
-                    })
-                
-                progress = (idx + 1) / len(grid_points)
-                progress_bar.progress(progress)
-                status_text.text(f"Processed {idx + 1}/{len(grid_points)} points")
-                
-            except Exception as e:
-                continue
+        if not check_rate_limit():
+            remaining_time = COOLDOWN_MINUTES - (datetime.now() - st.session_state.last_request_time).total_seconds() / 60
+            return None, f"Rate limit exceeded. Please wait {remaining_time:.1f} minutes before trying again."
+        
+        return split_into_tiles(polygon, grid_size, MAX_POINTS), None
+    except Exception as e:
+        return None, f"Error processing polygon: {str(e)}"
+
+class ProgressReporter:
+    """Progress bar and status line that send at most one update per interval.
+    
+    Every update is a websocket message, so per-point updates are coalesced;
+    the final update (fraction 1.0) is always sent.
+    """
+    
+    def __init__(self, interval=PROGRESS_UPDATE_INTERVAL):
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+        self.interval = interval
+        self._last_update = 0.0
     
-    return addresses
+    def update(self, fraction, text):
+        now = time.monotonic()
+        if fraction >= 1 or now - self._last_update >= self.interval:
+            self._last_update = now
+            self.progress_bar.progress(min(fraction, 1.0))
+            self.status_text.text(text)
 
-def reverse_geocode_with_retry(lat, lon, max_retries=3, initial_delay=1):
-    try:
-        lat = float(lat)
-        lon = float(lon)
-        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-            raise ValueError("Coordinates out of valid range")
-        
-        cache_key = get_cache_key(lat, lon)
-        if cache_key in st.session_state.cache:
-            return st.session_state.cache[cache_key]
+# Clustered markers are built in the browser from one [lat, lon, address] array,
+# instead of one Python marker object (and its own script) per address
+RESULT_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+}
+"""
+
+def add_results_layer(m, addresses, name="Found addresses"):
+    """Add a table's addresses to a map as one client-side clustered marker layer"""
+    rows = [[lat, lon, html.escape(address)] for lat, lon, address in addresses.marker_rows()]
+    folium.plugins.FastMarkerCluster(rows, callback=RESULT_MARKER_CALLBACK, name=name).add_to(m)
+
+def create_density_grid():
+    """Empty density grid with the cell shape and size chosen in Settings"""
+    return DensityGrid(
+        st.session_state.get('density_cell_size', DEFAULT_DENSITY_CELL_SIZE),
+        st.session_state.get('density_shape', DEFAULT_DENSITY_SHAPE)
+    )
+
+def get_density(result):
+    """A result's density grid, rebuilt from its addresses if the cell settings changed since the run"""
+    density = result.get('density')
+    wanted = create_density_grid()
+    if density is None or (density.shape, density.cell_size) != (wanted.shape, wanted.cell_size):
+        result['density'] = density = wanted
+    # Bins only rows the grid has not seen, e.g. those found after a stopped run's last redraw
+    density.sync(result['addresses'])
+    return density
+
+def add_density_layer(m, density, name="Households per cell"):
+    """Add a density grid to a map as a choropleth of households per cell"""
+    if not density.counts:
+        return
+    from branca.colormap import LinearColormap
+    colormap = LinearColormap(['#ffffb2', '#fd8d3c', '#bd0026'], vmin=1, vmax=max(max(density.counts.values()), 2))
+    folium.GeoJson(
+        density.to_geojson(),
+        name=name,
+        style_function=lambda feature: {
+            'fillColor': colormap(feature['properties']['count']),
+            'color': '#555555',
+            'weight': 0.5,
+            'fillOpacity': 0.6,
+        },
+        tooltip=folium.GeoJsonTooltip(['count'], aliases=['Households'])
+    ).add_to(m)
+
+class LiveResultsMap:
+    """Map of a running extraction's addresses, redrawn at most once per interval.
+    
+    Each redraw sends the whole map, so it is throttled like ProgressReporter;
+    the final redraw is always sent.
+    """
+    
+    def __init__(self, addresses, bounds, density=None, interval=LIVE_MAP_UPDATE_INTERVAL):
+        self.placeholder = st.empty()
+        self.addresses = addresses
+        self.bounds = bounds
+        self.density = density
+        self.interval = interval
+        self._last_update = 0.0
+        self._drawn = None
+    
+    def update(self, final=False):
+        now = time.monotonic()
+        if len(self.addresses) == self._drawn or not (final or now - self._last_update >= self.interval):
+            return
+        self._last_update = now
+        self._drawn = len(self.addresses)
         
-        for attempt in range(max_retries):
-            try:
-                delay = initial_delay * (2 ** attempt)
-                time.sleep(delay)
-                
-                location = geolocator.reverse((lat, lon), language='en', zoom=18)
-                
-                if location:
-                    st.session_state.cache[cache_key] = location
-                return location
-                
-            except (GeocoderTimedOut, GeocoderServiceError) as e:
-                if attempt == max_retries - 1:
-                    raise e
-                continue
-            except ConnectionError as e:
-                if attempt == max_retries - 1:
-                    raise e
-                continue
-                
-    except Exception as e:
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        m = folium.Map(tiles='openstreetmap')
+        m.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+        folium.Rectangle([[min_lat, min_lon], [max_lat, max_lon]], color='red', weight=1, fill=False).add_to(m)
+        if self.density is not None:
+            # Only the addresses found since the last redraw are binned
+            self.density.sync(self.addresses)
+            add_density_layer(m, self.density)
+        add_results_layer(m, self.addresses)
+        with self.placeholder.container():
+            st.caption(f"📍 {len(self.addresses)} addresses so far")
+            st.iframe(m.get_root().render(), height=LIVE_MAP_HEIGHT)
+
+def pause_for_geocoder(seconds):
+    """Hold an extraction while the circuit breaker is open; its point is retried afterwards"""
+    st.toast(f"⏸️ Geocoder unavailable, pausing for {seconds:.0f}s")
+    time.sleep(seconds)
+
+def create_budget():
+    """Budget set in Settings for the next extraction, or None for an unlimited run"""
+    minutes = st.session_state.get('budget_minutes') or 0
+    requests = st.session_state.get('budget_requests') or 0
+    if not minutes and not requests:
         return None
+    return Budget(minutes * 60 if minutes else None, requests or None)
+
+def describe_coverage(coverage):
+    """One-line summary of a budgeted run that stopped early"""
+    fraction, estimate = coverage
+    return f"Budget reached after sampling {fraction:.0%} of the grid; estimated ~{estimate} houses in total"
+
+def describe_failed(failed):
+    """Note shown next to a house count when points were lost to geocoder errors, else ''"""
+    if not failed:
+        return ""
+    return f" ({failed} point{'' if failed == 1 else 's'} could not be geocoded)"
+
+def create_engine(budget=None):
+    """Extraction engine geocoding through the shared limiter into this session's cache"""
+    return ExtractionEngine(
+        geocode_point, cache=st.session_state.cache, cache_key=get_cache_key,
+        on_pause=pause_for_geocoder, budget=budget
+    )
+
+def watch_extraction(engine, items, progress_container, bounds, run, describe, sampled=None):
+    """Drive an extraction stream with throttled progress and a live results map.
+    
+    run ({'panel', 'key', 'label', 'density'}) is registered with the results
+    table as the session's active run first: Stop (see render_stop_button)
+    reruns the app, which interrupts this loop, and the panel then recovers
+    what was found so far with take_stopped_run. run['density'] follows the
+    results as they arrive.
+    If the engine's budget ran out, run['coverage'] is set to its (fraction
+    sampled, estimated total) for the caller to report; run['failed'] is the
+    number of points that never resolved. describe(item) returns the
+    (fraction, text) progress. sampled, if given, receives the (lat, lon,
+    result) of every point processed, result None if nothing was found.
+    """
+    st.session_state.active_run = dict(run, addresses=engine.sink)
+    with progress_container:
+        progress = ProgressReporter()
+        live_map = LiveResultsMap(engine.sink, bounds, run['density'])
+        for item in items:
+            if sampled is not None:
+                sampled.append((item.lat, item.lon, item.result))
+            progress.update(*describe(item))
+            if item.is_new:
+                live_map.update()
+        live_map.update(final=True)
+        run['density'].sync(engine.sink)
+    run['coverage'] = engine.coverage() if engine.stopped_early else None
+    run['failed'] = engine.failed
+    del st.session_state.active_run
+
+@contextmanager
+def profile_extraction(run_id, label):
+    """Profile the enclosed extraction under run_id if profiling is on, listing it in Diagnostics.
+    
+    Profiling is on for every run with PROFILE_EXTRACTIONS set, or for this
+    session's runs with the Diagnostics toggle; yields the RunProfile or None.
+    """
+    enabled = PROFILING_ENABLED or st.session_state.get('profile_extractions', False)
+    with profile_run(run_id, enabled) as profile:
+        if profile is not None:
+            # Registered first, so a stopped run's profile is listed too
+            st.session_state.profiles.append((label, profile))
+        yield profile
+
+def run_requested(panel, action, clicked):
+    """Whether the extraction behind one of a panel's buttons should start in this script run.
+    
+    A click inside a fragment waits for any running script instead of
+    interrupting it, so a Stop button there could never stop a run. The
+    click therefore only records the request and reruns the whole app; the
+    run then starts in that app run, below the Stop button drawn by
+    render_stop_button outside the panels.
+    """
+    if clicked:
+        st.session_state.requested_run = (panel, action)
+        st.rerun(scope='app')
+    if st.session_state.get('requested_run') != (panel, action):
+        return False
+    del st.session_state.requested_run
+    return True
+
+def render_stop_button(panel):
+    """Draw the Stop button for the run requested in a panel, if any; returns its slot to clear afterwards.
+    
+    Being outside every fragment, its click reruns the whole app, which
+    interrupts the running extraction.
+    """
+    slot = st.empty()
+    requested = st.session_state.get('requested_run')
+    if requested is not None and requested[0] == panel:
+        slot.button("⏹ Stop extraction", key=f"stop-{panel}", help="Stop and keep the addresses found so far")
+    return slot
+
+def take_stopped_run(panel):
+    """Return the active run this panel started if it was stopped before finishing, else None"""
+    run = st.session_state.get('active_run')
+    if run is None or run['panel'] != panel:
+        return None
+    # Reruns interrupt the script, so a run still registered here never finished
+    del st.session_state.active_run
+    return run
+
+def process_grid_addresses(grid_points, progress_container, run, collect_sampled=False):
+    """Process grid points to extract addresses with progress tracking.
+    
+    run identifies the extraction for watch_extraction. With collect_sampled,
+    also return the engine and the (lat, lon, result) of every point
+    processed, for joining results back to several polygons. Under a budget
+    the points are visited coarse-to-fine, so stopping early still covers
+    the whole area.
+    """
+    st.session_state.request_count += 1
+    st.session_state.last_request_time = datetime.now()
+    
+    budget = create_budget()
+    if budget is not None:
+        grid_points = stratified_order(grid_points)
+    engine = create_engine(budget)
+    sampled = [] if collect_sampled else None
+    lats = [lat for lat, _ in grid_points]
+    lons = [lon for _, lon in grid_points]
+    bounds = (min(lons), min(lats), max(lons), max(lats)) if grid_points else (0, 0, 0, 0)
+    watch_extraction(
+        engine, engine.stream([grid_points]), progress_container, bounds, run,
+        lambda item: ((item.index + 1) / item.batch_size, f"Processed {item.index + 1}/{item.batch_size} points"),
+        sampled
+    )
+    
+    if collect_sampled:
+        return engine.sink, engine, sampled
+    return engine.sink
+
+def process_tiled_polygon_addresses(polygon, grid_size, tiles, progress_container, run, collect_sampled=False):
+    """Stream tile grids from the process pool through geocoding, deduplicating across tiles.
+    
+    run and collect_sampled work as in process_grid_addresses.
+    """
+    st.session_state.request_count += 1
+    st.session_state.last_request_time = datetime.now()
+    
+    # Tiles arrive as their grids finish; geocoding starts on the first one
+    # while the pool keeps generating the rest. A budgeted run waits for every
+    # tile instead and visits the whole grid coarse-to-fine as one batch
+    budget = create_budget()
+    sampler = tiled_sampler(
+        grid_size, MAX_POINTS, max_workers=TILE_WORKERS, tiles=tiles, stratified=budget is not None
+    )
+    engine = create_engine(budget)
+    sampled = [] if collect_sampled else None
+    if budget is not None:
+        describe = lambda item: ((item.index + 1) / item.batch_size, f"Processed {item.index + 1}/{item.batch_size} points")
+    else:
+        describe = lambda item: (
+            (item.batch + (item.index + 1) / item.batch_size) / len(tiles),
+            f"Tile {item.batch + 1}/{len(tiles)}: processed {item.index + 1}/{item.batch_size} points"
+        )
+    watch_extraction(
+        engine, engine.run(sampler, polygon), progress_container, polygon.bounds, run, describe, sampled
+    )
+    
+    if collect_sampled:
+        return engine.sink, engine, sampled
+    return engine.sink
+
+@st.cache_resource
+def get_search_cache():
+    """Location search results shared by every session, keyed by normalized query"""
+    return GeocodeCache(CACHE_DURATION.total_seconds(), SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_MAX_BYTES)
+
+def search_location_cached(query):
+    """Forward geocode a query from the shared cache, or through the shared rate limiter"""
+    key = get_query_key(query)
+    location = get_search_cache().get(key)
+    if location is None:
+        fetch = make_forward_geocoder(get_geolocator())
+        location = geocode_with_retry(lambda: fetch(query), get_rate_limiter(), breaker=get_circuit_breaker())
+        if location:
+            get_search_cache().set(key, location)
+    return location
+
+def remember_search(query_key, location):
+    """Put a search at the front of this session's recent-searches index"""
+    recent = st.session_state.recent_searches
+    recent.pop(query_key, None)
+    recent[query_key] = location
+    while len(recent) > RECENT_SEARCHES:
+        recent.pop(next(iter(recent)))
+
+def show_search_result(location):
+    """Center the map on a search result"""
+    st.session_state.map_location = [location.latitude, location.longitude]
+    st.session_state.map_zoom = 15
+    st.success(f"Found: {location.address}")
+    st.rerun()
+
+def geocode_point(lat, lon):
+    """Reverse geocode a point on the fastest healthy backend, with retries under its rate limit and breaker"""
+    return get_backend_pool().reverse(lat, lon)
+
+def prefetch_point(lat, lon):
+    """Reverse geocode a point like geocode_point, but only in slots no extraction is waiting for"""
+    return get_backend_pool().reverse(lat, lon, background=True)
+
+def schedule_prefetch(polygons, grid_size):
+    """Queue the grid points of every parsed polygon for background cache warming"""
+    for job in st.session_state.prefetch_jobs:
+        job.cancel()
+    
+    jobs = []
+    for polygon_record in polygons:
+        polygon = build_polygon_geometry(polygon_record)
+        # Only warm what an analysis would accept, so prefetch never exceeds its limits
+        is_valid_size, _ = check_polygon_size(polygon)
+        if not is_valid_size:
+            continue
+        grid_points = sample_points(polygon, grid_size)
+        if not check_points_limit(grid_points)[0]:
+            continue
+        jobs.append(get_prefetcher().submit(
+            polygon_record['name'], grid_points, st.session_state.cache,
+            prefetch_point, get_cache_key
+        ))
+    st.session_state.prefetch_jobs = jobs
+
+def render_prefetch_progress():
+    """Show per-polygon prefetch progress"""
+    jobs = st.session_state.prefetch_jobs
+    for job in jobs:
+        fraction = job.done / job.total if job.total else 1.0
+        state = "cancelled" if job.cancelled else f"{job.done}/{job.total} points"
+        if job.paused:
+            state += " (paused, geocoder unavailable)"
+        st.progress(fraction, text=f"{job.name}: {state}")
+    skipped = len(list_kml_polygons(st.session_state.kml_hash)) - len(jobs)
+    if skipped:
+        st.caption(f"{skipped} polygon(s) exceed the analysis limits and were not prefetched.")
+
+@st.fragment(run_every=2)
+def render_live_prefetch_progress():
+    """Refresh prefetch progress on its own until every job has finished"""
+    render_prefetch_progress()
+    if all(job.finished for job in st.session_state.prefetch_jobs):
+        st.rerun()
 
 # Layout with columns
 col1, col2 = st.columns([2, 1])
@@ -308,48 +765,65 @@ with col1:
     st.subheader("📁 Upload KML File")
     uploaded_file = st.file_uploader("Choose a KML file", type=['kml'])
     
-    if uploaded_file is not None:
-        try:
-            # Read the uploaded file
-            kml_content = uploaded_file.read()
-            
-            # Parse KML
-            polygons = parse_kml_file(kml_content)
-            
-            if polygons:
-                st.session_state.kml_polygons = polygons
-                st.success(f"✅ Successfully loaded {len(polygons)} polygons from KML file")
-                
-                # Show polygon list
-                polygon_names = [f"{p['name']} (ID: {p['id']})" for p in polygons]
-                st.info(f"Polygons loaded: {', '.join(polygon_names[:5])}" + 
-                       (f" and {len(polygon_names)-5} more..." if len(polygon_names) > 5 else ""))
-            else:
-                st.error("No polygons found in the uploaded KML file")
-        except Exception as e:
-            st.error(f"Error processing KML file: {str(e)}")
+    if uploaded_file is not None and st.session_state.kml_file_id != uploaded_file.file_id:
+        # Validate and store only when a different file is uploaded, not on every rerun
+        st.session_state.kml_file_id = uploaded_file.file_id
+        kml_hash = store_kml_file(uploaded_file, uploaded_file.name)
+        if kml_hash:
+            use_stored_kml(kml_hash)
+    
+    # Files stored by any session or pasted into the converter page load without re-parsing
+    stored_kml = {kml_hash: f"{name} ({count} polygons)" for kml_hash, name, count, _ in get_polygon_store().list()}
+    if stored_kml:
+        stored_col, load_col = st.columns([3, 1], vertical_alignment="bottom")
+        chosen_hash = stored_col.selectbox("Stored KML files", list(stored_kml), format_func=stored_kml.get)
+        if load_col.button("Load", key="load_stored_kml") and chosen_hash != st.session_state.kml_hash:
+            use_stored_kml(chosen_hash)
+    
+    if st.session_state.kml_hash:
+        polygons = list_kml_polygons(st.session_state.kml_hash)
+        st.success(f"✅ Successfully loaded {len(polygons)} polygons from KML file")
+        
+        # Show polygon list
+        polygon_names = [f"{name} (ID: {polygon_id})" for polygon_id, name in polygons]
+        st.info(f"Polygons loaded: {', '.join(polygon_names[:5])}" + 
+               (f" and {len(polygon_names)-5} more..." if len(polygon_names) > 5 else ""))
     
     st.divider()
     
     # Location search
     st.subheader("🔍 Search Location")
-    search_location = st.text_input("Search location (e.g., city, address, landmark)", "")
+    with st.form("search_form", border=False):
+        search_location = st.text_input("Search location (e.g., city, address, landmark)", "")
+        search_submitted = st.form_submit_button("Search")
     
-    if st.button("Search", key="search_button"):
-        try:
-            location = geolocator.geocode(search_location)
-            if location:
-                st.session_state.map_location = [location.latitude, location.longitude]
-                st.session_state.map_zoom = 15
-                st.success(f"Found: {location.address}")
-                st.rerun()
-            else:
-                st.error("Location not found. Please try a different search term.")
-        except Exception as e:
-            st.error(f"Error searching location: {str(e)}")
+    if search_submitted and search_location.strip():
+        query_key = get_query_key(search_location)
+        last_key, last_time = st.session_state.last_search
+        # Ignore a repeat submission of the query we just searched
+        if query_key != last_key or time.monotonic() - last_time > SEARCH_DEBOUNCE_SECONDS:
+            st.session_state.last_search = (query_key, time.monotonic())
+            try:
+                location = search_location_cached(search_location)
+                if location:
+                    remember_search(query_key, location)
+                    show_search_result(location)
+                else:
+                    st.error("Location not found. Please try a different search term.")
+            except Exception as e:
+                st.error(f"Error searching location: {str(e)}")
+    
+    # Recent searches jump straight to their stored result, without any lookup
+    if st.session_state.recent_searches:
+        st.caption("Recent searches")
+        recent_columns = st.columns(len(st.session_state.recent_searches))
+        for column, (query_key, location) in zip(recent_columns, reversed(st.session_state.recent_searches.items())):
+            if column.button(query_key[2:], key=f"recent-{query_key}", help=location.address):
+                remember_search(query_key, location)
+                show_search_result(location)
 
 # Map creation and display
-def create_base_map(location, zoom_start, kml_polygons=None):
+def create_base_map(location, zoom_start, results=None):
     m = folium.Map(location=location, zoom_start=zoom_start)
     folium.TileLayer('openstreetmap', name='OpenStreetMap').add_to(m)
     folium.TileLayer(
@@ -358,26 +832,11 @@ def create_base_map(location, zoom_start, kml_polygons=None):
         name="Satellite"
     ).add_to(m)
     
-    # Add KML polygons if provided
-    if kml_polygons:
-        for polygon in kml_polygons:
-            # Convert coordinates to folium format (lat, lon)
-            folium_coords = [[coord[1], coord[0]] for coord in polygon['coordinates']]
-            
-            # Create polygon with click functionality
-            folium.Polygon(
-                locations=folium_coords,
-                color='red',
-                weight=2,
-                fill=True,
-                fillColor='yellow',
-                fillOpacity=0.3,
-                popup=folium.Popup(
-                    f"<b>{polygon['name']}</b><br>Click 'Analyze KML Polygon' to count houses",
-                    max_width=300
-                ),
-                tooltip=f"KML Polygon: {polygon['name']}"
-            ).add_to(m)
+    # Addresses found by earlier analyses, clustered in the browser
+    for result in (results or []):
+        if result['addresses']:
+            add_density_layer(m, get_density(result), name=f"Households per cell: {result['polygon_name']}")
+            add_results_layer(m, result['addresses'], name=f"Addresses: {result['polygon_name']}")
     
     draw = folium.plugins.Draw(
         export=True,
@@ -394,203 +853,677 @@ def create_base_map(location, zoom_start, kml_polygons=None):
     folium.LayerControl().add_to(m)
     return m
 
-with col1:
-    # Display the map with KML polygons
-    m = create_base_map(
-        st.session_state.map_location, 
-        st.session_state.map_zoom, 
-        st.session_state.kml_polygons if st.session_state.kml_polygons else None
+@st.cache_resource(max_entries=32)
+def get_results_frame(run_id, _addresses):
+    """Build the DataFrame for an analysis run once, instead of on every rerun"""
+    import pandas as pd
+    return pd.DataFrame(_addresses.columns())
+
+@st.cache_resource(max_entries=32)
+def get_results_csv(run_id, _addresses):
+    """Encode the CSV export for an analysis run once, instead of on every rerun"""
+    return get_results_frame(run_id, _addresses).to_csv(index=False).encode('utf-8')
+
+@st.cache_resource(max_entries=32)
+def get_density_csv(run_id, shape, cell_size, _density):
+    """Encode the households-per-cell CSV export for an analysis run once"""
+    import pandas as pd
+    frame = pd.DataFrame(_density.rows(), columns=['Cell', 'Latitude', 'Longitude', 'Households'])
+    return frame.to_csv(index=False).encode('utf-8')
+
+@st.cache_resource(max_entries=32)
+def get_density_geojson(run_id, shape, cell_size, _density):
+    """Encode the households-per-cell GeoJSON export for an analysis run once"""
+    return json.dumps(_density.to_geojson()).encode('utf-8')
+
+def render_density_summary(result, key):
+    """Households-per-cell summary and exports of one analysis result"""
+    density = get_density(result)
+    if not density.counts:
+        return
+    busiest = max(density.counts.values())
+    st.caption(
+        f"Households per {density.cell_size} m {density.shape} cell: {len(density)} cells, "
+        f"busiest {busiest}, average {density.total / len(density):.1f}"
+    )
+    export_args = (result['run_id'], density.shape, density.cell_size, density)
+    csv_col, geojson_col = st.columns(2)
+    csv_col.download_button(
+        "⬇️ Density (CSV)", get_density_csv(*export_args),
+        "households_per_cell.csv", "text/csv", key=f'density-csv-{key}'
+    )
+    geojson_col.download_button(
+        "⬇️ Density (GeoJSON)", get_density_geojson(*export_args),
+        "households_per_cell.geojson", "application/geo+json", key=f'density-geojson-{key}'
     )
-    output = st_folium(m, width='100%', height=700)
 
-# Rest of the functionality in the second column
-with col2:
-    # Configuration options in a cleaner layout
-    st.subheader("Settings")
+def create_kml_layer(polygons):
+    """Layer drawing KML polygon records, holes unfilled"""
+    layer = folium.FeatureGroup(name="KML polygons")
+    for polygon in polygons:
+        for part in polygon['parts']:
+            # Convert coordinates to folium format (lat, lon); the outer ring is
+            # followed by the holes so excluded areas are drawn unfilled
+            folium_coords = [ring[:, ::-1].tolist() for ring in [part['coordinates']] + part['holes']]
+            
+            # Create polygon with click functionality
+            folium.Polygon(
+                locations=folium_coords,
+                color='red',
+                weight=2,
+                fill=True,
+                fillColor='yellow',
+                fillOpacity=0.3,
+                popup=folium.Popup(
+                    f"<b>{polygon['name']}</b><br>Click 'Analyze KML Polygon' to count houses",
+                    max_width=300
+                ),
+                tooltip=f"KML Polygon: {polygon['name']}"
+            ).add_to(layer)
+    return layer
+
+def get_kml_layer():
+    """Layer of the session KML's polygons in the map viewport, rebuilt only when that set changes.
     
-    # Format the grid density value to show 5 decimal places
-    grid_size = st.slider(
-        "Grid Density (meters)",
-        min_value=0.00005,
-        max_value=0.001,
-        value=0.0002,
-        step=0.00001,
-        format="%.5f"
+    The polygons are queried from the catalog's spatial index, so a session
+    never holds a whole large KML; returns (layer or None, number of polygons drawn).
+    """
+    if not st.session_state.kml_hash:
+        return None, 0
+    polygons = get_polygon_store().query(st.session_state.kml_hash, get_map_viewport(), limit=MAX_MAP_POLYGONS)
+    key = (st.session_state.kml_hash, tuple(polygon['id'] for polygon in polygons))
+    cached = st.session_state.get('kml_layer')
+    if cached is None or cached[0] != key:
+        cached = (key, create_kml_layer(polygons) if polygons else None)
+        st.session_state.kml_layer = cached
+    return cached[1], len(polygons)
+
+def get_base_map(location, zoom_start, results=None):
+    """Reuse this session's map until its view or analysis results change"""
+    key = (
+        tuple(location), zoom_start,
+        tuple(result['run_id'] for result in (results or [])),
+        st.session_state.get('density_shape'), st.session_state.get('density_cell_size')
     )
-    st.caption("Smaller value = more precise but slower")
+    cached = st.session_state.get('base_map')
+    if cached is None or cached[0] != key:
+        cached = (key, create_base_map(location, zoom_start, results))
+        st.session_state.base_map = cached
+    return cached[1]
+
+@st.fragment
+def render_kml_panel(grid_size, tiled_mode):
+    """Analyze KML polygons and list their results.
     
-    st.divider()
+    Runs as a fragment so its buttons rerun only this panel, not the map.
+    """
+    st.subheader("🏠 KML Polygon Analysis")
     
-    # KML Polygon Analysis Section
-    if st.session_state.kml_polygons:
-        st.subheader("🏠 KML Polygon Analysis")
-        
-        # Select polygon to analyze
-        polygon_options = {f"{p['name']} (ID: {p['id']})": p for p in st.session_state.kml_polygons}
-        selected_polygon_display = st.selectbox(
-            "Select polygon to analyze:",
-            options=list(polygon_options.keys()),
-            key="polygon_selector"
-        )
-        
-        if st.button("Analyze KML Polygon", type="primary", key="analyze_kml"):
-            selected_polygon = polygon_options[selected_polygon_display]
-            polygon_id = selected_polygon['id']
+    # A stopped run keeps what it found, listed with the other results
+    stopped = take_stopped_run('kml')
+    if stopped is not None:
+        st.warning(f"Extraction stopped: {len(stopped['addresses'])} addresses found in {stopped['label']} before stopping")
+        st.session_state.selected_polygon_results[stopped['key']] = {
+            'run_id': uuid.uuid4().hex,
+            'polygon_name': f"{stopped['label']} (stopped)",
+            'addresses': stopped['addresses'],
+            'house_count': len(stopped['addresses']),
+            'density': stopped['density']
+        }
+    
+    # Select polygon to analyze
+    # Only ids and names are listed; a polygon's geometry is loaded when it is analyzed
+    kml_hash = st.session_state.kml_hash
+    polygon_options = {f"{name} (ID: {polygon_id})": polygon_id for polygon_id, name in list_kml_polygons(kml_hash)}
+    selected_polygon_display = st.selectbox(
+        "Select polygon to analyze:",
+        options=list(polygon_options.keys()),
+        key="polygon_selector"
+    )
+    
+    if run_requested('kml', 'analyze', st.button("Analyze KML Polygon", type="primary", key="analyze_kml")):
+        run_id = uuid.uuid4().hex
+        with profile_extraction(run_id, "KML polygon") as profile:
+            polygon_id = polygon_options[selected_polygon_display]
+            selected_polygon = load_kml_polygon(kml_hash, polygon_id)
+            
+            polygon = build_polygon_geometry(selected_polygon)
+            analysis_key = get_analysis_key(polygon, grid_size)
+            stored = load_stored_result(analysis_key)
             
-            # Extract addresses from the selected polygon
-            grid_points, error = extract_addresses_from_polygon(selected_polygon['coordinates'], grid_size)
+            # Extract addresses from the selected polygon, unless an identical analysis is stored
+            if stored is not None:
+                error = None
+            elif tiled_mode:
+                tiles, error = prepare_tiled_job(polygon, grid_size)
+            else:
+                grid_points, error = extract_addresses_from_polygon(polygon, grid_size)
             
             if error:
                 st.error(error)
+            elif stored is not None:
+                addresses, created = stored
+                st.session_state.selected_polygon_results[polygon_id] = {
+                    'run_id': run_id,
+                    'polygon_name': selected_polygon['name'],
+                    'addresses': addresses,
+                    'house_count': len(addresses),
+                    'stored_at': created
+                }
+                st.success(
+                    f"🏠 **{len(addresses)} houses found** in {selected_polygon['name']} "
+                    f"(stored result from {format_age(created)} ago; tick Force refresh to re-run)"
+                )
             else:
-                st.info(f"Processing {len(grid_points)} points in {selected_polygon['name']}...")
-                
                 # Create progress container
                 progress_container = st.container()
+                run = {'panel': 'kml', 'key': polygon_id, 'label': selected_polygon['name'], 'density': create_density_grid()}
                 
                 # Process addresses
-                addresses = process_kml_polygon_addresses(grid_points, progress_container)
+                if tiled_mode:
+                    st.info(f"Processing {len(tiles)} tiles in {selected_polygon['name']}...")
+                    addresses = process_tiled_polygon_addresses(polygon, grid_size, tiles, progress_container, run)
+                else:
+                    st.info(f"Processing {len(grid_points)} points in {selected_polygon['name']}...")
+                    addresses = process_grid_addresses(grid_points, progress_container, run)
                 
                 # Store results
                 st.session_state.selected_polygon_results[polygon_id] = {
+                    'run_id': run_id,
                     'polygon_name': selected_polygon['name'],
                     'addresses': addresses,
-                    'house_count': len(addresses)
+                    'house_count': len(addresses),
+                    'density': run['density'],
+                    'coverage': run['coverage'],
+                    'failed': run['failed']
                 }
+                # Only complete runs are shared; budgeted runs that stopped early and
+                # runs with points lost to geocoder errors are not
+                if run['coverage'] is None and not run['failed'] and analysis_key is not None:
+                    get_result_store().put(analysis_key, selected_polygon['name'], addresses)
                 
                 # Clear progress container
                 progress_container.empty()
                 
+                if run['coverage']:
+                    st.info(describe_coverage(run['coverage']))
                 if addresses:
-                    st.success(f"🏠 **{len(addresses)} houses found** in {selected_polygon['name']}")
+                    st.success(f"🏠 **{len(addresses)} houses found** in {selected_polygon['name']}{describe_failed(run['failed'])}")
                 else:
-                    st.warning("No addresses found in this polygon")
-        
-        # Display results for previously analyzed polygons
-        st.divider()
-        st.subheader("📊 Analysis Results")
-        
-        if st.session_state.selected_polygon_results:
-            for polygon_id, result in st.session_state.selected_polygon_results.items():
-                with st.expander(f"🏠 {result['polygon_name']} - {result['house_count']} houses"):
-                    if result['addresses']:
-                        df = pd.DataFrame(result['addresses'])
-                        st.dataframe(df, height=300)
-                        
-                        # Download button
-                        csv = df.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            f"⬇️ Download {result['polygon_name']} Results",
-                            csv,
-                            f"{result['polygon_name']}_addresses.csv",
-                            "text/csv",
-                            key=f'download-{polygon_id}'
-                        )
-                    else:
-                        st.info("No addresses found")
-        else:
-            st.info("No polygon analysis results yet. Select and analyze a KML polygon above.")
+                    st.warning(f"No addresses found in this polygon{describe_failed(run['failed'])}")
+            
+            if profile is not None and not error:
+                # The results list builds the table and CSV on display; build them here so the profile covers them
+                get_results_csv(run_id, addresses)
     
-    st.divider()
+    # Overlapping polygons: sample their union once and attribute addresses back
+    st.markdown("**Analyze several polygons together**")
+    union_selection = st.multiselect(
+        "Polygons to analyze together (overlaps are sampled once):",
+        options=list(polygon_options.keys()),
+        key="union_selector"
+    )
     
-    # Process drawn polygon (existing functionality)
-    st.subheader("✏️ Draw Polygon Analysis")
-    if output is not None and 'all_drawings' in output and output['all_drawings']:
-        try:
-            clear_expired_cache()
+    if run_requested('kml', 'union', st.button("Analyze Selected Together", key="analyze_union", disabled=len(union_selection) < 2)):
+        run_id = uuid.uuid4().hex
+        with profile_extraction(run_id, "Polygon union") as profile:
+            selected_polygons = [load_kml_polygon(kml_hash, polygon_options[display]) for display in union_selection]
+            geometries = [build_polygon_geometry(p) for p in selected_polygons]
+            union = unary_union(geometries)
             
-            drawn_shape = output['all_drawings'][0]
+            if tiled_mode:
+                tiles, error = prepare_tiled_job(union, grid_size)
+            else:
+                grid_points, error = extract_addresses_from_polygon(union, grid_size)
             
-            if drawn_shape['geometry']['type'] not in ['Polygon', 'Rectangle']:
-                st.error("Please draw a polygon or rectangle on the map.")
-                st.stop()
+            if error:
+                st.error(error)
+            else:
+                progress_container = st.container()
+                run = {
+                    'panel': 'kml',
+                    'key': 'union-' + '-'.join(p['id'] for p in selected_polygons),
+                    'label': ", ".join(p['name'] for p in selected_polygons),
+                    'density': create_density_grid()
+                }
+                if tiled_mode:
+                    st.info(f"Processing the union of {len(selected_polygons)} polygons in {len(tiles)} tiles...")
+                    addresses, engine, sampled = process_tiled_polygon_addresses(
+                        union, grid_size, tiles, progress_container, run, collect_sampled=True
+                    )
+                else:
+                    st.info(f"Processing {len(grid_points)} points covering {len(selected_polygons)} polygons...")
+                    addresses, engine, sampled = process_grid_addresses(
+                        grid_points, progress_container, run, collect_sampled=True
+                    )
+                progress_container.empty()
+                
+                # Spatial join of every point that found an address back to the polygons containing it
+                tables = join_points_to_polygons([point for point in sampled if point[2] is not None], geometries)
+                for index, (polygon_record, table) in enumerate(zip(selected_polygons, tables)):
+                    table_run_id = f"{run_id}-{index}"
+                    if profile is not None:
+                        get_results_csv(table_run_id, table)
+                    st.session_state.selected_polygon_results[polygon_record['id']] = {
+                        'run_id': table_run_id,
+                        'polygon_name': polygon_record['name'],
+                        'addresses': table,
+                        'house_count': len(table),
+                        'failed': run['failed'],
+                        # A budgeted union run covers every polygon in the same proportion
+                        'coverage': run['coverage'] and (
+                            run['coverage'][0],
+                            round(run['coverage'][1] * len(table) / max(len(addresses), 1))
+                        )
+                    }
                 
-            polygon_coords = drawn_shape['geometry']['coordinates'][0]
-            polygon = Polygon([(coord[0], coord[1]) for coord in polygon_coords])
+                if run['coverage']:
+                    st.info(describe_coverage(run['coverage']))
+                st.success(
+                    f"🏠 **{len(addresses)} houses found** across {len(selected_polygons)} polygons: "
+                    + ", ".join(f"{p['name']} {len(t)}" for p, t in zip(selected_polygons, tables))
+                    + describe_failed(run['failed'])
+                )
+                # Every sampled point inside k of the polygons would be looked up k times separately
+                repeated = repeated_lookups(sampled, geometries)
+                overlap = (
+                    f"{repeated} lookups saved where the polygons overlap" if repeated
+                    else "the polygons do not overlap, so none were saved"
+                )
+                st.caption(
+                    f"{engine.processed} points sampled once with {engine.geocoder_calls} geocoder calls "
+                    f"({engine.cache_hits} answered from cache); {overlap}"
+                )
+    
+    # Display results for previously analyzed polygons
+    st.divider()
+    st.subheader("📊 Analysis Results")
+    
+    if st.session_state.selected_polygon_results:
+        for polygon_id, result in st.session_state.selected_polygon_results.items():
+            coverage = result.get('coverage')
+            estimate = f" ({coverage[0]:.0%} sampled, ~{coverage[1]} estimated)" if coverage else ""
+            if result.get('stored_at'):
+                estimate += f" (stored {format_age(result['stored_at'])} ago)"
+            estimate += describe_failed(result.get('failed'))
+            with st.expander(f"🏠 {result['polygon_name']} - {result['house_count']} houses{estimate}"):
+                if result['addresses']:
+                    st.dataframe(get_results_frame(result['run_id'], result['addresses']), height=300)
+                    
+                    # Download button
+                    st.download_button(
+                        f"⬇️ Download {result['polygon_name']} Results",
+                        get_results_csv(result['run_id'], result['addresses']),
+                        f"{result['polygon_name']}_addresses.csv",
+                        "text/csv",
+                        key=f'download-{polygon_id}'
+                    )
+                    render_density_summary(result, key=polygon_id)
+                else:
+                    st.info("No addresses found")
+    else:
+        st.info("No polygon analysis results yet. Select and analyze a KML polygon above.")
+
+@st.fragment
+def render_draw_panel(output, grid_size, tiled_mode):
+    """Validate the drawn shape and run address extraction for it.
+    
+    Runs as a fragment so its buttons rerun only this panel, not the map.
+    """
+    if not (output is not None and 'all_drawings' in output and output['all_drawings']):
+        st.info("Draw a polygon or rectangle on the map to begin.")
+        return
+    
+    stopped = take_stopped_run('draw')
+    if stopped is not None and stopped['addresses']:
+        st.warning(f"Extraction stopped: {len(stopped['addresses'])} addresses found before stopping")
+        st.download_button(
+            "⬇️ Download Partial Results (CSV)",
+            get_results_csv(uuid.uuid4().hex, stopped['addresses']),
+            "addresses_partial.csv",
+            "text/csv",
+            key='download-partial-csv'
+        )
+    
+    try:
+        drawn_shape = output['all_drawings'][0]
+        
+        if drawn_shape['geometry']['type'] not in ['Polygon', 'Rectangle']:
+            st.error("Please draw a polygon or rectangle on the map.")
+            return
             
+        polygon_coords = drawn_shape['geometry']['coordinates'][0]
+        polygon = Polygon([(coord[0], coord[1]) for coord in polygon_coords])
+        
+        if tiled_mode:
+            tiles, error = prepare_tiled_job(polygon, grid_size)
+            if error:
+                st.error(error)
+                return
+        else:
             is_valid_size, area = check_polygon_size(polygon)
             if not is_valid_size:
                 st.error(f"Selected area is too large ({area:.2f} km²). Please select an area smaller than {MAX_AREA} km².")
-                st.stop()
+                return
 
-            min_x, min_y, max_x, max_y = polygon.bounds
-            x_points = np.arange(min_x, max_x, grid_size)
-            y_points = np.arange(min_y, max_y, grid_size)
-            
-            grid_points = []
-            for y in y_points:
-                for x in x_points:
-                    if Point(x, y).within(polygon):
-                        grid_points.append((y, x))
+            grid_points = sample_points(polygon, grid_size)
             
             is_valid_points, point_count = check_points_limit(grid_points)
             if not is_valid_points:
                 st.error(f"Too many points ({point_count}). Please select a smaller area or increase grid size.")
-                st.stop()
+                return
             
             if not check_rate_limit():
                 remaining_time = COOLDOWN_MINUTES - (datetime.now() - st.session_state.last_request_time).total_seconds() / 60
                 st.error(f"Rate limit exceeded. Please wait {remaining_time:.1f} minutes before trying again.")
-                st.stop()
-            
-            st.success("Area successfully defined!")
+                return
+        
+        st.success("Area successfully defined!" + (f" ({len(tiles)} tiles)" if tiled_mode else ""))
 
-            if st.button("Extract Addresses", type="primary"):
-                st.session_state.request_count += 1
-                st.session_state.last_request_time = datetime.now()
-                
+        if run_requested('draw', 'extract', st.button("Extract Addresses", type="primary")):
+            run_id = uuid.uuid4().hex
+            with profile_extraction(run_id, "Drawn area"):
                 progress_container = st.container()
+                run = {
+                    'panel': 'draw', 'key': 'drawn', 'label': "the drawn area", 'density': create_density_grid(),
+                    'coverage': None, 'failed': 0
+                }
+                analysis_key = get_analysis_key(polygon, grid_size)
+                stored = load_stored_result(analysis_key)
+                
+                if stored is not None:
+                    addresses, created = stored
+                    progress_container.info(
+                        f"Stored result from {format_age(created)} ago for this exact area; tick Force refresh to re-run"
+                    )
+                else:
+                    if tiled_mode:
+                        addresses = process_tiled_polygon_addresses(polygon, grid_size, tiles, progress_container, run)
+                    else:
+                        addresses = process_grid_addresses(grid_points, progress_container, run)
+                    if run['coverage'] is None and not run['failed'] and analysis_key is not None:
+                        get_result_store().put(analysis_key, "Drawn area", addresses)
+                
                 with progress_container:
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    addresses = []
-                    seen_addresses = set()
-                    
-                    for idx, (lat, lon) in enumerate(grid_points):
-                        try:
-                            location = reverse_geocode_with_retry(lat, lon)
-                            
-                            if location and location.address not in seen_addresses:
-                                seen_addresses.add(location.address)
-                                address_info = location.raw['address']
-                                addresses.append({
-                                    'Latitude': lat,
-                                    'Longitude': lon,
-                                    'Address': location.address,
-                                    'Postal Code': address_info.get('postcode', ''),
-                                    'City': address_info.get('city', ''),
-                                    'State': address_info.get('state', ''),
-                                    'Country': address_info.get('country', '')
-                                })
-                            
-                            progress = (idx + 1) / len(grid_points)
-                            progress_bar.progress(progress)
-                            status_text.text(f"Processed {idx + 1}/{len(grid_points)} points")
-                            
-                        except Exception as e:
-                            continue
-                    
+                    if run['coverage']:
+                        st.info(describe_coverage(run['coverage']))
                     if addresses:
-                        df = pd.DataFrame(addresses)
-                        st.success(f"✅ Found {len(addresses)} unique addresses")
+                        st.success(f"✅ Found {len(addresses)} unique addresses{describe_failed(run['failed'])}")
                         
-                        tab1, tab2 = st.tabs(["Preview", "Download"])
+                        tab1, tab2, tab3 = st.tabs(["Preview", "Download", "Density"])
                         with tab1:
-                            st.dataframe(df, height=400)
+                            st.dataframe(get_results_frame(run_id, addresses), height=400)
                         with tab2:
-                            csv = df.to_csv(index=False).encode('utf-8')
                             st.download_button(
                                 "⬇️ Download Results (CSV)",
-                                csv,
+                                get_results_csv(run_id, addresses),
                                 "addresses.csv",
                                 "text/csv",
                                 key='download-csv'
                             )
+                        with tab3:
+                            render_density_summary({'run_id': run_id, 'addresses': addresses, 'density': run['density']}, key='drawn')
                     else:
-                        st.warning("No addresses found in the selected area.")
-                        
-        except Exception as e:
-            st.error(f"An error occurred: {str(e)}")
-    else:
-        st.info("Draw a polygon or rectangle on the map to begin.")
+                        st.warning(f"No addresses found in the selected area{describe_failed(run['failed'])}.")
+                    
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
+with col1:
+    # Display the map; KML polygons in view are a layer updated without redrawing the map
+    m = get_base_map(
+        st.session_state.map_location, 
+        st.session_state.map_zoom, 
+        list(st.session_state.selected_polygon_results.values())
+    )
+    kml_layer, kml_shown = get_kml_layer()
+    output = st_folium(m, width='100%', height=700, key=MAP_KEY, feature_group_to_add=kml_layer)
+    if kml_shown >= MAX_MAP_POLYGONS:
+        st.caption(f"Showing the first {MAX_MAP_POLYGONS} KML polygons in view; zoom in to see the rest.")
+
+# Rest of the functionality in the second column
+with col2:
+    # Configuration options in a cleaner layout
+    st.subheader("Settings")
+    
+    # Format the grid density value to show 5 decimal places
+    grid_size = st.slider(
+        "Grid Density (meters)",
+        min_value=0.00005,
+        max_value=0.001,
+        value=0.0002,
+        step=0.00001,
+        format="%.5f"
+    )
+    st.caption("Smaller value = more precise but slower")
+    
+    prefetch_mode = st.checkbox(
+        "Prefetch KML polygons in the background",
+        value=False,
+        help="After upload, geocode the grid points of every polygon at low priority so later analyses come mostly from cache"
+    )
+    
+    budget_col1, budget_col2 = st.columns(2)
+    budget_col1.number_input(
+        "Time budget (min)",
+        min_value=0.0,
+        value=0.0,
+        step=1.0,
+        key="budget_minutes",
+        help="Stop extractions after this long, 0 for no limit. Points are then sampled coarse-to-fine so a stopped run still covers the whole area"
+    )
+    budget_col2.number_input(
+        "Request budget",
+        min_value=0,
+        value=0,
+        step=50,
+        key="budget_requests",
+        help="Stop extractions after this many geocoder requests (cache hits are free), 0 for no limit"
+    )
+    
+    density_col1, density_col2 = st.columns(2)
+    density_col1.selectbox(
+        "Density cells",
+        options=['hex', 'square'],
+        format_func={'hex': "Hexagons", 'square': "Squares"}.get,
+        key="density_shape",
+        help="Shape of the cells households are counted in, on the map and in density exports"
+    )
+    density_col2.number_input(
+        "Cell size (m)",
+        min_value=50,
+        max_value=5000,
+        value=DEFAULT_DENSITY_CELL_SIZE,
+        step=50,
+        key="density_cell_size"
+    )
+    
+    st.checkbox(
+        "Force refresh",
+        value=False,
+        key="force_refresh",
+        help="Re-run analyses even when an identical one (same area, grid and geocoder) is stored"
+    )
+    
+    if STREETS_OSM_PATH:
+        st.radio(
+            "Sampling",
+            options=['grid', 'streets'],
+            format_func={'grid': "Uniform grid", 'streets': "Along streets"}.get,
+            horizontal=True,
+            key="sampler_mode",
+            help="Along streets places points on both sides of residential streets from the local OSM extract, "
+                 "finding more distinct addresses per geocoder request than the grid"
+        )
+        if street_mode():
+            street_col1, street_col2 = st.columns(2)
+            street_col1.number_input(
+                "Point spacing (m)", min_value=5, max_value=200, value=DEFAULT_STREET_SPACING, step=5, key="street_spacing"
+            )
+            street_col2.number_input(
+                "Street offset (m)", min_value=2, max_value=50, value=DEFAULT_STREET_OFFSET, step=1, key="street_offset"
+            )
+    
+    # Street sampling is already sparse, so it never needs tiling
+    tiled_mode = st.checkbox(
+        "Tiled mode for large areas",
+        value=False,
+        disabled=street_mode(),
+        help=f"Split areas beyond {MAX_AREA} km² / {MAX_POINTS} points into tiles processed in parallel (up to {MAX_TILED_AREA} km²)"
+    ) and not street_mode()
+    
+    # Background cache prefetch, rescheduled whenever the KML or grid changes
+    if prefetch_mode and st.session_state.kml_hash:
+        prefetch_key = (st.session_state.kml_hash, grid_size, get_sampler_name())
+        if st.session_state.prefetch_key != prefetch_key:
+            schedule_prefetch(get_polygon_store().query(st.session_state.kml_hash), grid_size)
+            st.session_state.prefetch_key = prefetch_key
+        
+        st.markdown("**⏳ Prefetch progress**")
+        if all(job.finished for job in st.session_state.prefetch_jobs):
+            render_prefetch_progress()
+        else:
+            render_live_prefetch_progress()
+    elif st.session_state.prefetch_jobs:
+        for job in st.session_state.prefetch_jobs:
+            job.cancel()
+        st.session_state.prefetch_jobs = []
+        st.session_state.prefetch_key = None
+    
+    st.divider()
+    
+    # KML Polygon Analysis Section
+    if st.session_state.kml_hash:
+        kml_stop = render_stop_button('kml')
+        render_kml_panel(grid_size, tiled_mode)
+        kml_stop.empty()
+        
+    st.divider()
+    
+    # Process drawn polygon (existing functionality)
+    st.subheader("✏️ Draw Polygon Analysis")
+    draw_stop = render_stop_button('draw')
+    render_draw_panel(output, grid_size, tiled_mode)
+    draw_stop.empty()
+    # A request its panel did not take up, e.g. because the drawn area became invalid, is dropped
+    st.session_state.pop('requested_run', None)
+    
+    st.divider()
+    
+    # Diagnostics for operators watching per-session resource use
+    with st.expander("🩺 Diagnostics"):
+        st.metric("Geocode cache entries", len(st.session_state.cache))
+        cache = st.session_state.cache
+        st.caption(
+            f"Cache hits {cache.hits}, misses {cache.misses}, "
+            f"expired {cache.expirations}, evicted {cache.evictions} "
+            f"(limit {CACHE_MAX_ENTRIES} entries / {CACHE_MAX_BYTES // (1024 * 1024)} MiB)"
+        )
+        
+        # The expander body runs on every rerun even when collapsed, so the
+        # walks over the cache and the result store only run when asked for
+        if st.button("Measure memory use", key="measure_memory"):
+            cache_bytes, results_bytes = estimate_memory(
+                cache,
+                [result['addresses'] for result in st.session_state.selected_polygon_results.values()]
+            )
+            st.session_state.memory_measurement = (time.time(), cache_bytes, results_bytes, *get_result_store().stats())
+        if st.session_state.get('memory_measurement'):
+            measured, cache_bytes, results_bytes, stored_count, stored_bytes = st.session_state.memory_measurement
+            st.metric("Geocode cache memory", f"{cache_bytes / 1024:.1f} KiB")
+            st.metric("Analysis results memory", f"{results_bytes / 1024:.1f} KiB")
+            st.caption(
+                f"Measured at {datetime.fromtimestamp(measured).strftime('%H:%M:%S')}. Results and interned "
+                f"city/state/country strings shared with the cache are counted once."
+            )
+            st.caption(f"Stored analyses shared by all sessions: {stored_count} ({stored_bytes / 1024:.0f} KiB compressed)")
+        
+        for backend in get_backend_pool().backends:
+            breaker = backend.breaker
+            breaker_state = breaker.state
+            if breaker_state != 'closed':
+                breaker_state += f", next try in {breaker.retry_after():.0f}s"
+            latency = "no requests yet" if backend.latency is None else f"latency {backend.latency * 1000:.0f} ms"
+            st.caption(
+                f"Geocoder {backend.name}{' (fallback)' if backend.fallback else ''}: "
+                f"{backend.requests} requests, {backend.failures} failed, {latency}; "
+                f"circuit breaker {breaker_state}, tripped {breaker.trips} times, "
+                f"{breaker.failures} consecutive failures"
+            )
+        
+        http_stats = get_http_stats()
+        if http_stats.requests:
+            p50, p95 = http_stats.latency_percentiles(0.5, 0.95)
+            st.caption(
+                f"Geocoder HTTP: {http_stats.requests} requests over {http_stats.connections} connections "
+                f"({http_stats.reuse_rate():.0%} reused, pool of {GEOCODER_POOL_SIZE}); "
+                f"latency p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms"
+            )
+        else:
+            st.caption("Geocoder HTTP: no requests yet")
+        
+        # Script timing, to see how much each interaction costs the server
+        st.markdown("**Script run time**")
+        timings = st.session_state.run_timings
+        cold_start = get_cold_start_seconds(_imports_done - _run_started)
+        if timings:
+            totals = [t['total'] for t in timings]
+            st.caption(
+                f"Last run {totals[-1] * 1000:.0f} ms, average {sum(totals) / len(totals) * 1000:.0f} ms "
+                f"over {len(totals)} runs; imports {timings[-1]['imports'] * 1000:.0f} ms "
+                f"(cold start {cold_start * 1000:.0f} ms)"
+            )
+        else:
+            st.caption(f"No completed runs yet (cold start imports {cold_start * 1000:.0f} ms)")
+        
+        # Opt-in profiles of single runs, to investigate reports of slow extractions
+        st.markdown("**Profiling**")
+        st.toggle(
+            "Profile extractions in this session",
+            value=PROFILING_ENABLED,
+            disabled=PROFILING_ENABLED,
+            key='profile_extractions',
+            help="Saves a cProfile file and flame-graph-ready folded stacks for each extraction"
+        )
+        for label, profile in reversed(st.session_state.profiles):
+            if profile.duration is None or not os.path.exists(profile.folded_path):
+                continue
+            started = datetime.fromtimestamp(profile.started).strftime('%H:%M:%S')
+            st.caption(f"{label} at {started}, {profile.duration:.1f}s (run {profile.run_id[:8]})")
+            prof_col, folded_col = st.columns(2)
+            with open(profile.prof_path, 'rb') as f:
+                prof_col.download_button(
+                    "⬇️ cProfile", f.read(), os.path.basename(profile.prof_path),
+                    "application/octet-stream", key=f'profile-prof-{profile.run_id}'
+                )
+            with open(profile.folded_path, 'rb') as f:
+                folded_col.download_button(
+                    "⬇️ Folded stacks", f.read(), os.path.basename(profile.folded_path),
+                    "text/plain", key=f'profile-folded-{profile.run_id}'
+                )
+        
+        # Snapshot export/import to warm caches across instances
+        st.markdown("**Geocode cache snapshot**")
+        if st.button("Prepare cache snapshot", key="prepare_snapshot"):
+            st.session_state.cache_snapshot = export_snapshot(st.session_state.cache)
+        if st.session_state.get('cache_snapshot'):
+            st.download_button(
+                "⬇️ Download cache snapshot",
+                st.session_state.cache_snapshot,
+                f"geocode_cache_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl.gz",
+                "application/gzip",
+                key='download-cache-snapshot'
+            )
+        snapshot_file = st.file_uploader("Merge a cache snapshot", type=['gz'], key="snapshot_uploader")
+        if snapshot_file is not None and st.button("Merge snapshot", key="merge_snapshot"):
+            try:
+                merged, skipped = import_snapshot(st.session_state.cache, read_snapshot(snapshot_file))
+                st.success(f"Merged {merged} entries ({skipped} expired or already newer in cache)")
+            except Exception as e:
+                st.error(f"Error importing snapshot: {str(e)}")
+
+# Record this run's timing for the Diagnostics report
+st.session_state.run_timings.append({
+    'imports': _imports_done - _run_started,
+    'total': time.perf_counter() - _run_started
+})
@@ -0,0 +1,268 @@
+"""Bulk conversion of polygon CSV/GeoJSON files to KML or KMZ.
+
+Features are written one at a time as they are read. CSV and
+newline-delimited GeoJSON are also read one feature at a time, so files
+with any number of polygons convert in constant memory; a GeoJSON
+FeatureCollection is parsed whole first, so convert very large inputs
+from .geojsonl instead (e.g. with `ogr2ogr -f GeoJSONSeq`).
+
+Input formats:
+
+- CSV with columns id, name, coordinates, where coordinates holds one ring
+  as "lon,lat" tuples separated by spaces, newlines or semicolons
+- GeoJSON FeatureCollection (.geojson/.json) with Polygon or MultiPolygon
+  features; holes are kept. Loaded into memory in full
+- Newline-delimited GeoJSON features (.geojsonl/.ndjson), read line by line
+
+Usage:
+
+    python bulk_kml.py parcels.csv parcels.kmz --precision 6
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+KML_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+  <Document>
+    <name>{name}</name>
+'''
+KML_FOOTER = '''  </Document>
+</kml>
+'''
+
+
+class ConversionStats:
+    """Running counts for a conversion, used for throughput reporting"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.features = 0
+        self.vertices = 0
+        self.skipped = 0
+        self.bytes_written = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        rate = self.features / self.elapsed if self.elapsed > 0 else 0.0
+        return (
+            f"{self.features} polygons ({self.vertices} vertices, {self.skipped} skipped), "
+            f"{self.bytes_written / 1024:.0f} KiB in {self.elapsed:.1f}s ({rate:.0f} polygons/s)"
+        )
+
+
+def _close_ring(ring):
+    if ring and ring[0] != ring[-1]:
+        ring = ring + [ring[0]]
+    return ring
+
+
+def _parse_ring_text(text):
+    """Parse "lon,lat lon,lat ..." (spaces, newlines or semicolons between tuples)"""
+    ring = []
+    for coord in text.replace(';', ' ').split():
+        parts = coord.split(',')
+        if len(parts) >= 2:
+            ring.append((float(parts[0]), float(parts[1])))
+    return ring
+
+
+def read_csv_features(text_stream):
+    """Yield (id, name, polygons) from a CSV of id, name, coordinates rows.
+
+    polygons is a list of rings lists (outer ring first), matching what
+    read_geojson_features yields; CSV rows carry a single outer ring. A row
+    whose coordinates do not parse is yielded without polygons, so the
+    writer skips and counts it like a bad GeoJSON feature.
+    """
+    for row in csv.DictReader(text_stream):
+        try:
+            polygons = [[_parse_ring_text(row.get('coordinates') or '')]]
+        except ValueError:
+            polygons = []
+        yield row.get('id') or '', row.get('name') or '', polygons
+
+
+def _geojson_polygons(geometry):
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+
+def _geojson_feature(feature, index):
+    properties = feature.get('properties') or {}
+    feature_id = str(feature.get('id', properties.get('id', index)))
+    name = str(properties.get('name', feature_id))
+    return feature_id, name, _geojson_polygons(feature.get('geometry'))
+
+
+def read_geojson_features(text_stream, line_delimited=False):
+    """Yield (id, name, polygons) from a GeoJSON FeatureCollection or feature lines.
+
+    Feature lines are read one at a time; a FeatureCollection is loaded
+    whole with json.load.
+    """
+    if line_delimited:
+        for index, line in enumerate(text_stream):
+            line = line.strip().lstrip('\x1e')  # tolerate RFC 8142 record separators
+            if line:
+                try:
+                    feature = json.loads(line)
+                except ValueError:
+                    # A broken line is skipped and counted, not fatal
+                    yield str(index), '', []
+                    continue
+                yield _geojson_feature(feature, index)
+        return
+
+    collection = json.load(text_stream)
+    features = collection.get('features', [collection]) if collection.get('type') != 'Feature' else [collection]
+    for index, feature in enumerate(features):
+        yield _geojson_feature(feature, index)
+
+
+class KmlWriter:
+    """Write placemarks to a text stream one at a time"""
+
+    def __init__(self, stream, document_name="Polygons", precision=6, stats=None):
+        self.stream = stream
+        self.precision = precision
+        self.stats = stats if stats is not None else ConversionStats()
+        self._write(KML_HEADER.format(name=escape(document_name)))
+
+    def _write(self, text):
+        self.stream.write(text)
+        self.stats.bytes_written += len(text.encode('utf-8'))
+
+    def _coordinates(self, ring):
+        p = self.precision
+        return ' '.join(f"{lon:.{p}f},{lat:.{p}f},0" for lon, lat, *_ in ring)
+
+    def _polygon(self, rings, indent):
+        outer, holes = rings[0], rings[1:]
+        parts = [
+            f"{indent}<Polygon>\n",
+            f"{indent}  <outerBoundaryIs><LinearRing><coordinates>"
+            f"{self._coordinates(_close_ring(outer))}</coordinates></LinearRing></outerBoundaryIs>\n",
+        ]
+        for hole in holes:
+            parts.append(
+                f"{indent}  <innerBoundaryIs><LinearRing><coordinates>"
+                f"{self._coordinates(_close_ring(hole))}</coordinates></LinearRing></innerBoundaryIs>\n"
+            )
+        parts.append(f"{indent}</Polygon>\n")
+        return ''.join(parts)
+
+    def add(self, feature_id, name, polygons):
+        """Write one placemark; returns False (and counts a skip) if it has no usable ring"""
+        polygons = [
+            [list(ring) for ring in rings] for rings in polygons
+            if rings and len(rings[0]) >= 3
+        ]
+        if not polygons:
+            self.stats.skipped += 1
+            return False
+
+        placemark = [
+            "    <Placemark>\n",
+            f"      <name>{escape(name or feature_id)}</name>\n",
+        ]
+        if feature_id:
+            placemark.append(f"      <ExtendedData><Data name=\"id\"><value>{escape(feature_id)}</value></Data></ExtendedData>\n")
+        if len(polygons) == 1:
+            placemark.append(self._polygon(polygons[0], "      "))
+        else:
+            placemark.append("      <MultiGeometry>\n")
+            placemark.extend(self._polygon(rings, "        ") for rings in polygons)
+            placemark.append("      </MultiGeometry>\n")
+        placemark.append("    </Placemark>\n")
+        self._write(''.join(placemark))
+        self.stats.features += 1
+        # Counted once the placemark is written, so skipped features add no vertices
+        self.stats.vertices += sum(len(_close_ring(ring)) for rings in polygons for ring in rings)
+        return True
+
+    def close(self):
+        self._write(KML_FOOTER)
+
+
+def convert(features, output, kmz=False, document_name="Polygons", precision=6, progress=None, progress_every=1000):
+    """Stream features into a KML or KMZ written to the binary file object output.
+
+    progress, if given, is called with the ConversionStats every
+    progress_every polygons. Returns the final ConversionStats.
+    """
+    stats = ConversionStats()
+
+    def write_all(text_stream):
+        writer = KmlWriter(text_stream, document_name, precision, stats)
+        for feature_id, name, polygons in features:
+            try:
+                writer.add(feature_id, name, polygons)
+            except (ValueError, TypeError, IndexError):
+                stats.skipped += 1
+            if progress and (stats.features + stats.skipped) % progress_every == 0:
+                progress(stats)
+        writer.close()
+
+    if kmz:
+        with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open('doc.kml', 'w') as entry:
+                with io.TextIOWrapper(entry, encoding='utf-8') as text_stream:
+                    write_all(text_stream)
+    else:
+        text_stream = io.TextIOWrapper(output, encoding='utf-8', write_through=True)
+        write_all(text_stream)
+        text_stream.detach()
+    return stats
+
+
+def open_features(path_or_name, text_stream):
+    """Pick the reader for an input file from its extension"""
+    lower = path_or_name.lower()
+    if lower.endswith('.csv'):
+        return read_csv_features(text_stream)
+    if lower.endswith(('.geojsonl', '.geojsons', '.ndjson', '.jsonl')):
+        return read_geojson_features(text_stream, line_delimited=True)
+    if lower.endswith(('.geojson', '.json')):
+        return read_geojson_features(text_stream)
+    raise ValueError(f"Unsupported input format: {path_or_name}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert polygon CSV/GeoJSON files to KML or KMZ")
+    parser.add_argument(
+        'input',
+        help="CSV (id,name,coordinates), GeoJSON or newline-delimited GeoJSON; CSV and .geojsonl/.ndjson "
+             "stream in constant memory, a GeoJSON FeatureCollection is loaded whole"
+    )
+    parser.add_argument('output', help="Output .kml or .kmz file")
+    parser.add_argument('--precision', type=int, default=6, help="Decimal places kept for coordinates")
+    parser.add_argument('--name', default="Polygons", help="KML document name")
+    args = parser.parse_args(argv)
+
+    report = lambda stats: print(stats.summary(), file=sys.stderr)
+    with open(args.input, newline='', encoding='utf-8') as source, open(args.output, 'wb') as target:
+        stats = convert(
+            open_features(args.input, source), target,
+            kmz=args.output.lower().endswith('.kmz'),
+            document_name=args.name, precision=args.precision, progress=report
+        )
+    print(stats.summary(), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,10 @@
+import io
+import tempfile
+
 import streamlit as st
 
+from bulk_kml import convert, open_features
+
 st.title("Create KML from Coordinates")
 
 st.write("Enter your polygon coordinates (longitude, latitude pairs):")
@@ -58,4 +63,40 @@ if st.button("Generate KML"):
         else:
             st.error("Need at least 3 coordinate pairs for a polygon")
     else:
-        st.warning("Please enter coordinates")
\ No newline at end of file
+        st.warning("Please enter coordinates")
+
+st.divider()
+st.subheader("Bulk Conversion")
+st.write(
+    "Convert a CSV (columns id, name, coordinates as space-separated longitude,latitude pairs), "
+    "a GeoJSON file or newline-delimited GeoJSON with many polygons in one go."
+)
+
+bulk_file = st.file_uploader("Polygon file:", type=['csv', 'geojson', 'json', 'geojsonl', 'ndjson'])
+bulk_format = st.radio("Output format:", ["KMZ", "KML"], horizontal=True)
+precision = st.slider("Coordinate decimal places:", min_value=3, max_value=10, value=6)
+
+if bulk_file is not None and st.button("Convert File"):
+    progress_text = st.empty()
+    report = lambda stats: progress_text.text(stats.summary())
+    output = tempfile.TemporaryFile()
+    try:
+        source = io.TextIOWrapper(bulk_file, encoding='utf-8', newline='')
+        stats = convert(
+            open_features(bulk_file.name, source), output,
+            kmz=bulk_format == "KMZ", document_name=bulk_file.name.rsplit('.', 1)[0],
+            precision=precision, progress=report
+        )
+    except (ValueError, KeyError) as e:
+        st.error(f"Could not convert file: {str(e)}")
+    else:
+        progress_text.empty()
+        st.success(f"Converted {stats.summary()}")
+        output.seek(0)
+        extension = bulk_format.lower()
+        st.download_button(
+            f"Download {bulk_format} File",
+            output,
+            f"{bulk_file.name.rsplit('.', 1)[0]}.{extension}",
+            "application/vnd.google-earth.kmz" if extension == 'kmz' else "text/xml"
+        )
@@ -0,0 +1,153 @@
+"""Households per cell: binning of result coordinates into hexagonal or square cells.
+
+Points are projected to Web Mercator, the projection the map is drawn in,
+so cells look regular on screen. Cell sizes are in metres on the ground at
+the grid's reference latitude. Binning is vectorized with NumPy and
+incremental: sync(table) only bins the rows appended since the last call, so
+a grid can follow an AddressTable while an extraction is still running.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS = 6378137.0  # Web Mercator sphere radius in metres
+SHAPES = ('hex', 'square')
+
+
+def _project(lats, lons):
+    """Web Mercator x, y in metres for arrays of latitudes and longitudes"""
+    x = EARTH_RADIUS * np.radians(lons)
+    y = EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lats) / 2))
+    return x, y
+
+
+def _unproject(x, y):
+    """Latitudes and longitudes for arrays of Web Mercator x, y"""
+    lons = np.degrees(x / EARTH_RADIUS)
+    lats = np.degrees(2 * np.arctan(np.exp(y / EARTH_RADIUS)) - np.pi / 2)
+    return lats, lons
+
+
+class DensityGrid:
+    """Count of points per cell of a hexagonal or square grid.
+
+    cell_size is the distance between neighbouring cell centres in metres.
+    ref_lat fixes the metres-to-Mercator scale; when None it is taken, to
+    the nearest degree, from the first points added so grids built for
+    nearby polygons share the same cells.
+    """
+
+    def __init__(self, cell_size, shape='hex', ref_lat=None):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown cell shape {shape!r}, expected one of {SHAPES}")
+        self.cell_size = cell_size
+        self.shape = shape
+        self.ref_lat = ref_lat
+        self.counts = {}  # (a, b) cell index -> number of points
+        self.total = 0
+        self._synced = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def _step(self):
+        """Cell spacing in Mercator metres"""
+        return self.cell_size / math.cos(math.radians(self.ref_lat))
+
+    def _cells(self, x, y):
+        """Integer (a, b) cell indices for arrays of Mercator x, y"""
+        step = self._step
+        if self.shape == 'square':
+            return np.floor(x / step).astype(np.int64), np.floor(y / step).astype(np.int64)
+
+        # Pointy-top hexagons in axial coordinates, rounded through cube coordinates
+        size = step / math.sqrt(3)
+        q = (math.sqrt(3) / 3 * x - y / 3) / size
+        r = (2 / 3 * y) / size
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+        return rq.astype(np.int64), rr.astype(np.int64)
+
+    def add(self, lats, lons):
+        """Bin arrays of latitudes and longitudes into the grid"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        if not len(lats):
+            return
+        if self.ref_lat is None:
+            self.ref_lat = float(round(lats[0]))
+
+        a, b = self._cells(*_project(lats, lons))
+        cells, counts = np.unique(np.stack([a, b], axis=1), axis=0, return_counts=True)
+        for (ca, cb), count in zip(cells.tolist(), counts.tolist()):
+            self.counts[(ca, cb)] = self.counts.get((ca, cb), 0) + count
+        self.total += len(lats)
+
+    def sync(self, table):
+        """Bin the rows an append-only AddressTable gained since the last sync"""
+        start = self._synced
+        end = len(table.latitudes)
+        if end > start:
+            # The array('d') columns are viewed in place, without copying
+            self.add(
+                np.frombuffer(table.latitudes, dtype=float)[start:end],
+                np.frombuffer(table.longitudes, dtype=float)[start:end]
+            )
+            self._synced = end
+
+    def cell_center(self, cell):
+        """(lat, lon) of a cell's centre"""
+        a, b = cell
+        step = self._step
+        if self.shape == 'square':
+            x, y = (a + 0.5) * step, (b + 0.5) * step
+        else:
+            size = step / math.sqrt(3)
+            x, y = size * (math.sqrt(3) * a + math.sqrt(3) / 2 * b), size * 1.5 * b
+        lat, lon = _unproject(np.array([x]), np.array([y]))
+        return float(lat[0]), float(lon[0])
+
+    def cell_ring(self, cell):
+        """Closed [lon, lat] ring of a cell's outline, GeoJSON order"""
+        a, b = cell
+        step = self._step
+        if self.shape == 'square':
+            x = np.array([a, a + 1, a + 1, a, a]) * step
+            y = np.array([b, b, b + 1, b + 1, b]) * step
+        else:
+            size = step / math.sqrt(3)
+            cx, cy = size * (math.sqrt(3) * a + math.sqrt(3) / 2 * b), size * 1.5 * b
+            angles = np.radians(30 + 60 * np.arange(7))
+            x = cx + size * np.cos(angles)
+            y = cy + size * np.sin(angles)
+        lats, lons = _unproject(x, y)
+        return [[lon, lat] for lon, lat in zip(lons.tolist(), lats.tolist())]
+
+    def rows(self):
+        """(cell id, centre lat, centre lon, count) per occupied cell, busiest first"""
+        rows = []
+        for cell, count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            lat, lon = self.cell_center(cell)
+            rows.append((f"{self.shape}:{cell[0]}:{cell[1]}", lat, lon, count))
+        return rows
+
+    def to_geojson(self):
+        """FeatureCollection with one polygon per occupied cell and its count"""
+        return {
+            'type': 'FeatureCollection',
+            'features': [
+                {
+                    'type': 'Feature',
+                    'id': f"{self.shape}:{cell[0]}:{cell[1]}",
+                    'properties': {'count': count},
+                    'geometry': {'type': 'Polygon', 'coordinates': [self.cell_ring(cell)]},
+                }
+                for cell, count in self.counts.items()
+            ],
+        }
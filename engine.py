@@ -0,0 +1,424 @@
+"""Streaming address extraction engine shared by the app, the CLI and tests.
+
+An ExtractionEngine turns batches of sampled points into geocode results
+one point at a time, so consumers can show or write results while the run
+is still going. Every piece is pluggable:
+
+- sampler: polygon -> iterable of point batches (see grid_sampler and
+  tiled_sampler); a plain run uses a single batch
+- geocoder: (lat, lon) -> GeocodeResult or None, raising on failure
+- cache: anything with get(key) / set(key, value), e.g. GeocodeCache
+- sink: anything with append(lat, lon, result), e.g. AddressTable
+
+Usage from the command line:
+
+    python engine.py sample_polygons.kml --grid-size 0.0005 -o addresses.csv
+"""
+import argparse
+import asyncio
+import csv
+import sys
+import time
+import uuid
+from collections import deque, namedtuple
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from geocache import get_cache_key
+from geocoding import CircuitOpenError
+from grid import generate_grid_points, split_into_tiles, iter_tile_grid_points, stratified_order
+from records import AddressTable
+
+# One resolved point: which batch it came from, how many points of that batch
+# were resolved before it (points retried at the end of a batch keep the count
+# monotonic), the geocode result (None if nothing was found or the lookup
+# failed) and whether it added a new unique address to the sink
+PointResult = namedtuple(
+    'PointResult', ['batch', 'index', 'batch_size', 'lat', 'lon', 'result', 'is_new']
+)
+
+
+def grid_sampler(grid_size, stratified=False):
+    """Sampler yielding a polygon's whole grid as a single batch, coarse-to-fine if stratified"""
+    def sample(polygon):
+        points = generate_grid_points(polygon, grid_size)
+        yield stratified_order(points) if stratified else points
+    return sample
+
+
+def tiled_sampler(grid_size, max_tile_points, max_workers=None, tiles=None, stratified=False):
+    """Sampler yielding one batch per tile as soon as the process pool has built it.
+
+    With stratified, every tile is generated first and the whole grid is
+    yielded as one coarse-to-fine batch, so a budgeted run covers the whole
+    polygon rather than its first tiles.
+    """
+    def sample(polygon):
+        polygon_tiles = tiles if tiles is not None else split_into_tiles(polygon, grid_size, max_tile_points)
+        tile_points = iter_tile_grid_points(polygon, grid_size, polygon_tiles, max_workers=max_workers)
+        if stratified:
+            yield stratified_order([point for _, points in tile_points for point in points])
+            return
+        for _, points in tile_points:
+            yield points
+    return sample
+
+
+class Budget:
+    """Limit on how long an extraction runs, in seconds and/or geocoder requests.
+
+    Cache hits are free. The budget is checked between points, so a run
+    stops before the first point that would start past it, and pauses for
+    an open circuit breaker end when the time budget does.
+    """
+
+    def __init__(self, seconds=None, requests=None):
+        self.seconds = seconds
+        self.requests = requests
+        self.started = None
+
+    def start(self):
+        if self.started is None:
+            self.started = time.monotonic()
+
+    def remaining(self):
+        """Seconds left of the time budget, or None without one"""
+        if self.seconds is None:
+            return None
+        return max(0.0, self.seconds - (time.monotonic() - self.started))
+
+    def exhausted(self, engine):
+        if self.seconds is not None and time.monotonic() - self.started >= self.seconds:
+            return True
+        return self.requests is not None and engine.geocoder_calls >= self.requests
+
+
+class ExtractionEngine:
+    """Geocode sampled points and yield each result as soon as it is resolved.
+
+    Results are deduplicated by address across all batches of a run; each
+    new address is appended to the sink.
+
+    A point whose lookup fails is re-queued at the end of its batch up to
+    max_requeues times before it counts as failed. While the geocoder's
+    circuit breaker is open (CircuitOpenError) the run pauses by calling
+    on_pause(seconds), time.sleep by default, and then retries the point,
+    instead of failing every remaining point.
+
+    With a Budget the run stops cleanly once it is spent, setting
+    stopped_early; coverage() then estimates what the whole grid holds.
+    """
+
+    def __init__(
+        self, geocoder, cache=None, cache_key=get_cache_key, sink=None, max_requeues=1, on_pause=None, budget=None
+    ):
+        self.geocoder = geocoder
+        self.cache = cache
+        self.cache_key = cache_key
+        self.sink = sink if sink is not None else AddressTable()
+        self.address_hits = {}  # address -> number of sampled points that returned it
+        self.processed = 0
+        self.total_points = 0
+        self.stopped_early = False
+        self.budget = budget
+        self.failed = 0
+        self.cache_hits = 0
+        self.geocoder_calls = 0
+        self.requeued = 0
+        self.pauses = 0
+        self.max_requeues = max_requeues
+        self.on_pause = on_pause if on_pause is not None else time.sleep
+
+    def resolve(self, lat, lon):
+        """Return the geocode result for a point, from the cache when possible"""
+        key = self.cache_key(lat, lon)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+
+        self.geocoder_calls += 1
+        result = self.geocoder(lat, lon)
+        if result is not None and self.cache is not None:
+            self.cache.set(key, result)
+        return result
+
+    def _try_point(self, lat, lon, requeues):
+        """Resolve a point, pausing while the circuit is open; returns (result, requeue)"""
+        while True:
+            try:
+                return self.resolve(lat, lon), False
+            except CircuitOpenError as e:
+                # An outage must not outlast the budget: pause at most until it runs
+                # out, then requeue the point so the stream stops before it
+                if self._out_of_budget():
+                    return None, True
+                remaining = self.budget.remaining() if self.budget is not None else None
+                self.pauses += 1
+                self.on_pause(e.retry_after if remaining is None else min(e.retry_after, remaining))
+            except ValueError:
+                # Coordinates out of range will never resolve
+                self.failed += 1
+                return None, False
+            except Exception:
+                if requeues < self.max_requeues:
+                    self.requeued += 1
+                    return None, True
+                # A point that keeps failing is skipped, as the app always did
+                self.failed += 1
+                return None, False
+
+    def _record(self, batch, index, batch_size, lat, lon, result):
+        self.processed += 1
+        is_new = result is not None and result.address not in self.address_hits
+        if result is not None:
+            self.address_hits[result.address] = self.address_hits.get(result.address, 0) + 1
+        if is_new:
+            self.sink.append(lat, lon, result)
+        return PointResult(batch, index, batch_size, lat, lon, result, is_new)
+
+    def _out_of_budget(self):
+        if self.budget is not None and self.budget.exhausted(self):
+            self.stopped_early = True
+        return self.stopped_early
+
+    def coverage(self, total_points=None):
+        """Return (fraction of the grid sampled, estimated unique addresses in the whole grid).
+
+        total_points defaults to the points of every batch started, which is
+        the whole grid for single-batch samplers. The estimate is the Chao1
+        richness estimator over how often each address was hit, capped by
+        linear extrapolation; a complete run returns the addresses found.
+        """
+        total = total_points if total_points is not None else self.total_points
+        found = len(self.address_hits)
+        fraction = min(self.processed / total, 1.0) if total else 1.0
+        if fraction >= 1 or found == 0:
+            return fraction, found
+        singletons = sum(1 for hits in self.address_hits.values() if hits == 1)
+        doubletons = sum(1 for hits in self.address_hits.values() if hits == 2)
+        chao1 = found + singletons * (singletons - 1) / (2 * (doubletons + 1))
+        return fraction, int(round(min(chao1, found / fraction)))
+
+    def stream(self, batches):
+        """Yield a PointResult for every point of every batch, in order"""
+        if self.budget is not None:
+            self.budget.start()
+        for batch, points in enumerate(batches):
+            self.total_points += len(points)
+            queue = deque((lat, lon, 0) for lat, lon in points)
+            index = 0
+            while queue:
+                if self._out_of_budget():
+                    return
+                lat, lon, requeues = queue.popleft()
+                result, requeue = self._try_point(lat, lon, requeues)
+                if requeue:
+                    queue.append((lat, lon, requeues + 1))
+                    continue
+                yield self._record(batch, index, len(points), lat, lon, result)
+                index += 1
+
+    def run(self, sampler, polygon):
+        """Sample a polygon and stream its results"""
+        return self.stream(sampler(polygon))
+
+    async def astream(self, batches):
+        """Async-iterator variant of stream; lookups run in the default executor"""
+        loop = asyncio.get_running_loop()
+        if self.budget is not None:
+            self.budget.start()
+        for batch, points in enumerate(batches):
+            self.total_points += len(points)
+            queue = deque((lat, lon, 0) for lat, lon in points)
+            index = 0
+            while queue:
+                if self._out_of_budget():
+                    return
+                lat, lon, requeues = queue.popleft()
+                result, requeue = await loop.run_in_executor(None, self._try_point, lat, lon, requeues)
+                if requeue:
+                    queue.append((lat, lon, requeues + 1))
+                    continue
+                yield self._record(batch, index, len(points), lat, lon, result)
+                index += 1
+
+
+def join_points_to_polygons(resolved, geometries):
+    """Assign resolved points to every polygon that contains them.
+
+    resolved is a list of (lat, lon, result) for every point that returned
+    an address, in processing order; the join uses an STRtree over the
+    geometries. Returns one AddressTable of unique addresses per geometry.
+    """
+    tables = [AddressTable() for _ in geometries]
+    if not resolved:
+        return tables
+
+    lats = np.fromiter((r[0] for r in resolved), dtype=float, count=len(resolved))
+    lons = np.fromiter((r[1] for r in resolved), dtype=float, count=len(resolved))
+    tree = STRtree(geometries)
+    # 'intersects' rather than 'within' so points on an edge shared by two
+    # adjacent polygons are still attributed to them
+    point_idx, polygon_idx = tree.query(shapely.points(lons, lats), predicate='intersects')
+    order = np.lexsort((polygon_idx, point_idx))
+
+    seen = [set() for _ in geometries]
+    for i, j in zip(point_idx[order].tolist(), polygon_idx[order].tolist()):
+        lat, lon, result = resolved[i]
+        if result.address not in seen[j]:
+            seen[j].add(result.address)
+            tables[j].append(lat, lon, result)
+    return tables
+
+
+def repeated_lookups(points, geometries):
+    """Lookups that analyzing each geometry on its own would repeat for these sampled points.
+
+    points is a sequence of (lat, lon, ...) tuples; a point inside k of the
+    geometries (edges included, as in join_points_to_polygons) counts k - 1,
+    so disjoint geometries give 0.
+    """
+    if not points:
+        return 0
+    lats = np.fromiter((p[0] for p in points), dtype=float, count=len(points))
+    lons = np.fromiter((p[1] for p in points), dtype=float, count=len(points))
+    point_idx, _ = STRtree(geometries).query(shapely.points(lons, lats), predicate='intersects')
+    return len(point_idx) - len(np.unique(point_idx))
+
+
+def main(argv=None):
+    from geopy.geocoders import Nominatim
+
+    from geocoding import (
+        NOMINATIM_USER_AGENT, RateLimiter, CircuitBreaker, HttpStats, GeocoderBackend, BackendPool,
+        make_reverse_geocoder, parse_backend_spec
+    )
+    from http_pool import DEFAULT_POOL_SIZE, pooled_adapter_factory
+    from kml_parser import parse_kml, build_polygon_geometry
+    from profiling import PROFILING_ENABLED, profile_run
+    from streets import load_street_index, street_sampler
+
+    parser = argparse.ArgumentParser(description="Extract unique addresses inside KML polygons")
+    parser.add_argument('kml', help="KML file with the polygons to analyze")
+    parser.add_argument('--polygon', help="Only analyze the polygon with this name or id")
+    parser.add_argument('--grid-size', type=float, default=0.0002, help="Grid spacing in degrees")
+    parser.add_argument('--tiled', action='store_true', help="Generate grids per tile in a process pool")
+    parser.add_argument('--streets', metavar='OSM_FILE', help="Sample along residential streets from this OSM extract")
+    parser.add_argument('--street-spacing', type=float, default=20.0, help="Metres between street-side points")
+    parser.add_argument('--street-offset', type=float, default=12.0, help="Metres from the centerline to the points")
+    parser.add_argument('--min-interval', type=float, default=1.0, help="Seconds between geocoder requests")
+    parser.add_argument(
+        '--backends', metavar='SPEC',
+        help='Spread requests over geocoder replicas, e.g. "http://10.0.0.5:8080 0, https://nominatim.openstreetmap.org 1 fallback"'
+    )
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE, help="Keep-alive connections to the geocoder")
+    parser.add_argument('--timeout', type=float, default=1.0, help="Seconds before a geocoder request times out")
+    parser.add_argument('--time-budget', type=float, help="Stop each polygon after this many seconds")
+    parser.add_argument('--max-requests', type=int, help="Stop each polygon after this many geocoder requests")
+    parser.add_argument('--profile', action='store_true', help="Save a profile of each polygon's run to PROFILE_DIR")
+    parser.add_argument('-o', '--output', help="CSV file to write (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.streets and args.tiled:
+        parser.error("--tiled samples a grid and cannot be combined with --streets")
+
+    with open(args.kml, 'rb') as f:
+        polygons, warnings = parse_kml(f.read())
+    for message in warnings:
+        print(message, file=sys.stderr)
+    if args.polygon:
+        polygons = [p for p in polygons if args.polygon in (p['name'], p['id'])]
+    if not polygons:
+        print("No matching polygons found", file=sys.stderr)
+        return 1
+
+    try:
+        specs = parse_backend_spec(args.backends or '') or [('https', 'nominatim.openstreetmap.org', None, False)]
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    http_stats = HttpStats()
+    backends = []
+    for scheme, domain, min_interval, fallback in specs:
+        fetch = make_reverse_geocoder(Nominatim(
+            user_agent=NOMINATIM_USER_AGENT, domain=domain, scheme=scheme, timeout=args.timeout,
+            adapter_factory=pooled_adapter_factory(args.pool_size, stats=http_stats)
+        ))
+        rate_limiter = RateLimiter(args.min_interval if min_interval is None else min_interval)
+        backends.append(GeocoderBackend(domain, fetch, rate_limiter, CircuitBreaker(), fallback))
+    pool = BackendPool(backends)
+
+    def pause(seconds):
+        print(f"Geocoder unavailable, pausing for {seconds:.0f}s", file=sys.stderr)
+        time.sleep(seconds)
+    geocoder = pool.reverse
+    budgeted = args.time_budget is not None or args.max_requests is not None
+    # Parsed once; each polygon looks up its own streets
+    streets = load_street_index(args.streets) if args.streets else None
+    if args.tiled:
+        sampler = tiled_sampler(args.grid_size, 1000, stratified=budgeted)
+    else:
+        sampler = grid_sampler(args.grid_size, stratified=budgeted)
+
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(['Polygon', 'Latitude', 'Longitude', 'Address', 'Postal Code', 'City', 'State', 'Country'])
+        for polygon_record in polygons:
+            run_id = uuid.uuid4().hex
+            with profile_run(run_id, args.profile or PROFILING_ENABLED) as profile:
+                budget = Budget(args.time_budget, args.max_requests) if budgeted else None
+                engine = ExtractionEngine(geocoder, on_pause=pause, budget=budget)
+                geometry = build_polygon_geometry(polygon_record)
+                if args.streets:
+                    sampler = street_sampler(
+                        streets.query(geometry.bounds), args.street_spacing, args.street_offset, stratified=budgeted
+                    )
+                started = time.perf_counter()
+                for item in engine.run(sampler, geometry):
+                    if item.is_new:
+                        r = item.result
+                        writer.writerow([
+                            polygon_record['name'], item.lat, item.lon,
+                            r.address, r.postcode, r.city, r.state, r.country
+                        ])
+                        output.flush()
+                print(
+                    f"{polygon_record['name']}: {len(engine.sink)} addresses from {engine.processed} points "
+                    f"({engine.failed} failed, {engine.requeued} retried) in {time.perf_counter() - started:.1f}s",
+                    file=sys.stderr
+                )
+                if engine.stopped_early:
+                    fraction, estimate = engine.coverage()
+                    print(
+                        f"{polygon_record['name']}: budget reached at {fraction:.0%} of the grid, "
+                        f"estimated {estimate} addresses in total",
+                        file=sys.stderr
+                    )
+            if profile is not None:
+                print(f"{polygon_record['name']}: profile saved to {profile.prof_path} and {profile.folded_path}", file=sys.stderr)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if http_stats.requests:
+        p50, p95 = http_stats.latency_percentiles(0.5, 0.95)
+        print(
+            f"Geocoder HTTP: {http_stats.requests} requests, {http_stats.reuse_rate():.0%} over reused connections, "
+            f"latency p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms",
+            file=sys.stderr
+        )
+    if len(backends) > 1:
+        for backend in backends:
+            latency = "no requests" if backend.latency is None else f"latency {backend.latency * 1000:.0f} ms"
+            print(
+                f"Geocoder {backend.name}: {backend.requests} requests, {backend.failures} failed, {latency}",
+                file=sys.stderr
+            )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
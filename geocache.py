@@ -0,0 +1,169 @@
+"""Size-bounded LRU cache for geocoding results with per-entry expiry.
+
+Caches can be exported to and merged from versioned snapshot files so new
+instances start warm.
+"""
+import gzip
+import io
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from records import GeocodeResult
+
+SNAPSHOT_FORMAT = 'polygon-extractor-geocache'
+SNAPSHOT_VERSION = 1
+
+
+def get_cache_key(lat, lon):
+    return f"{lat:.6f},{lon:.6f}"
+
+
+def get_query_key(query):
+    """Cache key for a location search: case-folded with whitespace and separators collapsed"""
+    words = query.replace(',', ' ').casefold().split()
+    return "q:" + " ".join(words)
+
+
+def _entry_bytes(key, value):
+    """Approximate bytes held by one cache entry"""
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    for field in getattr(value, '__slots__', ()):
+        size += sys.getsizeof(getattr(value, field))
+    return size
+
+
+class GeocodeCache:
+    """LRU mapping of cache keys to geocode results.
+
+    Every entry carries its own insertion timestamp and expires ttl seconds
+    later; expiry is applied lazily when an entry is read, and evicted
+    entries are the least recently used once max_entries or max_bytes is
+    exceeded. Safe to share between threads.
+    """
+
+    def __init__(self, ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (value, timestamp, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, timestamp, size = entry
+            if time.time() - timestamp > self.ttl:
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timestamp=None):
+        """Store value under key, evicting least recently used entries if over budget"""
+        size = _entry_bytes(key, value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, time.time() if timestamp is None else timestamp, size)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def items(self):
+        """Snapshot of (key, value) pairs from least to most recently used"""
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    def entries(self):
+        """Snapshot of (key, value, timestamp) triples from least to most recently used"""
+        with self._lock:
+            return [(key, entry[0], entry[1]) for key, entry in self._entries.items()]
+
+    def merge(self, key, value, timestamp):
+        """Store an entry from another cache unless it is expired or older than ours"""
+        if time.time() - timestamp > self.ttl:
+            return False
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and existing[1] >= timestamp:
+                return False
+        self.set(key, value, timestamp)
+        return True
+
+
+def export_snapshot(cache):
+    """Serialize a cache to gzip-compressed JSON lines.
+
+    The first line is a header naming the format and version; each following
+    line is one entry, least recently used first so an import keeps the
+    LRU order.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+        header = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION, 'created': time.time()}
+        gz.write((json.dumps(header) + '\n').encode('utf-8'))
+        for key, result, timestamp in cache.entries():
+            record = [key, timestamp, result.address, result.postcode, result.city, result.state, result.country]
+            gz.write((json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+    return buffer.getvalue()
+
+
+def read_snapshot(fileobj):
+    """Yield (key, GeocodeResult, timestamp) from a snapshot file object.
+
+    Raises ValueError if the file is not a snapshot or has an unknown version.
+    """
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as gz:
+        header = json.loads(gz.readline() or b'{}')
+        if header.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError("Not a geocode cache snapshot")
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {header.get('version')}")
+        for line in gz:
+            if line.strip():
+                key, timestamp, address, postcode, city, state, country = json.loads(line)
+                yield key, GeocodeResult(address, postcode, city, state, country), timestamp
+
+
+def import_snapshot(cache, entries):
+    """Merge snapshot entries into a cache, deduplicating on key.
+
+    The newer of two entries with the same key wins and original timestamps
+    are kept, so imported entries expire on their own schedule. Returns
+    (merged, skipped) counts.
+    """
+    merged = skipped = 0
+    for key, result, timestamp in entries:
+        if cache.merge(key, result, timestamp):
+            merged += 1
+        else:
+            skipped += 1
+    return merged, skipped
@@ -0,0 +1,525 @@
+"""Geocoding helpers shared by every session of the app."""
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+from records import GeocodeResult, SearchResult
+
+NOMINATIM_USER_AGENT = "FlytrexAddressExtractor/1.0 (+https://www.flytrex.com) Contact: shaik@flytrex.com"
+
+
+class RateLimiter:
+    """Space out geocoder requests across all threads and sessions.
+
+    Nominatim's usage policy allows one request per second per application,
+    so a single instance is shared by every session of the process.
+    Foreground callers are served in arrival order, so a location search
+    queues behind running extractions instead of racing them; background
+    callers only get a slot while no foreground caller is waiting.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._next_time = 0.0
+        self._next_ticket = 0
+        self._now_serving = 0
+
+    def wait(self, background=False):
+        """Block until the caller may send the next request"""
+        with self._cond:
+            if background:
+                while True:
+                    delay = self._next_time - time.monotonic()
+                    if self._next_ticket == self._now_serving and delay <= 0:
+                        self._next_time = time.monotonic() + self.min_interval
+                        return
+                    self._cond.wait(delay if delay > 0 else self.min_interval)
+
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while True:
+                delay = self._next_time - time.monotonic()
+                if ticket == self._now_serving and delay <= 0:
+                    self._next_time = time.monotonic() + self.min_interval
+                    self._now_serving += 1
+                    self._cond.notify_all()
+                    return
+                self._cond.wait(delay if ticket == self._now_serving else None)
+
+    def backlog(self):
+        """Seconds a foreground caller arriving now would wait for its slot"""
+        with self._cond:
+            queued = self._next_ticket - self._now_serving
+            return max(0.0, self._next_time - time.monotonic()) + queued * self.min_interval
+
+    def pause(self, seconds):
+        """Hold back every caller for at least seconds, e.g. after a server's Retry-After"""
+        with self._cond:
+            self._next_time = max(self._next_time, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the geocoder while the circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Geocoder unavailable, retrying in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stop calling a failing geocoder until it has had time to recover.
+
+    After failure_threshold consecutive failures the breaker opens and every
+    call fails fast with CircuitOpenError for reset_timeout seconds. Then a
+    single trial call is let through: success closes the breaker, failure
+    opens it again. Shared by every session, like RateLimiter.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.trips = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._trial_running or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def retry_after(self):
+        """Seconds until the next trial call may be made (0 when closed)"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                # While another caller runs the trial request, check back shortly
+                raise CircuitOpenError(remaining if remaining > 0 else 1.0)
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or (self._opened_at is None and self.failures >= self.failure_threshold):
+                if not self._trial_running:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class HttpStats:
+    """Counts of geocoder HTTP requests and connections opened, with recent latencies.
+
+    Filled in by the pooled adapters of http_pool and shared, like the
+    adapter itself, by every worker and session.
+    """
+
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.connections = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_request(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(seconds)
+
+    def record_connections(self, count=1):
+        with self._lock:
+            self.connections += count
+
+    def reuse_rate(self):
+        """Fraction of requests sent over an already open connection, or None before any request"""
+        with self._lock:
+            if not self.requests:
+                return None
+            return max(0.0, 1 - self.connections / self.requests)
+
+    def latency_percentiles(self, *fractions):
+        """Request latencies in seconds at the given fractions of the recent window, or None if empty"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return [latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] for fraction in fractions]
+
+
+def make_reverse_geocoder(geolocator):
+    """Wrap a geopy geocoder as fetch(lat, lon) -> GeocodeResult or None"""
+    def fetch(lat, lon):
+        location = geolocator.reverse((lat, lon), language='en', zoom=18)
+        if location:
+            return GeocodeResult.from_location(location)
+        return None
+    return fetch
+
+
+def make_forward_geocoder(geolocator):
+    """Wrap a geopy geocoder as fetch(query) -> SearchResult or None"""
+    def fetch(query):
+        location = geolocator.geocode(query)
+        if location:
+            return SearchResult(location.address, location.latitude, location.longitude)
+        return None
+    return fetch
+
+
+def backoff_delay(attempt, initial_delay, max_delay):
+    """Exponential backoff with jitter, so clients retrying together spread out"""
+    delay = min(max_delay, initial_delay * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+
+def geocode_with_retry(call, rate_limiter, max_retries=3, initial_delay=1, max_delay=30, breaker=None):
+    """Run one geocoder request, retrying transient geocoder errors with backoff.
+
+    Every attempt waits for the shared rate limiter. A rate-limit response
+    holds back all callers for its Retry-After (or the backoff delay);
+    other transient errors back off with jitter. Errors that retrying
+    cannot fix (bad query, authentication, blocked) are raised at once.
+    With a breaker, each failure is recorded and calls fail fast with
+    CircuitOpenError while it is open. Re-raises the last geocoder error
+    once max_retries attempts have failed.
+    """
+    from geopy.exc import (
+        GeocoderTimedOut, GeocoderServiceError, GeocoderRateLimited, GeocoderQueryError,
+        GeocoderAuthenticationFailure, GeocoderInsufficientPrivileges
+    )
+
+    for attempt in range(max_retries):
+        if breaker is not None:
+            breaker.before_call()
+        rate_limiter.wait()
+        try:
+            result = call()
+        except (GeocoderQueryError, GeocoderAuthenticationFailure, GeocoderInsufficientPrivileges):
+            raise
+        except GeocoderRateLimited as e:
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == max_retries - 1:
+                raise
+            rate_limiter.pause(e.retry_after or backoff_delay(attempt + 1, initial_delay, max_delay))
+        except (GeocoderTimedOut, GeocoderServiceError, ConnectionError):
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == max_retries - 1:
+                raise
+            time.sleep(backoff_delay(attempt + 1, initial_delay, max_delay))
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+def parse_backend_spec(spec):
+    """Parse "URL [MIN_INTERVAL] [fallback], ..." into (scheme, domain, min_interval or None, fallback) tuples.
+
+    For example "http://10.0.0.5:8080 0, https://nominatim.openstreetmap.org 1 fallback"
+    configures a self-hosted replica without a rate limit and the public
+    service as fallback. Raises ValueError for malformed entries.
+    """
+    backends = []
+    for entry in spec.split(','):
+        fields = entry.split()
+        if not fields:
+            continue
+        scheme, separator, domain = fields[0].partition('://')
+        if not separator or not domain:
+            raise ValueError(f"Geocoder backend {fields[0]!r} is not a scheme://host[:port] URL")
+        fallback = fields[-1] == 'fallback'
+        if fallback:
+            fields = fields[:-1]
+        if len(fields) > 2:
+            raise ValueError(f"Unexpected fields in geocoder backend {entry.strip()!r}")
+        min_interval = float(fields[1]) if len(fields) == 2 else None
+        backends.append((scheme, domain.rstrip('/'), min_interval, fallback))
+    return backends
+
+
+class GeocoderBackend:
+    """One reverse-geocoding endpoint with its own rate limit, circuit breaker and latency estimate.
+
+    fetch(lat, lon) returns a GeocodeResult or None (see
+    make_reverse_geocoder), so every backend's answers have the same
+    fields. Fallback backends only get requests while no other backend is
+    available.
+    """
+
+    def __init__(self, name, fetch, rate_limiter, breaker, fallback=False, smoothing=0.2):
+        self.name = name
+        self.fetch = fetch
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self.fallback = fallback
+        self.smoothing = smoothing
+        self.latency = None  # Moving average of request seconds, None until the first request
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def expected_wait(self):
+        """Seconds a request sent now is expected to take: its rate limit queue plus observed latency"""
+        with self._lock:
+            latency = self.latency or 0.0
+            return self.rate_limiter.backlog() + latency * (1 + self.in_flight)
+
+    def _record(self, seconds, failed):
+        with self._lock:
+            self.requests += 1
+            self.failures += failed
+            if self.latency is None:
+                self.latency = seconds
+            else:
+                self.latency += self.smoothing * (seconds - self.latency)
+
+    def reverse(self, lat, lon, background=False):
+        """One request to this backend, under its rate limit and breaker.
+
+        A rate-limit response holds this backend back for its Retry-After;
+        every other failure but a bad query is recorded by the breaker and
+        re-raised, so the pool can try another backend.
+        """
+        from geopy.exc import GeocoderRateLimited, GeocoderQueryError
+
+        self.breaker.before_call()
+        self.rate_limiter.wait(background=background)
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = self.fetch(lat, lon)
+        except GeocoderQueryError:
+            # The request itself is bad, not the backend
+            self._record(time.perf_counter() - started, False)
+            self.breaker.record_success()
+            raise
+        except Exception as e:
+            self._record(time.perf_counter() - started, True)
+            self.breaker.record_failure()
+            if isinstance(e, GeocoderRateLimited):
+                self.rate_limiter.pause(e.retry_after or backoff_delay(1, 1, 30))
+            raise
+        else:
+            self._record(time.perf_counter() - started, False)
+            self.breaker.record_success()
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class BackendPool:
+    """Spread reverse geocoding over several backends, each request going to the one expected to answer first.
+
+    Backends whose breaker is open are skipped, and slow ones get fewer
+    requests as their observed latency grows, so throughput scales with
+    the number of healthy replicas. A failed request is retried on another
+    backend, or with backoff on the same one when no other is available, up
+    to max_retries attempts. When every backend's breaker is open, or
+    rejects the request because another caller holds its trial request,
+    CircuitOpenError is raised at once, as with a single breaker.
+    """
+
+    def __init__(self, backends, max_retries=3, initial_delay=1, max_delay=30):
+        self.backends = list(backends)
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        """Stable name of the set of backends, e.g. for keying stored results"""
+        return '+'.join(sorted(backend.name for backend in self.backends))
+
+    def choose(self, exclude=()):
+        """Available backend expected to answer first, preferring non-fallback ones, or None"""
+        available = [b for b in self.backends if b not in exclude and b.breaker.state != 'open']
+        candidates = [b for b in available if not b.fallback] or available
+        if not candidates:
+            return None
+        with self._lock:
+            return min(candidates, key=lambda backend: backend.expected_wait())
+
+    def retry_after(self):
+        """Seconds until the first open breaker allows a trial request"""
+        return min(backend.breaker.retry_after() for backend in self.backends)
+
+    def reverse(self, lat, lon, background=False):
+        """Reverse geocode one point; raises ValueError for coordinates out of range"""
+        from geopy.exc import GeocoderQueryError
+
+        lat = float(lat)
+        lon = float(lon)
+        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            raise ValueError("Coordinates out of valid range")
+
+        failed = []
+        rejected = []
+        last_error = None
+        retry_after = None
+        for attempt in range(self.max_retries):
+            backend = self.choose(exclude=failed + rejected) or self.choose(exclude=rejected)
+            if backend is None:
+                break
+            if backend in failed:
+                # Every available backend has failed this point once: back off before trying again
+                time.sleep(backoff_delay(attempt, self.initial_delay, self.max_delay))
+            try:
+                return backend.reverse(lat, lon, background)
+            except GeocoderQueryError:
+                raise
+            except CircuitOpenError as e:
+                # Its breaker opened meanwhile, or another caller holds its trial request:
+                # waiting here would not help, so it is not tried again for this point
+                rejected.append(backend)
+                retry_after = e.retry_after if retry_after is None else min(retry_after, e.retry_after)
+            except Exception as e:
+                failed.append(backend)
+                last_error = e
+        if last_error is not None:
+            raise last_error
+        raise CircuitOpenError(retry_after or self.retry_after() or 1.0)
+
+
+class PrefetchJob:
+    """Progress of warming one polygon's grid points into a geocode cache.
+
+    The cache is only weakly referenced, so a session that ends does not
+    keep its cache alive through its prefetch jobs; the job then finishes.
+    """
+
+    def __init__(self, name, points, cache, geocode, cache_key):
+        self.name = name
+        self.points = points
+        self._cache = weakref.ref(cache)
+        self.geocode = geocode
+        self.cache_key = cache_key
+        self.done = 0
+        self.fetched = 0
+        self.failed = 0
+        self.cancelled = False
+        self.paused = False
+
+    @property
+    def cache(self):
+        """The cache being filled, or None once its session is gone"""
+        return self._cache()
+
+    @property
+    def total(self):
+        return len(self.points)
+
+    @property
+    def finished(self):
+        return self.cancelled or self.done >= self.total or self.cache is None
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Prefetcher:
+    """Background worker that fills geocode caches at low priority.
+
+    Jobs are grouped by the cache they fill, that is by session, and the
+    sessions take turns one point at a time, so a large upload in one
+    session does not hold back every other session's prefetch. Within a
+    session, jobs run in submission order. A job's geocode function must
+    wait for background slots itself, as BackendPool.reverse(...,
+    background=True) does, so foreground extractions always go first.
+    While the geocoder's circuit breaker is open the worker pauses.
+    """
+
+    def __init__(self):
+        self._turns = deque()  # One deque of jobs per cache, in turn order
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, name, points, cache, geocode, cache_key):
+        """Queue the points of one polygon and return its PrefetchJob"""
+        job = PrefetchJob(name, points, cache, geocode, cache_key)
+        with self._cond:
+            for jobs in self._turns:
+                if jobs and jobs[0].cache is cache:
+                    jobs.append(job)
+                    break
+            else:
+                # A new session goes next, so its progress shows right away
+                self._turns.appendleft(deque([job]))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='geocode-prefetch', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return job
+
+    def _next_job(self):
+        """Current job of the session whose turn it is, dropping finished jobs; None when idle"""
+        while self._turns:
+            jobs = self._turns.popleft()
+            while jobs and jobs[0].finished:
+                jobs.popleft()
+            if jobs:
+                self._turns.append(jobs)
+                return jobs[0]
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+            self._step(job)
+
+    def _step(self, job):
+        """Warm the job's next uncached point; points already cached do not use up a turn"""
+        cache = job.cache
+        while cache is not None and not job.cancelled and job.done < job.total:
+            lat, lon = job.points[job.done]
+            key = job.cache_key(lat, lon)
+            if cache.get(key) is not None:
+                job.done += 1
+                continue
+            try:
+                result = job.geocode(lat, lon)
+                if result is not None:
+                    cache.set(key, result)
+                job.fetched += 1
+            except CircuitOpenError as e:
+                # Geocoder is down: hold off and retry this point on the job's next turn
+                job.paused = True
+                time.sleep(e.retry_after)
+                job.paused = False
+                return
+            except Exception:
+                job.failed += 1
+            job.done += 1
+            return
@@ -0,0 +1,153 @@
+"""Grid sampling of polygons, including tiled generation in worker processes.
+
+Kept free of Streamlit so the functions can be pickled into a process pool.
+"""
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+
+def generate_grid_points(polygon, grid_size):
+    """Generate (lat, lon) grid points that fall inside the polygon, excluding its holes"""
+    min_x, min_y, max_x, max_y = polygon.bounds
+    x_points = np.arange(min_x, max_x, grid_size)
+    y_points = np.arange(min_y, max_y, grid_size)
+
+    # Row-major over y then x, the same order as the original nested loops
+    xx, yy = np.meshgrid(x_points, y_points)
+    xx = xx.ravel()
+    yy = yy.ravel()
+    shapely.prepare(polygon)
+    inside = shapely.contains_xy(polygon, xx, yy)
+
+    return list(zip(yy[inside].tolist(), xx[inside].tolist()))
+
+
+def stratified_order(points, seed=0):
+    """Reorder grid points coarse-to-fine so any prefix covers the whole polygon.
+
+    Points are ranked by how coarse a sub-grid they belong to: every 2^k-th
+    column and row of the grid comes before every 2^(k-1)-th, down to the
+    full grid. Points within a level are shuffled (deterministically, with
+    seed) so stopping part way through a level does not favour one side.
+    Works on the (lat, lon) lists of generate_grid_points and tile_grid_points,
+    whose coordinates repeat exactly along rows and columns.
+    """
+    if len(points) < 2:
+        return list(points)
+    coords = np.asarray(points, dtype=float)
+    _, rows = np.unique(coords[:, 0], return_inverse=True)
+    _, cols = np.unique(coords[:, 1], return_inverse=True)
+
+    # Level = trailing zero bits shared by the row and column index; the
+    # origin row/column counts as the coarsest level
+    combined = (rows | cols).astype(np.int64)
+    levels = np.zeros(len(points), dtype=np.int64)
+    top = int(combined.max()).bit_length() + 1
+    levels[combined == 0] = top
+    remaining = combined != 0
+    level_values = combined[remaining]
+    levels[remaining] = np.log2(level_values & -level_values).astype(np.int64)
+
+    shuffle = np.random.default_rng(seed).random(len(points))
+    order = np.lexsort((shuffle, -levels))
+    return [points[i] for i in order.tolist()]
+
+
+def estimate_grid_points(polygon, grid_size):
+    """Estimate how many grid points fall inside the polygon without generating them"""
+    return int(math.ceil(polygon.area / (grid_size * grid_size)))
+
+
+def split_into_tiles(polygon, grid_size, max_tile_points):
+    """Split the polygon's grid into square tiles of at most max_tile_points cells.
+
+    Tiles are (i0, i1, j0, j1) index ranges into the same global grid that
+    generate_grid_points would use, so tiles never share a point. Tiles that
+    do not touch the polygon are dropped.
+    """
+    min_x, min_y, max_x, max_y = polygon.bounds
+    nx = len(np.arange(min_x, max_x, grid_size))
+    ny = len(np.arange(min_y, max_y, grid_size))
+    side = max(1, int(math.sqrt(max_tile_points)))
+    half = grid_size / 2
+
+    shapely.prepare(polygon)
+    tiles = []
+    for j0 in range(0, ny, side):
+        j1 = min(j0 + side, ny)
+        for i0 in range(0, nx, side):
+            i1 = min(i0 + side, nx)
+            tile_box = box(
+                min_x + i0 * grid_size - half, min_y + j0 * grid_size - half,
+                min_x + (i1 - 1) * grid_size + half, min_y + (j1 - 1) * grid_size + half
+            )
+            if polygon.intersects(tile_box):
+                tiles.append((i0, i1, j0, j1))
+    return tiles
+
+
+def tile_grid_points(polygon, bounds, grid_size, tile):
+    """Generate the (lat, lon) grid points of one tile that fall inside the polygon.
+
+    The polygon should already be prepared; points are tested against the
+    whole polygon so tile results match generate_grid_points exactly.
+    """
+    i0, i1, j0, j1 = tile
+    min_x, min_y, max_x, max_y = bounds
+    # Slice the same arange the full grid uses so coordinates match bit for bit
+    x_points = np.arange(min_x, max_x, grid_size)[i0:i1]
+    y_points = np.arange(min_y, max_y, grid_size)[j0:j1]
+
+    xx, yy = np.meshgrid(x_points, y_points)
+    xx = xx.ravel()
+    yy = yy.ravel()
+    inside = shapely.contains_xy(polygon, xx, yy)
+    return list(zip(yy[inside].tolist(), xx[inside].tolist()))
+
+
+# Polygon shared by every task of a worker process, set once by the pool initializer
+_worker_polygon = None
+
+
+def _init_tile_worker(polygon_wkb):
+    global _worker_polygon
+    _worker_polygon = shapely.from_wkb(polygon_wkb)
+    shapely.prepare(_worker_polygon)
+
+
+def _tile_worker(tile_index, bounds, grid_size, tile):
+    return tile_index, tile_grid_points(_worker_polygon, bounds, grid_size, tile)
+
+
+def iter_tile_grid_points(polygon, grid_size, tiles, max_workers=None):
+    """Yield (tile_index, grid_points) for each tile as soon as its grid is ready.
+
+    Grids are generated in a process pool; tiles arrive in completion order,
+    not in tile order. A single tile or max_workers=1 runs inline.
+    """
+    bounds = polygon.bounds
+
+    if len(tiles) <= 1 or max_workers == 1:
+        shapely.prepare(polygon)
+        for tile_index, tile in enumerate(tiles):
+            yield tile_index, tile_grid_points(polygon, bounds, grid_size, tile)
+        return
+
+    # Spawn rather than fork: the Streamlit server process runs many threads
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_tile_worker,
+        initargs=(shapely.to_wkb(polygon),)
+    ) as executor:
+        futures = [
+            executor.submit(_tile_worker, tile_index, bounds, grid_size, tile)
+            for tile_index, tile in enumerate(tiles)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,136 @@
+"""Pooled keep-alive HTTP adapters for geopy geocoders.
+
+geopy's adapters already keep connections alive, but with fixed pool
+sizes, no way to switch response compression off and no visibility into
+whether connections are actually reused. These subclasses make the pool
+size, retries and compression configurable and record every request's
+latency and every new connection in a geocoding.HttpStats, so a slow
+geocoder can be told apart from TLS handshakes on fresh connections.
+
+Pass pooled_adapter_factory(...) (or async_pooled_adapter_factory(...)) as
+a geocoder's adapter_factory; the geocoder instance, and so its pool, is
+meant to be shared by every worker and session. The async variant needs
+aiohttp (pip install "geopy[aiohttp]").
+"""
+import threading
+import time
+
+from geopy.adapters import AioHTTPAdapter, RequestsAdapter
+
+DEFAULT_POOL_SIZE = 10  # Keep-alive connections per geocoder host
+DEFAULT_KEEPALIVE_SECONDS = 30.0  # Idle time before the async pool closes a connection
+
+
+def _accept_encoding(compression):
+    return 'gzip, deflate' if compression else 'identity'
+
+
+class PooledRequestsAdapter(RequestsAdapter):
+    """RequestsAdapter with a configurable pool that reports to an HttpStats.
+
+    pool_size should be at least the number of threads geocoding at once,
+    or connections beyond it are opened and dropped for every request.
+    """
+
+    def __init__(self, *, proxies, ssl_context, pool_size=DEFAULT_POOL_SIZE, max_retries=2, compression=True, stats=None):
+        super().__init__(
+            proxies=proxies, ssl_context=ssl_context,
+            pool_maxsize=pool_size, max_retries=max_retries
+        )
+        self.session.headers['Accept-Encoding'] = _accept_encoding(compression)
+        self.stats = stats
+        self._connections_seen = 0
+        self._count_lock = threading.Lock()
+
+    def _open_connections(self):
+        """Connections opened so far by all of the session's pools"""
+        total = 0
+        for http_adapter in self.session.adapters.values():
+            pools = http_adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def _request(self, url, *, timeout, headers):
+        if self.stats is None:
+            return super()._request(url, timeout=timeout, headers=headers)
+
+        started = time.perf_counter()
+        try:
+            return super()._request(url, timeout=timeout, headers=headers)
+        finally:
+            self.stats.record_request(time.perf_counter() - started)
+            with self._count_lock:
+                opened = self._open_connections()
+                if opened > self._connections_seen:
+                    self.stats.record_connections(opened - self._connections_seen)
+                    self._connections_seen = opened
+
+
+class PooledAioHTTPAdapter(AioHTTPAdapter):
+    """AioHTTPAdapter with a bounded keep-alive connector that reports to an HttpStats"""
+
+    def __init__(self, *, proxies, ssl_context, pool_size=DEFAULT_POOL_SIZE,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_SECONDS, compression=True, stats=None):
+        super().__init__(proxies=proxies, ssl_context=ssl_context)
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.compression = compression
+        self.stats = stats
+
+    @property
+    def session(self):
+        # Created lazily, inside the event loop, like AioHTTPAdapter's own session
+        session = self.__dict__.get('session')
+        if session is None:
+            import aiohttp
+
+            trace_configs = []
+            if self.stats is not None:
+                trace = aiohttp.TraceConfig()
+                trace.on_request_start.append(self._on_request_start)
+                trace.on_request_end.append(self._on_request_done)
+                trace.on_request_exception.append(self._on_request_done)
+                trace.on_connection_create_end.append(self._on_connection_created)
+                trace_configs.append(trace)
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout),
+                headers={'Accept-Encoding': _accept_encoding(self.compression)},
+                trust_env=False,  # don't use system proxies
+                raise_for_status=False,
+                trace_configs=trace_configs
+            )
+            self.__dict__['session'] = session
+        return session
+
+    async def _on_request_start(self, session, context, params):
+        context.started = time.perf_counter()
+
+    async def _on_request_done(self, session, context, params):
+        self.stats.record_request(time.perf_counter() - context.started)
+
+    async def _on_connection_created(self, session, context, params):
+        self.stats.record_connections()
+
+
+def pooled_adapter_factory(pool_size=DEFAULT_POOL_SIZE, max_retries=2, compression=True, stats=None):
+    """geopy adapter_factory for a PooledRequestsAdapter with these settings"""
+    def factory(proxies, ssl_context):
+        return PooledRequestsAdapter(
+            proxies=proxies, ssl_context=ssl_context, pool_size=pool_size,
+            max_retries=max_retries, compression=compression, stats=stats
+        )
+    return factory
+
+
+def async_pooled_adapter_factory(pool_size=DEFAULT_POOL_SIZE, keepalive_timeout=DEFAULT_KEEPALIVE_SECONDS,
+                                 compression=True, stats=None):
+    """geopy adapter_factory for a PooledAioHTTPAdapter with these settings"""
+    def factory(proxies, ssl_context):
+        return PooledAioHTTPAdapter(
+            proxies=proxies, ssl_context=ssl_context, pool_size=pool_size,
+            keepalive_timeout=keepalive_timeout, compression=compression, stats=stats
+        )
+    return factory
@@ -1,29 +1,48 @@
+import io
+
 import streamlit as st
-import xml.etree.ElementTree as ET
+
+from kml_parser import KmlValidationError, MAX_KML_BYTES, read_validated_kml
+from polygon_store import PolygonStore
+
+@st.cache_resource
+def get_polygon_store():
+    """Store shared with the main app, which lists and loads its entries"""
+    return PolygonStore()
 
 st.title("KML Text Converter")
-st.write("If you can't upload KML files directly, paste your KML content here:")
+st.write("If you can't upload KML files directly, paste your KML content here or upload the file:")
 
+kml_name = st.text_input("Name:", "Pasted polygons")
 kml_text = st.text_area("Paste your KML content here:", height=200)
+kml_file = st.file_uploader("Or choose a KML file", type=['kml'])
+st.caption(f"Files up to {MAX_KML_BYTES // (1024 * 1024)} MB are accepted.")
 
 if st.button("Convert and Save"):
-    if kml_text:
+    if kml_file is not None or kml_text:
         try:
-            # Validate KML
-            root = ET.fromstring(kml_text)
-            
-            # Save to file
-            with open('user_kml.kml', 'w') as f:
-                f.write(kml_text)
-            
-            st.success("KML content saved! You can now use it in the main app.")
+            # Validate while streaming, so oversized or broken input stops early
+            source = kml_file if kml_file is not None else io.BytesIO(kml_text.encode('utf-8'))
+            kml_content = read_validated_kml(source)
+
+            # Store under the content hash, shared with the main app
+            kml_hash, warnings = get_polygon_store().add(kml_content, kml_name)
+            for message in warnings:
+                st.warning(message)
+
+            st.success(
+                f"KML content saved as {kml_hash[:12]}! "
+                "Select it under \"Stored KML files\" in the main app."
+            )
             st.download_button(
                 "Download KML File",
-                kml_text,
+                kml_content,
                 "your_polygons.kml",
                 "text/xml"
             )
-        except Exception as e:
+        except KmlValidationError as e:
             st.error(f"Invalid KML format: {e}")
+        except ValueError as e:
+            st.error(str(e))
     else:
-        st.warning("Please paste your KML content first.")
\ No newline at end of file
+        st.warning("Please paste your KML content first.")
@@ -0,0 +1,209 @@
+"""KML polygon parsing shared by the app, the converter page and the CLI."""
+import re
+import warnings
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from shapely.geometry import Polygon, MultiPolygon
+
+MAX_KML_BYTES = 20 * 1024 * 1024  # Largest KML document accepted by read_validated_kml
+MAX_KML_ELEMENTS = 1_000_000  # Most XML elements accepted by read_validated_kml
+
+_COMMA_SPACING = re.compile(r'[ \t]+,[ \t]*|,[ \t]+')  # Horizontal blanks only: a comma may end a line
+
+
+class KmlValidationError(ValueError):
+    """Raised when KML content is malformed, not KML or over the size limits"""
+
+
+def _kml_tag(elem):
+    """Return the tag name of a KML element without its namespace"""
+    return elem.tag.rsplit('}', 1)[-1]
+
+
+def _kml_descendants(elem, tag):
+    """Find all descendants with the given tag, whatever KML namespace is used"""
+    return [child for child in elem.iter() if child is not elem and _kml_tag(child) == tag]
+
+
+def _parse_coordinates_slow(tuples):
+    """Parse coordinate tuples one by one, skipping malformed ones"""
+    coord_pairs = []
+    for coord in tuples:
+        parts = coord.split(',')
+        if len(parts) >= 2:
+            try:
+                coord_pairs.append((float(parts[0]), float(parts[1])))
+            except ValueError:
+                continue
+    return np.array(coord_pairs, dtype=float).reshape(-1, 2)
+
+
+def _parse_coordinates(coords_text):
+    """Parse a KML coordinates string into an (n, 2) array of lon, lat.
+
+    Tuples are lon,lat or lon,lat,alt separated by whitespace. When every
+    tuple has the same dimension the whole string is converted in one NumPy
+    call; otherwise (mixed dimensions, blanks around commas, bad numbers)
+    each tuple is parsed on its own and malformed ones are skipped.
+    """
+    tuples = coords_text.split()
+    if not tuples:
+        return np.empty((0, 2))
+
+    commas = {coord.count(',') for coord in tuples}
+    if len(commas) == 1:
+        dimension = commas.pop() + 1
+        if dimension >= 2:
+            try:
+                with warnings.catch_warnings():
+                    # Unparseable text is a warning in NumPy, not an error
+                    warnings.simplefilter('error')
+                    values = np.fromstring(coords_text.replace(',', ' '), sep=' ')
+            except (ValueError, DeprecationWarning):
+                pass
+            else:
+                if len(values) == len(tuples) * dimension:
+                    return values.reshape(-1, dimension)[:, :2].copy()
+    # Blanks around commas make tuples look uneven; rejoin them and go one by one
+    return _parse_coordinates_slow(_COMMA_SPACING.sub(',', coords_text).split())
+
+
+def _parse_boundary_rings(boundary_elem):
+    """Parse every LinearRing found under an outer/inner boundary element"""
+    rings = []
+    for coords_elem in _kml_descendants(boundary_elem, 'coordinates'):
+        if coords_elem.text:
+            ring = _parse_coordinates(coords_elem.text)
+            if len(ring) >= 3:  # Need at least 3 points for a ring
+                rings.append(ring)
+    return rings
+
+
+def _parse_polygon_element(polygon_elem):
+    """Parse a KML Polygon into its outer ring and holes, or None if it has no usable outer ring"""
+    outer_rings = []
+    holes = []
+    for child in polygon_elem:
+        tag = _kml_tag(child)
+        if tag == 'outerBoundaryIs':
+            outer_rings.extend(_parse_boundary_rings(child))
+        elif tag == 'innerBoundaryIs':
+            holes.extend(_parse_boundary_rings(child))
+
+    if not outer_rings:
+        return None
+    return {'coordinates': outer_rings[0], 'holes': holes}
+
+
+def read_validated_kml(fileobj, max_bytes=MAX_KML_BYTES, max_elements=MAX_KML_ELEMENTS, chunk_size=64 * 1024):
+    """Read KML from a binary file object, checking it while it streams in.
+
+    The document is fed to an incremental parser chunk by chunk, so malformed
+    XML, a non-KML root, entity declarations or content over max_bytes /
+    max_elements are rejected as soon as they are seen, without reading the
+    rest. Returns the content as bytes; raises KmlValidationError.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    chunks = []
+    total = 0
+    elements = 0
+    tail = b''
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise KmlValidationError(f"KML is larger than the {max_bytes / (1024 * 1024):g} MB limit")
+        # Entity declarations are never needed in KML and allow expansion attacks
+        if b'<!ENTITY' in tail + chunk:
+            raise KmlValidationError("KML must not declare XML entities")
+        tail = chunk[-8:]
+        chunks.append(chunk)
+        try:
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'end':
+                    elem.clear()  # Only the structure is checked here, so keep memory flat
+                    continue
+                if elements == 0 and _kml_tag(elem) != 'kml':
+                    raise KmlValidationError(f"Root element is <{_kml_tag(elem)}>, expected <kml>")
+                elements += 1
+                if elements > max_elements:
+                    raise KmlValidationError(f"KML has more than {max_elements} elements")
+        except ET.ParseError as e:
+            raise KmlValidationError(f"Invalid XML: {e}") from e
+
+    try:
+        parser.close()
+    except ET.ParseError as e:
+        raise KmlValidationError(f"Invalid XML: {e}") from e
+    if elements == 0:
+        raise KmlValidationError("KML content is empty")
+    return b''.join(chunks)
+
+
+def parse_kml(kml_content):
+    """Parse KML content and extract polygons with their holes.
+
+    Each Placemark becomes one polygon record whose 'parts' hold every
+    Polygon of the placemark (several for a MultiGeometry), each part being
+    an outer ring plus its innerBoundaryIs holes as (n, 2) arrays of lon, lat.
+
+    Returns (polygons, warnings), warnings describing placemarks that could
+    not be parsed. Raises ET.ParseError if the content is not valid XML.
+    """
+    root = ET.fromstring(kml_content)
+
+    # Group Polygon elements by Placemark so MultiGeometry stays one area;
+    # bare Polygons outside any Placemark are treated as their own area
+    groups = []
+    grouped = set()
+    for placemark in _kml_descendants(root, 'Placemark'):
+        polygon_elements = _kml_descendants(placemark, 'Polygon')
+        if polygon_elements:
+            groups.append((placemark, polygon_elements))
+            grouped.update(id(elem) for elem in polygon_elements)
+    for polygon_elem in _kml_descendants(root, 'Polygon'):
+        if id(polygon_elem) not in grouped:
+            groups.append((None, [polygon_elem]))
+
+    polygons = []
+    warnings = []
+
+    for i, (placemark, polygon_elements) in enumerate(groups):
+        try:
+            parts = []
+            for polygon_elem in polygon_elements:
+                part = _parse_polygon_element(polygon_elem)
+                if part is not None:
+                    parts.append(part)
+
+            if parts:
+                # Try to find a name for the polygon
+                name = f"Polygon {i+1}"
+                if placemark is not None:
+                    for child in placemark:
+                        if _kml_tag(child) == 'name' and child.text and child.text.strip():
+                            name = child.text.strip()
+                            break
+
+                polygons.append({
+                    'name': name,
+                    'parts': parts,
+                    'id': f"kml_polygon_{i}"
+                })
+        except Exception as e:
+            warnings.append(f"Error parsing polygon {i+1}: {str(e)}")
+            continue
+
+    return polygons, warnings
+
+
+def build_polygon_geometry(polygon_record):
+    """Build a shapely Polygon or MultiPolygon, holes included, from a parsed KML polygon record"""
+    shapes = [Polygon(part['coordinates'], part['holes']) for part in polygon_record['parts']]
+    if len(shapes) == 1:
+        return shapes[0]
+    return MultiPolygon(shapes)
@@ -0,0 +1,391 @@
+"""Load test of app.py: many simulated sessions against a local fake geocoder.
+
+Each session is driven headlessly with Streamlit's app testing API: it
+opens the app, uploads sample_polygons.kml, analyzes a KML polygon, draws a
+rectangle on the map and extracts its addresses. All sessions of a level
+start together in one process, so they share the process-wide caches,
+rate limiter and stores just like the users of one app instance. Reverse
+geocoding goes to a local HTTP server that answers in Nominatim's format
+after a configurable delay; the app is pointed at it through
+NOMINATIM_DOMAIN / NOMINATIM_SCHEME, and stores go to a temporary folder.
+With --replicas N, N such servers are started and listed in
+NOMINATIM_BACKENDS, each with its own rate limit, to see how throughput
+scales with the number of geocoder replicas. Running sessions side by side
+relies on Streamlit internals, so the harness only runs on the Streamlit
+version it was written for (TESTED_STREAMLIT).
+
+Usage:
+
+    python loadtest.py --sessions 1,2,4,8 --geocoder-latency 0.05
+    python loadtest.py --sessions 4 --replicas 3 --min-interval 0.1
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, 'app.py')
+SAMPLE_KML = os.path.join(HERE, 'sample_polygons.kml')
+HOUSE_SPACING = 0.0003  # Degrees between the fake geocoder's houses
+TESTED_STREAMLIT = '1.66'  # Minor version whose internals _isolate_test_sessions patches
+MAP_WIDGET_KEY = re.compile(r'^\$\$ID-[0-9a-f]{32}-([0-9a-f]{64})$')  # st_folium's generated widget key
+
+
+class FakeNominatim(ThreadingHTTPServer):
+    """Local server answering /reverse and /search like Nominatim, after latency seconds.
+
+    Every point resolves to the house of the HOUSE_SPACING cell it falls
+    in, so denser grids find the same houses more than once, as in reality.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, port=0):
+        super().__init__(('127.0.0.1', port), _FakeNominatimHandler)
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def domain(self):
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+class _FakeNominatimHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.count()
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith('/reverse'):
+            body = self._reverse(float(query['lat']), float(query['lon']))
+        else:
+            body = []
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reverse(self, lat, lon):
+        row, col = round(lat / HOUSE_SPACING), round(lon / HOUSE_SPACING)
+        house_lat, house_lon = row * HOUSE_SPACING, col * HOUSE_SPACING
+        return {
+            'place_id': row * 1000003 + col,
+            'lat': str(house_lat),
+            'lon': str(house_lon),
+            'display_name': f"{abs(col) % 10000} Row {abs(row) % 10000} Street, Testville, Texas, 75000, United States",
+            'address': {
+                'house_number': str(abs(col) % 10000),
+                'road': f"Row {abs(row) % 10000} Street",
+                'city': 'Testville',
+                'state': 'Texas',
+                'postcode': '75000',
+                'country': 'United States',
+            },
+        }
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _drawn_rectangle(kml_content, size):
+    """GeoJSON drawing of a size-degree square in the middle of the first KML polygon"""
+    from kml_parser import parse_kml, build_polygon_geometry
+
+    polygons, _ = parse_kml(kml_content)
+    center = build_polygon_geometry(polygons[0]).centroid
+    lon, lat = center.x - size / 2, center.y - size / 2
+    ring = [[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]
+    return {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+
+
+def _map_widget_key(at, attempts=3):
+    """User key of the st_folium widget, rerunning until it settles.
+
+    st_folium derives the key from the map's content, which changes when
+    new results are drawn, and the old key lingers for a run.
+    """
+    previous = None
+    for _ in range(attempts):
+        at.run()
+        state = at.session_state._state._state
+        keys = [match.group(1) for match in map(MAP_WIDGET_KEY.match, state._keys()) if match]
+        key = keys[0] if len(keys) == 1 else None
+        if key is not None and key == previous:
+            return key
+        previous = key
+    return None
+
+
+def _check_streamlit_version():
+    """Exit with a clear message unless Streamlit is the version _isolate_test_sessions was written for.
+
+    It patches private internals (Runtime, config.get_option, the AppTest
+    script runner, the script cache and session state), which change
+    between releases without notice, so any other version may fail in
+    confusing ways or measure something else.
+    """
+    import streamlit
+
+    version = streamlit.__version__
+    if '.'.join(version.split('.')[:2]) != TESTED_STREAMLIT:
+        sys.exit(
+            f"loadtest.py patches Streamlit {TESTED_STREAMLIT} internals to run sessions side by side, "
+            f"but Streamlit {version} is installed. Install streamlit=={TESTED_STREAMLIT}.* in the load-test "
+            f"environment, or check _isolate_test_sessions against {version} and update TESTED_STREAMLIT."
+        )
+
+
+def _isolate_test_sessions():
+    """Let AppTest sessions run at the same time in one process, each with its own runtime, as a server's do.
+
+    Every AppTest run installs its stand-in Runtime in the class-wide
+    singleton and removes it when it finishes, and patches config.get_option
+    for the run's duration; runs in other threads would find another
+    session's runtime, or none, and lose the app-testing option midway, so
+    their widget values go unrecorded. Here each run's runtime is remembered
+    by the thread that created it and by its script runner, whose script
+    thread looks it up through its run context, and the app-testing option
+    is switched on once for the whole process. Each run also compiles the
+    script anew, and compiling in several threads at once trips a CPython
+    3.11 bug, so the bytecode is compiled once and shared, like a server's
+    script cache does.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.scriptrunner_utils.script_run_context import get_script_run_ctx
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    session = threading.local()
+
+    def runtime_mock(*args, **kwargs):
+        mock = MagicMock(*args, **kwargs)
+        if kwargs.get('spec') is Runtime:
+            session.runtime = mock
+        return mock
+    app_test.MagicMock = runtime_mock
+
+    class SessionScriptRunner(LocalScriptRunner):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._uploaded_file_mgr.session_runtime = session.runtime
+    app_test.LocalScriptRunner = SessionScriptRunner
+
+    def current_runtime():
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None and getattr(ctx.uploaded_file_mgr, 'session_runtime', None) is not None:
+            return ctx.uploaded_file_mgr.session_runtime
+        return getattr(session, 'runtime', None)
+
+    def instance(cls):
+        runtime = current_runtime()
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: current_runtime() is not None)
+
+    config.get_option = build_mock_config_get_option({'global.appTest': True})
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+    compile_script = ScriptCache.get_bytecode
+    compiled = {}
+    compile_lock = threading.Lock()
+
+    def get_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = compile_script(self, script_path)
+            return compiled[script_path]
+    ScriptCache.get_bytecode = get_bytecode
+
+
+def run_session(kml_content, drawing, grid_size, timeout):
+    """Drive one session through the scenario; returns its measurements"""
+    from streamlit.testing.v1 import AppTest
+    from records import estimate_memory
+
+    stats = {'jobs': {}, 'errors': []}
+
+    def check(at, step):
+        stats['errors'].extend(f"{step}: {e.message}" for e in at.exception)
+        stats['errors'].extend(f"{step}: {e.value}" for e in at.error)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout).run()
+    check(at, 'open')
+    # Always geocode: a result stored by an earlier session would skip the work being measured
+    at.checkbox(key='force_refresh').check()
+    at.slider[0].set_value(grid_size)
+    at.file_uploader[0].upload(os.path.basename(SAMPLE_KML), kml_content, 'application/vnd.google-earth.kml+xml')
+    at.run()
+    check(at, 'upload')
+
+    started = time.perf_counter()
+    at.button(key='analyze_kml').click().run()
+    stats['jobs']['kml'] = time.perf_counter() - started
+    check(at, 'analyze KML polygon')
+
+    map_key = _map_widget_key(at)
+    if map_key is None:
+        stats['errors'].append("draw: map widget not found")
+    else:
+        at.session_state[map_key] = {'all_drawings': [drawing]}
+        at.run()
+        check(at, 'draw')
+        extract = [button for button in at.button if button.label == "Extract Addresses"]
+        if extract:
+            started = time.perf_counter()
+            extract[0].click().run()
+            stats['jobs']['draw'] = time.perf_counter() - started
+            check(at, 'extract drawn area')
+        else:
+            stats['errors'].append("draw: Extract Addresses button not shown")
+
+    # The app's own per-run timing and per-session memory estimate, as shown in Diagnostics
+    stats['script_runs'] = [timing['total'] for timing in at.session_state.run_timings]
+    stats['memory'] = sum(estimate_memory(
+        at.session_state.cache,
+        [result['addresses'] for result in at.session_state.selected_polygon_results.values()]
+    ))
+    return stats
+
+
+def run_level(sessions, kml_content, drawing, grid_size, timeout):
+    """Run sessions simultaneously; returns their stats and the wall time of the level"""
+    results = [None] * sessions
+    barrier = threading.Barrier(sessions)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = run_session(kml_content, drawing, grid_size, timeout)
+        except Exception as e:
+            results[index] = {'jobs': {}, 'errors': [f"session crashed: {e!r}"], 'script_runs': [], 'memory': 0}
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f'session-{i}') for i in range(sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def summarize(sessions, results, wall_time, geocoder_requests):
+    """One report row for a concurrency level"""
+    script_runs = [seconds for stats in results for seconds in stats['script_runs']]
+    kml_jobs = [stats['jobs']['kml'] for stats in results if 'kml' in stats['jobs']]
+    draw_jobs = [stats['jobs']['draw'] for stats in results if 'draw' in stats['jobs']]
+    return {
+        'sessions': sessions,
+        'script_p50_ms': _percentile(script_runs, 0.5) * 1000,
+        'script_p95_ms': _percentile(script_runs, 0.95) * 1000,
+        'kml_job_p50_s': _percentile(kml_jobs, 0.5),
+        'kml_job_max_s': max(kml_jobs, default=float('nan')),
+        'draw_job_p50_s': _percentile(draw_jobs, 0.5),
+        'draw_job_max_s': max(draw_jobs, default=float('nan')),
+        'memory_per_session_kib': statistics.mean(stats['memory'] for stats in results) / 1024,
+        'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'geocoder_requests': geocoder_requests,
+        'wall_s': wall_time,
+        'errors': sum(len(stats['errors']) for stats in results),
+    }
+
+
+REPORT_COLUMNS = [
+    ('sessions', "{:>8}"), ('script_p50_ms', "{:>13.0f}"), ('script_p95_ms', "{:>13.0f}"),
+    ('kml_job_p50_s', "{:>13.2f}"), ('kml_job_max_s', "{:>13.2f}"),
+    ('draw_job_p50_s', "{:>14.2f}"), ('draw_job_max_s', "{:>14.2f}"),
+    ('memory_per_session_kib', "{:>22.0f}"), ('max_rss_mib', "{:>11.0f}"),
+    ('geocoder_requests', "{:>17}"), ('wall_s', "{:>8.1f}"), ('errors', "{:>6}"),
+]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test app.py with simulated sessions and a local fake geocoder")
+    parser.add_argument('--sessions', default='1,2,4,8', help="Comma-separated numbers of concurrent sessions")
+    parser.add_argument('--grid-size', type=float, default=0.0005, help="Grid spacing in degrees used by every session")
+    parser.add_argument('--draw-size', type=float, default=0.002, help="Side in degrees of the rectangle each session draws")
+    parser.add_argument('--geocoder-latency', type=float, default=0.05, help="Seconds the fake geocoder takes per request")
+    parser.add_argument('--min-interval', type=float, default=0.0, help="Seconds between geocoder requests (app rate limit)")
+    parser.add_argument('--replicas', type=int, default=1, help="Fake geocoder servers to spread requests over")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds allowed for one script run")
+    parser.add_argument('--json', help="Also write the report rows to this JSON file")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Print every session error")
+    args = parser.parse_args(argv)
+    _check_streamlit_version()
+
+    levels = [int(level) for level in args.sessions.split(',') if level.strip()]
+    servers = [FakeNominatim(args.geocoder_latency) for _ in range(max(1, args.replicas))]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, name='fake-nominatim', daemon=True).start()
+
+    # Point the app at the fake geocoder and throwaway stores before it is first run
+    work_dir = tempfile.mkdtemp(prefix='polygon-extractor-loadtest-')
+    os.environ.update({
+        'NOMINATIM_DOMAIN': servers[0].domain,
+        'NOMINATIM_BACKENDS': ', '.join(f"http://{server.domain}" for server in servers) if len(servers) > 1 else '',
+        'NOMINATIM_SCHEME': 'http',
+        'GEOCODE_MIN_INTERVAL': str(args.min_interval),
+        'POLYGON_STORE_DIR': os.path.join(work_dir, 'polygons'),
+        'RESULT_STORE_PATH': os.path.join(work_dir, 'results.sqlite3'),
+    })
+    sys.path.insert(0, HERE)
+    _isolate_test_sessions()
+
+    with open(SAMPLE_KML, 'rb') as f:
+        kml_content = f.read()
+    drawing = _drawn_rectangle(kml_content, args.draw_size)
+
+    print('  '.join(re.sub(r'\.\d+f', '', fmt).format(name) for name, fmt in REPORT_COLUMNS))
+    rows = []
+    try:
+        for sessions in levels:
+            requests_before = sum(server.requests for server in servers)
+            results, wall_time = run_level(sessions, kml_content, drawing, args.grid_size, args.timeout)
+            row = summarize(sessions, results, wall_time, sum(server.requests for server in servers) - requests_before)
+            rows.append(row)
+            print('  '.join(fmt.format(row[name]) for name, fmt in REPORT_COLUMNS), flush=True)
+            if args.verbose:
+                for index, stats in enumerate(results):
+                    for message in stats['errors']:
+                        print(f"  session {index}: {message}", file=sys.stderr)
+    finally:
+        for server in servers:
+            server.shutdown()
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+    return 1 if any(row['errors'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Shared polygon catalog: uploaded KML files and their parsed polygons.
+
+Every KML is catalogued once under the SHA-1 of its content, so the same file
+uploaded again, by any session or page, is neither parsed nor stored
+twice. Polygons are rows of a SQLite database with an R-tree index on their
+bounding boxes, so callers fetch only the polygons in a map viewport or a
+single polygon by id instead of holding whole files in memory. The
+database lives in a folder in the system temp directory by default, which
+can be set with POLYGON_STORE_DIR.
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from kml_parser import parse_kml
+
+DEFAULT_STORE_DIR = os.environ.get(
+    'POLYGON_STORE_DIR', os.path.join(tempfile.gettempdir(), 'polygon-extractor-store')
+)
+CATALOG_FILENAME = 'catalog.sqlite3'
+
+
+def content_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+def _encode_ring(ring):
+    """Coordinate array as base64 of little-endian doubles, exact and compact in JSON"""
+    return base64.b64encode(np.ascontiguousarray(ring, dtype='<f8').tobytes()).decode('ascii')
+
+
+def _decode_ring(data):
+    return np.frombuffer(base64.b64decode(data), dtype='<f8').reshape(-1, 2)
+
+
+def _encode_parts(parts):
+    return json.dumps([
+        {'coordinates': _encode_ring(part['coordinates']), 'holes': [_encode_ring(hole) for hole in part['holes']]}
+        for part in parts
+    ])
+
+
+def _decode_parts(data):
+    return [
+        {'coordinates': _decode_ring(part['coordinates']), 'holes': [_decode_ring(hole) for hole in part['holes']]}
+        for part in json.loads(data)
+    ]
+
+
+def _bounds(parts):
+    """(min_lon, min_lat, max_lon, max_lat) of the outer rings of a polygon's parts"""
+    outer = np.concatenate([part['coordinates'] for part in parts])
+    return (*outer.min(axis=0).tolist(), *outer.max(axis=0).tolist())
+
+
+class PolygonStore:
+    """SQLite catalog of KML files with their polygons, indexed by bounding box.
+
+    Polygon records are dicts of name, id and parts, as returned by
+    kml_parser.parse_kml, with rings as (n, 2) arrays of lon, lat.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, CATALOG_FILENAME)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS kml_files ('
+                'hash TEXT PRIMARY KEY, name TEXT, created REAL, polygon_count INTEGER)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS polygons ('
+                'rowid INTEGER PRIMARY KEY, kml_hash TEXT, position INTEGER, polygon_id TEXT, name TEXT, parts TEXT)'
+            )
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS polygons_by_id ON polygons (kml_hash, polygon_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS polygons_by_position ON polygons (kml_hash, position)')
+            conn.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS polygon_bounds USING rtree(id, min_lon, max_lon, min_lat, max_lat)'
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Connection committed on success and always closed; one per call so any thread may use the store"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add(self, content, name):
+        """Parse and store KML content; returns (kml_hash, warnings).
+
+        Content that is already stored is not parsed again. Raises
+        ValueError if it holds no polygons.
+        """
+        kml_hash = content_hash(content)
+        with self._connect() as conn:
+            if conn.execute('SELECT 1 FROM kml_files WHERE hash = ?', (kml_hash,)).fetchone():
+                return kml_hash, []
+
+        polygons, warnings = parse_kml(content)
+        if not polygons:
+            raise ValueError("No polygons found in the KML content")
+        with self._connect() as conn:
+            # INSERT OR IGNORE: another session may have stored the same file meanwhile
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO kml_files (hash, name, created, polygon_count) VALUES (?, ?, ?, ?)',
+                (kml_hash, name, time.time(), len(polygons))
+            )
+            if cursor.rowcount:
+                for position, polygon in enumerate(polygons):
+                    rowid = conn.execute(
+                        'INSERT INTO polygons (kml_hash, position, polygon_id, name, parts) VALUES (?, ?, ?, ?, ?)',
+                        (kml_hash, position, polygon['id'], polygon['name'], _encode_parts(polygon['parts']))
+                    ).lastrowid
+                    min_lon, min_lat, max_lon, max_lat = _bounds(polygon['parts'])
+                    conn.execute(
+                        'INSERT INTO polygon_bounds VALUES (?, ?, ?, ?, ?)',
+                        (rowid, min_lon, max_lon, min_lat, max_lat)
+                    )
+        return kml_hash, warnings
+
+    def list(self):
+        """(kml_hash, name, polygon count, created) of every entry, newest first"""
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT hash, name, polygon_count, created FROM kml_files ORDER BY created DESC'
+            ).fetchall()
+
+    def summaries(self, kml_hash):
+        """(polygon id, name) of every polygon of a stored KML, in file order, without their geometry"""
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT polygon_id, name FROM polygons WHERE kml_hash = ? ORDER BY position', (kml_hash,)
+            ).fetchall()
+
+    def bounds(self, kml_hash):
+        """(min_lon, min_lat, max_lon, max_lat) of all polygons of a stored KML; raises KeyError if it is not stored"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT MIN(b.min_lon), MIN(b.min_lat), MAX(b.max_lon), MAX(b.max_lat) '
+                'FROM polygons p JOIN polygon_bounds b ON b.id = p.rowid WHERE p.kml_hash = ?', (kml_hash,)
+            ).fetchone()
+        if row[0] is None:
+            raise KeyError(kml_hash)
+        return row
+
+    def get(self, kml_hash, polygon_id):
+        """Polygon record by id; raises KeyError if it is not stored"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT polygon_id, name, parts FROM polygons WHERE kml_hash = ? AND polygon_id = ?',
+                (kml_hash, polygon_id)
+            ).fetchone()
+        if row is None:
+            raise KeyError(polygon_id)
+        return {'id': row[0], 'name': row[1], 'parts': _decode_parts(row[2])}
+
+    def query(self, kml_hash, bounds=None, limit=None):
+        """Polygon records of a stored KML whose bounding box meets bounds, in file order.
+
+        bounds is (min_lon, min_lat, max_lon, max_lat); None returns every
+        polygon. At most limit records are returned when limit is set.
+        """
+        if bounds is None:
+            sql = 'SELECT p.polygon_id, p.name, p.parts FROM polygons p WHERE p.kml_hash = ?'
+            params = [kml_hash]
+        else:
+            # CROSS JOIN keeps the R-tree as the outer loop, so only polygons whose
+            # box meets the viewport are read, then sorted and limited
+            min_lon, min_lat, max_lon, max_lat = bounds
+            sql = (
+                'SELECT p.polygon_id, p.name, p.parts FROM polygon_bounds b CROSS JOIN polygons p ON p.rowid = b.id'
+                ' WHERE b.max_lon >= ? AND b.min_lon <= ? AND b.max_lat >= ? AND b.min_lat <= ? AND p.kml_hash = ?'
+            )
+            params = [min_lon, max_lon, min_lat, max_lat, kml_hash]
+        sql += ' ORDER BY p.position'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [{'id': polygon_id, 'name': name, 'parts': _decode_parts(parts)} for polygon_id, name, parts in rows]
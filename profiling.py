@@ -0,0 +1,98 @@
+"""Opt-in profiling of single extraction runs.
+
+profile_run wraps one run in cProfile and in a wall-clock stack sampler and
+saves, under the run id, a .prof file (for pstats or snakeviz) and a
+.folded file of "frame;frame;frame count" lines that flamegraph.pl or
+speedscope turn into a flame graph. The sampler also sees time spent
+waiting, such as geocoder round trips and rate-limit sleeps, which cProfile
+attributes to the C calls in which they happen. When profiling is off
+nothing is started, so the cost is a single check.
+
+Profiling is switched on for every run with PROFILE_EXTRACTIONS=1; profiles
+go to PROFILE_DIR, a folder in the system temp directory by default.
+"""
+import cProfile
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILING_ENABLED = os.environ.get('PROFILE_EXTRACTIONS', '').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'polygon-extractor-profiles'))
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+
+
+class StackSampler:
+    """Background thread counting the stacks of one thread, folded for flame graphs"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.counts[';'.join(reversed(frames))] += 1
+
+    def folded(self):
+        """Folded stack lines, busiest first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class RunProfile:
+    """Where a run's profile is saved; the files exist once the run has ended"""
+
+    def __init__(self, run_id, directory):
+        self.run_id = run_id
+        self.started = time.time()
+        self.duration = None
+        self.prof_path = os.path.join(directory, f"{run_id}.prof")
+        self.folded_path = os.path.join(directory, f"{run_id}.folded")
+
+
+@contextmanager
+def profile_run(run_id, enabled=True, directory=PROFILE_DIR):
+    """Profile the enclosed block of the current thread under run_id.
+
+    Yields a RunProfile, or None when not enabled. The profile is saved
+    even if the block raises, so interrupted runs are kept too.
+    """
+    if not enabled:
+        yield None
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    profile = RunProfile(run_id, directory)
+    sampler = StackSampler(threading.get_ident())
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield profile
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profile.duration = time.perf_counter() - started
+        profiler.dump_stats(profile.prof_path)
+        with open(profile.folded_path, 'w', encoding='utf-8') as f:
+            f.write(sampler.folded())
@@ -0,0 +1,150 @@
+"""Compact in-memory representation of geocoding results.
+
+The geocode cache and every analysis result hold the same GeocodeResult
+objects, so an address found by several analyses is stored once.
+"""
+import sys
+from array import array
+
+
+def intern_field(value):
+    """Intern a repeated address component so equal strings share one object"""
+    return sys.intern(value) if value else ''
+
+
+# Address keys naming the place and the region, most specific first
+CITY_FIELDS = ('city', 'town', 'village', 'municipality', 'hamlet')
+STATE_FIELDS = ('state', 'province', 'region', 'state_district')
+
+
+def first_field(address_info, keys):
+    """Value of the first of keys present in a Nominatim address, or ''"""
+    return next((address_info[key] for key in keys if address_info.get(key)), '')
+
+
+class GeocodeResult:
+    """Slimmed-down geocode result keeping only the fields the app uses"""
+
+    __slots__ = ('address', 'postcode', 'city', 'state', 'country')
+
+    def __init__(self, address, postcode='', city='', state='', country=''):
+        self.address = address
+        self.postcode = intern_field(postcode)
+        self.city = intern_field(city)
+        self.state = intern_field(state)
+        self.country = intern_field(country)
+
+    @classmethod
+    def from_location(cls, location):
+        """Build a result from a geopy Location, dropping the raw response.
+
+        Nominatim names the place by its size (city, town, village, ...)
+        and the region by country, so the first present of each is used;
+        this gives the same fields whichever server or version answered.
+        """
+        address_info = location.raw.get('address', {})
+        return cls(
+            location.address,
+            address_info.get('postcode', ''),
+            first_field(address_info, CITY_FIELDS),
+            first_field(address_info, STATE_FIELDS),
+            address_info.get('country', '')
+        )
+
+    def __repr__(self):
+        return f"GeocodeResult({self.address!r})"
+
+
+class SearchResult:
+    """Forward-geocoding result for a location search"""
+
+    __slots__ = ('address', 'latitude', 'longitude')
+
+    def __init__(self, address, latitude, longitude):
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __repr__(self):
+        return f"SearchResult({self.address!r})"
+
+
+class AddressTable:
+    """Columnar, append-only table of the unique addresses found by one analysis"""
+
+    __slots__ = ('latitudes', 'longitudes', 'results')
+
+    def __init__(self):
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.results = []
+
+    def __len__(self):
+        return len(self.results)
+
+    def append(self, lat, lon, result):
+        self.latitudes.append(lat)
+        self.longitudes.append(lon)
+        self.results.append(result)
+
+    def extend(self, other):
+        self.latitudes.extend(other.latitudes)
+        self.longitudes.extend(other.longitudes)
+        self.results.extend(other.results)
+
+    def marker_rows(self):
+        """Return [lat, lon, address] rows, the data array of a client-side marker layer"""
+        return [
+            [lat, lon, result.address]
+            for lat, lon, result in zip(self.latitudes, self.longitudes, self.results)
+        ]
+
+    def columns(self):
+        """Return the table as a dict of column lists, ready for pd.DataFrame"""
+        return {
+            'Latitude': self.latitudes.tolist(),
+            'Longitude': self.longitudes.tolist(),
+            'Address': [r.address for r in self.results],
+            'Postal Code': [r.postcode for r in self.results],
+            'City': [r.city for r in self.results],
+            'State': [r.state for r in self.results],
+            'Country': [r.country for r in self.results],
+        }
+
+
+def _result_bytes(result, seen):
+    """Size of a result plus the strings not already counted in seen"""
+    size = sys.getsizeof(result)
+    for field in GeocodeResult.__slots__:
+        value = getattr(result, field)
+        if id(value) not in seen:
+            seen.add(id(value))
+            size += sys.getsizeof(value)
+    return size
+
+
+def estimate_memory(cache, tables):
+    """Estimate bytes held by the geocode cache and result tables.
+
+    Objects shared between the cache and tables (results and interned
+    strings) are counted once. Returns (cache_bytes, tables_bytes).
+    """
+    seen = set()
+    cache_bytes = sys.getsizeof(cache)
+    for key, result in cache.items():
+        cache_bytes += sys.getsizeof(key)
+        if result is not None and id(result) not in seen:
+            seen.add(id(result))
+            cache_bytes += _result_bytes(result, seen)
+
+    tables_bytes = 0
+    for table in tables:
+        tables_bytes += (
+            sys.getsizeof(table.latitudes) + sys.getsizeof(table.longitudes)
+            + sys.getsizeof(table.results)
+        )
+        for result in table.results:
+            if id(result) not in seen:
+                seen.add(id(result))
+                tables_bytes += _result_bytes(result, seen)
+    return cache_bytes, tables_bytes
@@ -0,0 +1,113 @@
+"""Persistent store of finished analyses, shared by every session.
+
+Results are keyed by a canonical hash of the analyzed geometry together
+with the sampling settings and geocoder backend, so the same area analyzed
+again (another upload of the same KML, a new tab, an identical drawn
+rectangle) is answered from disk. The store is a SQLite file, by default
+in the system temp directory, configurable with RESULT_STORE_PATH. With a
+max_age, results expire like geocode cache entries, so addresses that
+changed are eventually looked up again.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import shapely
+
+from records import AddressTable, GeocodeResult
+
+DEFAULT_STORE_PATH = os.environ.get(
+    'RESULT_STORE_PATH', os.path.join(tempfile.gettempdir(), 'polygon-extractor-results.sqlite3')
+)
+GEOMETRY_PRECISION = 1e-7  # Degrees; about 1 cm, well below any grid spacing
+
+
+def geometry_hash(geometry):
+    """Hash of a geometry that ignores ring orientation, starting vertex and float noise"""
+    # Pointwise rounding never re-nodes, so invalid geometry (self-intersecting, overlapping parts) hashes too
+    canonical = shapely.normalize(shapely.set_precision(geometry, GEOMETRY_PRECISION, mode='pointwise'))
+    return hashlib.sha1(shapely.to_wkb(canonical, hex=True).encode('ascii')).hexdigest()
+
+
+def result_key(geometry, grid_size, sampler, backend):
+    """Store key of one analysis: geometry, grid spacing, sampler name and geocoder backend"""
+    parts = [geometry_hash(geometry), f"{grid_size:.8f}", sampler, backend]
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+
+def _encode_table(table):
+    rows = [
+        [lat, lon, r.address, r.postcode, r.city, r.state, r.country]
+        for lat, lon, r in zip(table.latitudes, table.longitudes, table.results)
+    ]
+    return gzip.compress(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def _decode_table(data):
+    table = AddressTable()
+    for lat, lon, address, postcode, city, state, country in json.loads(gzip.decompress(data)):
+        table.append(lat, lon, GeocodeResult(address, postcode, city, state, country))
+    return table
+
+
+class ResultStore:
+    """SQLite table of address tables by result_key, with the time each was stored.
+
+    Results older than max_age seconds (if given) are not returned, and are
+    deleted whenever a new result is stored.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, name TEXT, created REAL, house_count INTEGER, data BLOB)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+
+    @contextmanager
+    def _connect(self):
+        """Connection committed on success and always closed; one per call so any thread may use the store"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _oldest_kept(self):
+        return time.time() - self.max_age if self.max_age is not None else float('-inf')
+
+    def get(self, key):
+        """Return (AddressTable, created timestamp) for key, or None if nothing unexpired is stored"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT data, created FROM results WHERE key = ? AND created >= ?', (key, self._oldest_kept())
+            ).fetchone()
+        if row is None:
+            return None
+        return _decode_table(row[0]), row[1]
+
+    def put(self, key, name, table):
+        """Store a finished analysis, replacing any older result for the same key"""
+        with self._connect() as conn:
+            if self.max_age is not None:
+                conn.execute('DELETE FROM results WHERE created < ?', (self._oldest_kept(),))
+            conn.execute(
+                'INSERT OR REPLACE INTO results (key, name, created, house_count, data) VALUES (?, ?, ?, ?, ?)',
+                (key, name, time.time(), len(table), _encode_table(table))
+            )
+
+    def stats(self):
+        """(number of stored results, total compressed bytes)"""
+        with self._connect() as conn:
+            count, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM results').fetchone()
+        return count, size
@@ -0,0 +1,66 @@
+import io
+import json
+import zipfile
+
+from bulk_kml import convert, open_features
+from kml_parser import parse_kml
+
+CSV = '''id,name,coordinates
+1,Block A,"-96.0,33.0 -95.99,33.0 -95.99,33.01"
+2,Broken,"-96.0,33.0 east,north -95.99,33.01"
+3,Block B,"-96.1,33.1;-96.09,33.1;-96.09,33.11;-96.1,33.1"
+'''
+
+FEATURES = [
+    {
+        'type': 'Feature', 'id': 'park', 'properties': {'name': 'Park'},
+        'geometry': {'type': 'Polygon', 'coordinates': [
+            [[-96.0, 33.0], [-95.9, 33.0], [-95.9, 33.1], [-96.0, 33.1], [-96.0, 33.0]],
+            [[-95.97, 33.03], [-95.93, 33.03], [-95.93, 33.07], [-95.97, 33.03]],
+        ]},
+    },
+    {
+        'type': 'Feature', 'properties': {'name': 'Islands'},
+        'geometry': {'type': 'MultiPolygon', 'coordinates': [
+            [[[-96.2, 33.2], [-96.1, 33.2], [-96.1, 33.3], [-96.2, 33.2]]],
+            [[[-96.4, 33.4], [-96.3, 33.4], [-96.3, 33.5], [-96.4, 33.4]]],
+        ]},
+    },
+    {'type': 'Feature', 'properties': {'name': 'Point'}, 'geometry': {'type': 'Point', 'coordinates': [0, 0]}},
+]
+
+
+def convert_text(name, text, kmz=False):
+    output = io.BytesIO()
+    stats = convert(open_features(name, io.StringIO(text)), output, kmz=kmz)
+    content = output.getvalue()
+    if kmz:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            content = archive.read('doc.kml')
+    return stats, parse_kml(content)[0]
+
+
+def test_csv_rows_with_bad_numbers_are_skipped_and_counted():
+    stats, polygons = convert_text('areas.csv', CSV)
+
+    assert [p['name'] for p in polygons] == ['Block A', 'Block B']
+    assert (stats.features, stats.skipped) == (2, 1)
+    # Rings are closed on output; the skipped row adds no vertices
+    assert stats.vertices == 4 + 4
+
+
+def test_geojson_keeps_holes_and_multipolygons():
+    stats, polygons = convert_text('areas.geojson', json.dumps({'type': 'FeatureCollection', 'features': FEATURES}))
+
+    assert [p['name'] for p in polygons] == ['Park', 'Islands']
+    assert len(polygons[0]['parts'][0]['holes']) == 1
+    assert len(polygons[1]['parts']) == 2
+    assert stats.skipped == 1
+
+
+def test_feature_lines_skip_broken_lines_into_kmz():
+    lines = '\n'.join([json.dumps(FEATURES[0]), '{"type": "Feat', '', json.dumps(FEATURES[1])])
+    stats, polygons = convert_text('areas.ndjson', lines, kmz=True)
+
+    assert [p['name'] for p in polygons] == ['Park', 'Islands']
+    assert (stats.features, stats.skipped) == (2, 1)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from density import DensityGrid
+from records import AddressTable, GeocodeResult
+
+
+def test_square_cells_bin_by_metres():
+    grid = DensityGrid(100, shape='square', ref_lat=0)
+    # About 11 m, 22 m and -11 m east of the origin on the equator
+    grid.add([0.0001, 0.0001, 0.0001], [0.0001, 0.0002, -0.0001])
+
+    assert grid.counts == {(0, 0): 2, (-1, 0): 1}
+    assert grid.total == 3
+    assert grid.rows()[0][0] == 'square:0:0'
+
+
+@pytest.mark.parametrize('shape', ['hex', 'square'])
+def test_cell_centres_bin_into_their_own_cell(shape):
+    grid = DensityGrid(250, shape=shape, ref_lat=33)
+    cells = [(0, 0), (3, -2), (-5, 7), (12, 1)]
+    centres = [grid.cell_center(cell) for cell in cells]
+    grid.add([lat for lat, _ in centres], [lon for _, lon in centres])
+
+    assert grid.counts == {cell: 1 for cell in cells}
+
+
+def test_hex_neighbours_are_one_cell_size_apart():
+    grid = DensityGrid(200, shape='hex', ref_lat=0)
+    lat, lon = grid.cell_center((0, 0))
+    east_lat, east_lon = grid.cell_center((1, 0))
+
+    assert lat == pytest.approx(east_lat)
+    assert (east_lon - lon) * 111319.49 == pytest.approx(200, rel=1e-3)
+
+
+def test_reference_latitude_is_rounded_from_the_first_points():
+    grid = DensityGrid(100)
+    grid.add([33.4], [-96.0])
+    assert grid.ref_lat == 33.0
+
+
+def test_sync_only_bins_new_rows():
+    table = AddressTable()
+    grid = DensityGrid(100, shape='square')
+    for i in range(3):
+        table.append(33.0 + i * 1e-5, -96.0, GeocodeResult(f"{i} Main St"))
+    grid.sync(table)
+    grid.sync(table)
+    table.append(34.0, -96.0, GeocodeResult("far away"))
+    grid.sync(table)
+
+    assert grid.total == 4
+    assert sorted(grid.counts.values()) == [1, 3]
+
+
+def test_ring_is_closed_and_surrounds_the_centre():
+    grid = DensityGrid(300, shape='hex', ref_lat=33)
+    ring = np.array(grid.cell_ring((2, 3)))
+    lat, lon = grid.cell_center((2, 3))
+
+    assert len(ring) == 7
+    assert ring[0].tolist() == ring[-1].tolist()
+    assert ring[:, 0].min() < lon < ring[:, 0].max()
+    assert ring[:, 1].min() < lat < ring[:, 1].max()
+
+
+def test_unknown_shape_is_rejected():
+    with pytest.raises(ValueError):
+        DensityGrid(100, shape='triangle')
@@ -0,0 +1,222 @@
+import asyncio
+import time
+
+from shapely.geometry import box
+
+from engine import Budget, ExtractionEngine, grid_sampler, join_points_to_polygons, repeated_lookups
+from geocache import GeocodeCache
+from geocoding import CircuitOpenError
+from grid import generate_grid_points
+from records import GeocodeResult
+
+POINTS = [(33.0, -96.0), (33.0, -96.001), (33.001, -96.0), (33.001, -96.001)]
+
+
+def by_row(lat, lon):
+    """Geocoder giving every point of a grid row the same address"""
+    return GeocodeResult(f"{lat:.3f} Main St")
+
+
+def test_addresses_are_deduplicated_across_batches():
+    engine = ExtractionEngine(by_row)
+    items = list(engine.stream([POINTS[:3], POINTS[3:]]))
+
+    assert [item.is_new for item in items] == [True, False, True, False]
+    assert [(item.batch, item.index, item.batch_size) for item in items] == [(0, 0, 3), (0, 1, 3), (0, 2, 3), (1, 0, 1)]
+    assert [r.address for r in engine.sink.results] == ['33.000 Main St', '33.001 Main St']
+    assert engine.address_hits == {'33.000 Main St': 2, '33.001 Main St': 2}
+    assert engine.coverage() == (1.0, 2)
+
+
+def test_points_without_an_address_are_yielded_but_not_kept():
+    engine = ExtractionEngine(lambda lat, lon: None)
+    items = list(engine.stream([POINTS]))
+
+    assert len(items) == 4
+    assert all(item.result is None and not item.is_new for item in items)
+    assert len(engine.sink) == 0
+    assert engine.failed == 0
+
+
+def test_cache_hits_skip_the_geocoder():
+    cache = GeocodeCache(ttl=60, max_entries=100, max_bytes=1 << 20)
+    list(ExtractionEngine(by_row, cache=cache).stream([POINTS]))
+    engine = ExtractionEngine(by_row, cache=cache)
+    list(engine.stream([POINTS]))
+
+    assert engine.cache_hits == len(POINTS)
+    assert engine.geocoder_calls == 0
+
+
+def test_run_samples_the_polygon():
+    polygon = box(-96.0035, 33.0, -96.0, 33.0035)
+    points = generate_grid_points(polygon, 0.001)
+    engine = ExtractionEngine(by_row)
+    items = list(engine.run(grid_sampler(0.001), polygon))
+
+    assert [(item.lat, item.lon) for item in items] == points
+    assert engine.total_points == len(points)
+    assert len(engine.sink) == len({round(lat, 3) for lat, _ in points})
+
+
+def test_async_stream_matches_stream():
+    async def collect():
+        return [item async for item in ExtractionEngine(by_row).astream([POINTS[:3], POINTS[3:]])]
+
+    def fields(items):
+        return [item._replace(result=item.result.address) for item in items]
+
+    assert fields(asyncio.run(collect())) == fields(ExtractionEngine(by_row).stream([POINTS[:3], POINTS[3:]]))
+
+
+LEFT = box(-96.002, 33.0, -96.0, 33.002)
+RIGHT = box(-96.001, 33.0, -95.999, 33.002)
+FAR = box(-95.0, 34.0, -94.99, 34.01)
+
+
+def test_join_attributes_points_to_every_containing_polygon():
+    resolved = [
+        (33.001, -96.0015, GeocodeResult('left only')),
+        (33.001, -96.0005, GeocodeResult('overlap')),
+        (33.0011, -96.0004, GeocodeResult('overlap')),
+        (33.001, -95.9995, GeocodeResult('right only')),
+        (40.0, -90.0, GeocodeResult('nowhere')),
+    ]
+    left, right, far = join_points_to_polygons(resolved, [LEFT, RIGHT, FAR])
+
+    assert [r.address for r in left.results] == ['left only', 'overlap']
+    assert [r.address for r in right.results] == ['overlap', 'right only']
+    assert len(far) == 0
+    # The first point that found an address is kept for it
+    assert (right.latitudes[0], right.longitudes[0]) == (33.001, -96.0005)
+
+
+def test_join_counts_points_on_a_shared_edge_for_both_polygons():
+    west, east = box(-96.002, 33.0, -96.001, 33.002), box(-96.001, 33.0, -96.0, 33.002)
+    tables = join_points_to_polygons([(33.001, -96.001, GeocodeResult('on the edge'))], [west, east])
+    assert [len(table) for table in tables] == [1, 1]
+
+
+def test_join_of_nothing_gives_empty_tables():
+    assert [len(table) for table in join_points_to_polygons([], [LEFT, RIGHT])] == [0, 0]
+
+
+def test_repeated_lookups_count_points_in_several_polygons():
+    sampled = [(33.001, -96.0015, None), (33.001, -96.0005, None), (33.0011, -96.0004, None), (33.001, -95.9995, None)]
+
+    assert repeated_lookups(sampled, [LEFT, RIGHT]) == 2
+    assert repeated_lookups(sampled, [LEFT, RIGHT, box(-96.01, 32.99, -95.99, 33.01)]) == 6
+    assert repeated_lookups(sampled, [LEFT, FAR]) == 0
+    assert repeated_lookups([], [LEFT, RIGHT]) == 0
+
+
+def test_failed_point_is_requeued_at_the_end_of_its_batch():
+    calls = []
+
+    def flaky(lat, lon):
+        calls.append((lat, lon))
+        if (lat, lon) == POINTS[0] and calls.count(POINTS[0]) == 1:
+            raise ConnectionError("reset")
+        return by_row(lat, lon)
+
+    engine = ExtractionEngine(flaky)
+    items = list(engine.stream([POINTS]))
+
+    assert [(item.lat, item.lon) for item in items] == POINTS[1:] + POINTS[:1]
+    assert [item.index for item in items] == [0, 1, 2, 3]
+    assert engine.requeued == 1
+    assert engine.failed == 0
+    assert items[-1].result is not None
+
+
+def test_point_failing_every_requeue_is_skipped():
+    def broken(lat, lon):
+        raise ConnectionError("down")
+
+    engine = ExtractionEngine(broken, max_requeues=2)
+    items = list(engine.stream([POINTS[:1]]))
+
+    assert len(items) == 1 and items[0].result is None
+    assert engine.geocoder_calls == 3
+    assert engine.requeued == 2
+    assert engine.failed == 1
+
+
+def test_out_of_range_point_fails_without_requeue():
+    def out_of_range(lat, lon):
+        raise ValueError("Coordinates out of valid range")
+
+    engine = ExtractionEngine(out_of_range)
+    list(engine.stream([POINTS[:1]]))
+
+    assert engine.requeued == 0
+    assert engine.failed == 1
+
+
+def test_open_circuit_pauses_then_retries_the_point():
+    pauses = []
+    outage = [CircuitOpenError(5.0)]
+
+    def recovering(lat, lon):
+        if outage:
+            raise outage.pop()
+        return by_row(lat, lon)
+
+    engine = ExtractionEngine(recovering, on_pause=pauses.append)
+    items = list(engine.stream([POINTS[:1]]))
+
+    assert pauses == [5.0]
+    assert engine.pauses == 1
+    assert engine.failed == 0
+    assert items[0].result is not None
+
+
+def test_request_budget_stops_the_run():
+    engine = ExtractionEngine(by_row, budget=Budget(requests=2))
+    items = list(engine.stream([POINTS]))
+
+    assert len(items) == 2
+    assert engine.geocoder_calls == 2
+    assert engine.stopped_early
+    fraction, estimate = engine.coverage()
+    assert fraction == 0.5
+    assert estimate >= len(engine.sink)
+
+
+def test_pauses_never_outlast_the_time_budget():
+    pauses = []
+
+    def open_circuit(lat, lon):
+        raise CircuitOpenError(60.0)
+
+    def pause(seconds):
+        pauses.append(seconds)
+        time.sleep(seconds)
+
+    engine = ExtractionEngine(open_circuit, on_pause=pause, budget=Budget(seconds=0.05))
+    started = time.monotonic()
+    items = list(engine.stream([POINTS]))
+
+    assert items == []
+    assert engine.stopped_early
+    assert engine.failed == 0
+    assert pauses and all(seconds <= 0.05 for seconds in pauses)
+    assert time.monotonic() - started < 1.0
+
+
+def test_cache_hits_do_not_use_up_the_request_budget():
+    cache = GeocodeCache(ttl=60, max_entries=100, max_bytes=1 << 20)
+    list(ExtractionEngine(by_row, cache=cache).stream([POINTS[:2]]))
+    engine = ExtractionEngine(by_row, cache=cache, budget=Budget(requests=1))
+    items = list(engine.stream([POINTS]))
+
+    assert len(items) == 3
+    assert engine.geocoder_calls == 1
+
+
+def test_stratified_run_visits_every_point():
+    polygon = box(-96.0035, 33.0, -96.0, 33.0035)
+    engine = ExtractionEngine(by_row)
+    items = list(engine.run(grid_sampler(0.001, stratified=True), polygon))
+
+    assert sorted((item.lat, item.lon) for item in items) == sorted(generate_grid_points(polygon, 0.001))
@@ -0,0 +1,97 @@
+import gzip
+import io
+import time
+
+import pytest
+
+from geocache import GeocodeCache, export_snapshot, get_cache_key, import_snapshot, read_snapshot
+from records import GeocodeResult
+
+
+def result(name):
+    return GeocodeResult(f"{name} Main St", '75001', 'Addison', 'Texas', 'United States')
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = GeocodeCache(ttl=60, max_entries=2, max_bytes=1 << 20)
+    cache.set('a', result('a'))
+    cache.set('b', result('b'))
+    cache.get('a')
+    cache.set('c', result('c'))
+
+    assert [key for key, _ in cache.items()] == ['a', 'c']
+    assert cache.get('b') is None
+    assert cache.evictions == 1
+
+
+def test_byte_budget_evicts():
+    cache = GeocodeCache(ttl=60, max_entries=100, max_bytes=1 << 20)
+    cache.set('a', result('a'))
+    cache.max_bytes = cache.bytes * 2
+    for key in 'bcd':
+        cache.set(key, result(key))
+
+    assert len(cache) == 2
+    assert cache.bytes <= cache.max_bytes
+
+
+def test_entries_expire_after_ttl():
+    cache = GeocodeCache(ttl=10, max_entries=100, max_bytes=1 << 20)
+    cache.set('old', result('old'), timestamp=time.time() - 11)
+    cache.set('new', result('new'))
+
+    assert cache.get('old') is None
+    assert cache.get('new').address == 'new Main St'
+    assert cache.expirations == 1
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_overwriting_a_key_keeps_one_entry():
+    cache = GeocodeCache(ttl=60, max_entries=100, max_bytes=1 << 20)
+    cache.set('a', result('first'))
+    size = cache.bytes
+    cache.set('a', result('other'))
+
+    assert len(cache) == 1
+    assert cache.bytes == size
+    assert cache.get('a').address == 'other Main St'
+
+
+def test_cache_key_rounds_to_six_decimals():
+    assert get_cache_key(33.00000049, -96.1) == get_cache_key(33.0, -96.1000001) == '33.000000,-96.100000'
+
+
+def test_snapshot_round_trip_keeps_entries_timestamps_and_order():
+    source = GeocodeCache(ttl=3600, max_entries=100, max_bytes=1 << 20)
+    for i, key in enumerate('abc'):
+        source.set(key, result(key), timestamp=time.time() - 100 + i)
+    source.get('a')
+
+    target = GeocodeCache(ttl=3600, max_entries=100, max_bytes=1 << 20)
+    assert import_snapshot(target, read_snapshot(io.BytesIO(export_snapshot(source)))) == (3, 0)
+
+    expected = [(key, value.address, value.city, timestamp) for key, value, timestamp in source.entries()]
+    assert [(key, value.address, value.city, timestamp) for key, value, timestamp in target.entries()] == expected
+    assert [key for key, _ in target.items()] == ['b', 'c', 'a']
+
+
+def test_import_keeps_newer_entries_and_drops_expired_ones():
+    now = time.time()
+    source = GeocodeCache(ttl=3600, max_entries=100, max_bytes=1 << 20)
+    source.set('stale', result('stale'), timestamp=now - 7200)
+    source.set('older', result('snapshot'), timestamp=now - 60)
+    snapshot = export_snapshot(source)
+
+    target = GeocodeCache(ttl=3600, max_entries=100, max_bytes=1 << 20)
+    target.set('older', result('local'), timestamp=now)
+    assert import_snapshot(target, read_snapshot(io.BytesIO(snapshot))) == (0, 2)
+    assert target.get('older').address == 'local Main St'
+    assert target.get('stale') is None
+
+
+def test_other_files_are_rejected():
+    with pytest.raises(ValueError):
+        list(read_snapshot(io.BytesIO(gzip.compress(b'{"format": "something-else"}\n'))))
+    with pytest.raises(ValueError, match='version'):
+        list(read_snapshot(io.BytesIO(gzip.compress(b'{"format": "polygon-extractor-geocache", "version": 99}\n'))))
@@ -0,0 +1,271 @@
+import gc
+import threading
+import time
+
+import pytest
+from geopy.exc import GeocoderQueryError, GeocoderRateLimited, GeocoderServiceError, GeocoderUnavailable
+
+from geocache import GeocodeCache, get_cache_key
+from geocoding import (
+    BackendPool, CircuitBreaker, CircuitOpenError, GeocoderBackend, Prefetcher, RateLimiter, backoff_delay,
+    geocode_with_retry
+)
+from records import GeocodeResult
+
+
+def new_cache():
+    return GeocodeCache(ttl=60, max_entries=1000, max_bytes=1 << 20)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class GatedGeocoder:
+    """Geocoder recording its calls that holds the first one until released"""
+
+    def __init__(self, label):
+        self.label = label
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, lat, lon):
+        self.calls.append((self.label, lat, lon))
+        if len(self.calls) == 1:
+            self.release.wait(5)
+        return GeocodeResult(f"{lat} {lon}")
+
+
+def points(n, lat=33.0):
+    return [(lat, -96.0 + i * 0.001) for i in range(n)]
+
+
+def test_prefetch_fills_the_cache_and_skips_cached_points():
+    cache = new_cache()
+    cache.set(get_cache_key(*points(3)[1]), GeocodeResult('already known'))
+    calls = []
+
+    def geocode(lat, lon):
+        calls.append((lat, lon))
+        return GeocodeResult(f"{lat} {lon}")
+
+    job = Prefetcher().submit('block', points(3), cache, geocode, get_cache_key)
+    wait_until(lambda: job.finished)
+
+    assert (job.done, job.fetched, job.failed) == (3, 2, 0)
+    assert calls == [points(3)[0], points(3)[2]]
+    assert cache.get(get_cache_key(*points(3)[1])).address == 'already known'
+
+
+def test_sessions_take_turns():
+    prefetcher = Prefetcher()
+    big, small = new_cache(), new_cache()
+    log = []
+    first = GatedGeocoder('big')
+    first.calls = log
+
+    def other(lat, lon):
+        log.append(('small', lat, lon))
+        return GeocodeResult(f"{lat} {lon}")
+
+    big_job = prefetcher.submit('big', points(20), big, first, get_cache_key)
+    wait_until(lambda: log)
+    small_job = prefetcher.submit('small', points(2, lat=34.0), small, other, get_cache_key)
+    first.release.set()
+    wait_until(lambda: big_job.finished and small_job.finished)
+
+    assert [label for label, _, _ in log[:4]] == ['big', 'small', 'big', 'small']
+
+
+def test_jobs_of_a_closed_session_stop():
+    cache = new_cache()
+    geocode = GatedGeocoder('gone')
+    job = Prefetcher().submit('block', points(10), cache, geocode, get_cache_key)
+    wait_until(lambda: geocode.calls)
+
+    del cache
+    geocode.release.set()
+    gc.collect()
+    wait_until(lambda: job.finished)
+    time.sleep(0.05)
+
+    assert job.cache is None
+    assert len(geocode.calls) == 1
+
+
+def test_cancelled_job_stops():
+    cache = new_cache()
+    geocode = GatedGeocoder('cancelled')
+    job = Prefetcher().submit('block', points(10), cache, geocode, get_cache_key)
+    wait_until(lambda: geocode.calls)
+    job.cancel()
+    geocode.release.set()
+    time.sleep(0.05)
+
+    assert job.finished
+    assert len(geocode.calls) == 1
+
+
+def test_breaker_opens_after_threshold_and_closes_after_a_good_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trips == 1
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    breaker.before_call()
+    # Only one trial request at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    assert breaker.retry_after() > 0
+    assert breaker.trips == 1
+
+
+def backend(name, fetch=None, fallback=False, failure_threshold=1, reset_timeout=60.0):
+    if fetch is None:
+        fetch = lambda lat, lon: GeocodeResult(f"{name} answer")
+    return GeocoderBackend(name, fetch, RateLimiter(0), CircuitBreaker(failure_threshold, reset_timeout), fallback)
+
+
+def unavailable(lat, lon):
+    raise GeocoderUnavailable("503")
+
+
+def test_failed_request_fails_over_to_another_backend():
+    down = backend('down', unavailable)
+    up = backend('up')
+    pool = BackendPool([down, up], initial_delay=0)
+
+    assert pool.reverse(33.0, -96.0).address == 'up answer'
+    assert down.failures == 1
+    assert down.breaker.state == 'open'
+
+    # The open backend is no longer tried
+    assert pool.reverse(33.0, -96.0).address == 'up answer'
+    assert down.requests == 1
+    assert up.requests == 2
+
+
+def test_fallback_only_serves_while_the_others_are_open():
+    primary = backend('primary')
+    spare = backend('spare', fallback=True)
+    pool = BackendPool([spare, primary], initial_delay=0)
+
+    assert pool.reverse(33.0, -96.0).address == 'primary answer'
+    primary.breaker.record_failure()
+    assert pool.reverse(33.0, -96.0).address == 'spare answer'
+    assert spare.requests == 1
+
+
+def test_all_breakers_open_raises_circuit_open():
+    pool = BackendPool([backend('a', unavailable), backend('b', unavailable)], initial_delay=0)
+
+    with pytest.raises(GeocoderUnavailable):
+        pool.reverse(33.0, -96.0)
+    with pytest.raises(CircuitOpenError) as info:
+        pool.reverse(33.0, -96.0)
+    assert 0 < info.value.retry_after <= 60
+
+
+def test_single_backend_retries_with_backoff():
+    answers = [GeocoderUnavailable("503"), GeocoderUnavailable("503"), GeocodeResult("third time")]
+
+    def flaky(lat, lon):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    only = backend('only', flaky, failure_threshold=5)
+    assert BackendPool([only], initial_delay=0).reverse(33.0, -96.0).address == 'third time'
+    assert (only.requests, only.failures) == (3, 2)
+
+
+def test_bad_queries_are_not_retried_or_held_against_the_backend():
+    def bad_query(lat, lon):
+        raise GeocoderQueryError("bad")
+
+    rejecting = backend('rejecting', bad_query)
+    other = backend('other')
+    with pytest.raises(GeocoderQueryError):
+        BackendPool([rejecting, other], initial_delay=0).reverse(33.0, -96.0)
+    assert rejecting.breaker.state == 'closed'
+    assert other.requests == 0
+
+
+def test_out_of_range_coordinates_raise_value_error():
+    with pytest.raises(ValueError):
+        BackendPool([backend('a')]).reverse(91.0, 0.0)
+
+
+def test_held_trial_raises_circuit_open_without_backing_off(monkeypatch):
+    only = backend('only', reset_timeout=0)
+    only.breaker.record_failure()
+    only.breaker.before_call()  # Another caller is running the trial request
+
+    def no_sleep(seconds):
+        raise AssertionError("slept while another caller held the trial")
+
+    monkeypatch.setattr(time, 'sleep', no_sleep)
+    with pytest.raises(CircuitOpenError):
+        BackendPool([only]).reverse(33.0, -96.0)
+    assert only.requests == 0
+
+
+def test_backoff_is_jittered_and_capped():
+    delays = [backoff_delay(3, 1, 30) for _ in range(50)]
+    assert all(4 <= delay <= 8 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(15 <= backoff_delay(10, 1, 30) <= 30 for _ in range(50))
+
+
+def test_retry_honors_retry_after():
+    limiter = RateLimiter(0)
+    paused = []
+    limiter.pause = paused.append
+    answers = [GeocoderRateLimited("429", retry_after=7), 'ok']
+
+    def call():
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    assert geocode_with_retry(call, limiter) == 'ok'
+    assert paused == [7]
+
+
+def test_retry_records_failures_and_fails_fast_once_open(monkeypatch):
+    monkeypatch.setattr(time, 'sleep', lambda seconds: None)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise GeocoderServiceError("500")
+
+    with pytest.raises(GeocoderServiceError):
+        geocode_with_retry(down, RateLimiter(0), max_retries=2, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        geocode_with_retry(down, RateLimiter(0), breaker=breaker)
+    assert len(calls) == 2
@@ -0,0 +1,91 @@
+import pytest
+import shapely
+from shapely.geometry import Polygon, box
+
+from grid import generate_grid_points, iter_tile_grid_points, split_into_tiles, stratified_order
+
+PARK = Polygon(
+    [(-96.01, 33.0), (-96.0, 33.0), (-96.0, 33.01), (-96.01, 33.01)],
+    [[(-96.007, 33.003), (-96.003, 33.003), (-96.003, 33.007), (-96.007, 33.007)]]
+)
+
+
+def test_grid_points_are_inside_the_polygon():
+    points = generate_grid_points(box(-96.01, 33.0, -96.0, 33.01), 0.001)
+    assert len(points) == 9 * 9
+    assert all(-96.01 < lon < -96.0 and 33.0 < lat < 33.01 for lat, lon in points)
+
+
+def test_no_grid_point_falls_inside_a_hole():
+    points = generate_grid_points(PARK, 0.0005)
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    hole = Polygon(PARK.interiors[0])
+
+    assert points
+    assert not shapely.intersects_xy(hole, lons, lats).any()
+    assert len(points) < len(generate_grid_points(Polygon(PARK.exterior), 0.0005))
+
+
+def test_tiles_cover_the_grid_once_and_stay_small():
+    tiles = split_into_tiles(PARK, 0.0005, max_tile_points=25)
+    cells = [(i, j) for i0, i1, j0, j1 in tiles for i in range(i0, i1) for j in range(j0, j1)]
+
+    assert len(tiles) > 1
+    assert all((i1 - i0) * (j1 - j0) <= 25 for i0, i1, j0, j1 in tiles)
+    assert len(cells) == len(set(cells))
+
+
+def test_tiles_far_from_the_polygon_are_dropped():
+    ring = Polygon([(0, 0), (1, 0), (1, 0.01), (0.01, 0.01), (0.01, 1), (0, 1)])
+    tiles = split_into_tiles(ring, 0.01, max_tile_points=100)
+    assert len(tiles) < 100
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_tiled_points_match_the_full_grid(max_workers):
+    tiles = split_into_tiles(PARK, 0.0005, max_tile_points=25)
+    results = list(iter_tile_grid_points(PARK, 0.0005, tiles, max_workers=max_workers))
+
+    assert sorted(index for index, _ in results) == list(range(len(tiles)))
+    tiled = [point for _, points in results for point in points]
+    assert sorted(tiled) == sorted(generate_grid_points(PARK, 0.0005))
+
+
+def grid(n, step=0.001):
+    return [(33.0 + i * step, -96.0 + j * step) for i in range(n) for j in range(n)]
+
+
+def test_every_point_is_kept_once():
+    points = grid(8)
+    assert sorted(stratified_order(points)) == sorted(points)
+
+
+def test_coarse_points_come_first():
+    points = grid(8)
+    ordered = stratified_order(points)
+    index = {point: (i, j) for point, (i, j) in zip(points, ((i, j) for i in range(8) for j in range(8)))}
+
+    # Every 4th row and column, then every 2nd, then the rest
+    assert {index[p] for p in ordered[:4]} == {(0, 0), (0, 4), (4, 0), (4, 4)}
+    assert {index[p] for p in ordered[:16]} == {(i, j) for i in range(0, 8, 2) for j in range(0, 8, 2)}
+
+
+def test_order_is_deterministic_per_seed():
+    points = grid(8)
+    assert stratified_order(points, seed=3) == stratified_order(points, seed=3)
+    assert stratified_order(points, seed=3) != stratified_order(points, seed=4)
+
+
+def test_works_on_generated_grids():
+    points = generate_grid_points(box(-96.0, 33.0, -95.99, 33.01), 0.001)
+    ordered = stratified_order(points)
+    assert sorted(ordered) == sorted(points)
+    assert ordered[0] == min(points)
+
+
+def test_short_lists_are_copied():
+    points = [(33.0, -96.0)]
+    ordered = stratified_order(points)
+    assert ordered == points and ordered is not points
+    assert stratified_order([]) == []
@@ -0,0 +1,156 @@
+import io
+
+import numpy as np
+import pytest
+
+from kml_parser import KmlValidationError, _parse_coordinates, build_polygon_geometry, parse_kml, read_validated_kml
+
+KML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+  <Document>
+    <Placemark>
+      <name>Park with pond</name>
+      <Polygon>
+        <outerBoundaryIs><LinearRing><coordinates>
+          -96.010,33.000,0 -96.000,33.000,0 -96.000,33.010,0 -96.010,33.010,0 -96.010,33.000,0
+        </coordinates></LinearRing></outerBoundaryIs>
+        <innerBoundaryIs><LinearRing><coordinates>
+          -96.007,33.003,0 -96.003,33.003,0 -96.003,33.007,0 -96.007,33.007,0 -96.007,33.003,0
+        </coordinates></LinearRing></innerBoundaryIs>
+      </Polygon>
+    </Placemark>
+    <Placemark>
+      <name>Two blocks</name>
+      <MultiGeometry>
+        <Polygon><outerBoundaryIs><LinearRing><coordinates>
+          -96.02,33.02 -96.01,33.02 -96.01,33.03 -96.02,33.02
+        </coordinates></LinearRing></outerBoundaryIs></Polygon>
+        <Polygon><outerBoundaryIs><LinearRing><coordinates>
+          -96.04,33.04 -96.03,33.04 -96.03,33.05 -96.04,33.04
+        </coordinates></LinearRing></outerBoundaryIs></Polygon>
+      </MultiGeometry>
+    </Placemark>
+    <Polygon><outerBoundaryIs><LinearRing><coordinates>
+      -96.06,33.06 -96.05,33.06 -96.05,33.07 -96.06,33.06
+    </coordinates></LinearRing></outerBoundaryIs></Polygon>
+  </Document>
+</kml>'''
+
+
+def test_holes_are_parsed_with_their_polygon():
+    polygons, warnings = parse_kml(KML)
+    park = polygons[0]
+
+    assert warnings == []
+    assert park['name'] == 'Park with pond'
+    assert len(park['parts']) == 1
+    assert len(park['parts'][0]['holes']) == 1
+    np.testing.assert_allclose(park['parts'][0]['holes'][0][0], [-96.007, 33.003])
+
+    geometry = build_polygon_geometry(park)
+    assert geometry.geom_type == 'Polygon'
+    assert geometry.area == pytest.approx(0.01 ** 2 - 0.004 ** 2)
+
+
+def test_multigeometry_placemark_is_one_area():
+    polygons, _ = parse_kml(KML)
+    blocks = polygons[1]
+
+    assert blocks['name'] == 'Two blocks'
+    assert len(blocks['parts']) == 2
+    assert build_polygon_geometry(blocks).geom_type == 'MultiPolygon'
+
+
+def test_bare_polygon_gets_a_default_name():
+    polygons, _ = parse_kml(KML)
+    assert [p['name'] for p in polygons] == ['Park with pond', 'Two blocks', 'Polygon 3']
+    assert len({p['id'] for p in polygons}) == 3
+
+
+def test_polygon_without_outer_ring_is_dropped():
+    kml = b'''<kml xmlns="http://www.opengis.net/kml/2.2"><Placemark><Polygon>
+      <innerBoundaryIs><LinearRing><coordinates>0,0 1,0 1,1 0,0</coordinates></LinearRing></innerBoundaryIs>
+    </Polygon></Placemark></kml>'''
+    assert parse_kml(kml) == ([], [])
+
+
+class CountingReader(io.BytesIO):
+    """BytesIO remembering how many bytes were read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_valid_kml_is_returned_unchanged():
+    assert read_validated_kml(io.BytesIO(KML), chunk_size=100) == KML
+
+
+def test_oversized_kml_is_rejected_without_reading_it_all():
+    data = b'<kml>' + b' ' * 10_000 + b'</kml>'
+    reader = CountingReader(data)
+    with pytest.raises(KmlValidationError, match='larger than'):
+        read_validated_kml(reader, max_bytes=1000, chunk_size=256)
+    assert reader.bytes_read < 1300
+
+
+def test_too_many_elements_are_rejected():
+    data = b'<kml>' + b'<Placemark/>' * 50 + b'</kml>'
+    with pytest.raises(KmlValidationError, match='more than 20 elements'):
+        read_validated_kml(io.BytesIO(data), max_elements=20)
+    assert read_validated_kml(io.BytesIO(data), max_elements=51) == data
+
+
+@pytest.mark.parametrize('chunk_size', [4096, 50, 7])
+def test_entity_declarations_are_rejected_even_across_chunks(chunk_size):
+    data = b'<?xml version="1.0"?><!DOCTYPE kml [<!ENTITY a "aaaaaaaa">]><kml>&a;</kml>'
+    with pytest.raises(KmlValidationError, match='entities'):
+        read_validated_kml(io.BytesIO(data), chunk_size=chunk_size)
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'<svg xmlns="http://www.w3.org/2000/svg"/>', 'Root element is <svg>'),
+    (b'<kml><Placemark></kml>', 'Invalid XML'),
+    (b'<kml>', 'Invalid XML'),
+    (b'', 'Invalid XML'),
+])
+def test_other_documents_are_rejected(data, message):
+    with pytest.raises(KmlValidationError, match=message):
+        read_validated_kml(io.BytesIO(data))
+
+
+@pytest.mark.parametrize('text', [
+    "-96.1,33.1 -96.2,33.2 -96.3,33.3",
+    "-96.1,33.1,0 -96.2,33.2,0 -96.3,33.3,0",
+    "\n  -96.1,33.1,0\n  -96.2,33.2,0\n  -96.3,33.3,0\n",
+    "-96.1,33.1 -96.2,33.2,0 -96.3,33.3,10",
+    "-96.1 , 33.1  -96.2,\t33.2 -96.3 ,33.3",
+])
+def test_tuples_are_parsed_to_lon_lat(text):
+    np.testing.assert_allclose(_parse_coordinates(text), [[-96.1, 33.1], [-96.2, 33.2], [-96.3, 33.3]])
+
+
+def test_comma_ending_a_line_does_not_join_tuples():
+    coords = _parse_coordinates("-96.1,33.1,\n-96.2,33.2,\n-96.3,33.3,")
+    np.testing.assert_allclose(coords, [[-96.1, 33.1], [-96.2, 33.2], [-96.3, 33.3]])
+
+
+def test_malformed_tuples_are_skipped():
+    coords = _parse_coordinates("-96.1,33.1 east,north -96.3 -96.4,33.4")
+    np.testing.assert_allclose(coords, [[-96.1, 33.1], [-96.4, 33.4]])
+
+
+@pytest.mark.parametrize('text', ["", "   \n ", "nan-ish"])
+def test_nothing_usable_gives_an_empty_array(text):
+    assert _parse_coordinates(text).shape == (0, 2)
+
+
+def test_large_rings_take_the_bulk_path():
+    ring = np.column_stack([np.linspace(-96.0, -95.0, 10_000), np.linspace(33.0, 34.0, 10_000)])
+    text = ' '.join(f"{lon!r},{lat!r},0" for lon, lat in ring.tolist())
+    np.testing.assert_array_equal(_parse_coordinates(text), ring)
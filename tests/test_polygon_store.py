@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import polygon_store
+from polygon_store import PolygonStore
+
+
+def placemark(name, x, y, size=0.004, hole=False):
+    ring = f"{x},{y} {x + size},{y} {x + size},{y + size} {x},{y + size} {x},{y}"
+    inner = ''
+    if hole:
+        h = size / 4
+        inner = (
+            f"<innerBoundaryIs><LinearRing><coordinates>{x + h},{y + h} {x + 2 * h},{y + h} "
+            f"{x + 2 * h},{y + 2 * h} {x + h},{y + h}</coordinates></LinearRing></innerBoundaryIs>"
+        )
+    return (
+        f"<Placemark><name>{name}</name><Polygon><outerBoundaryIs><LinearRing><coordinates>{ring}"
+        f"</coordinates></LinearRing></outerBoundaryIs>{inner}</Polygon></Placemark>"
+    )
+
+
+def kml(*placemarks):
+    return ('<kml xmlns="http://www.opengis.net/kml/2.2"><Document>' + ''.join(placemarks) + '</Document></kml>').encode()
+
+
+# A 10 x 10 block of polygons, 5 mm of a degree apart, listed column by column
+GRID = kml(*(placemark(f"P{i}-{j}", -96.0 + i * 0.005, 33.0 + j * 0.005) for i in range(10) for j in range(10)))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PolygonStore(str(tmp_path))
+
+
+def test_same_content_is_stored_and_parsed_once(store, monkeypatch):
+    kml_hash, _ = store.add(GRID, 'grid.kml')
+    monkeypatch.setattr(polygon_store, 'parse_kml', lambda content: pytest.fail("parsed again"))
+
+    assert store.add(GRID, 'copy of grid.kml') == (kml_hash, [])
+    assert [(entry[0], entry[1], entry[2]) for entry in store.list()] == [(kml_hash, 'grid.kml', 100)]
+
+
+def test_catalog_is_shared_between_instances(store, tmp_path):
+    kml_hash, _ = store.add(GRID, 'grid.kml')
+    assert len(PolygonStore(str(tmp_path)).summaries(kml_hash)) == 100
+
+
+def test_viewport_query_returns_polygons_meeting_the_box_in_file_order(store):
+    kml_hash, _ = store.add(GRID, 'grid.kml')
+    other_hash, _ = store.add(kml(placemark('Other file', -95.985, 33.015)), 'other.kml')
+
+    # Touches columns 2-3 and rows 3-4
+    records = store.query(kml_hash, (-95.9865, 33.0155, -95.9845, 33.0205))
+    assert [r['name'] for r in records] == ['P2-3', 'P2-4', 'P3-3', 'P3-4']
+    assert [r['name'] for r in store.query(other_hash, (-95.9865, 33.0155, -95.9845, 33.0205))] == ['Other file']
+    assert store.query(kml_hash, (0.0, 0.0, 1.0, 1.0)) == []
+
+
+def test_query_limit_and_whole_file(store):
+    kml_hash, _ = store.add(GRID, 'grid.kml')
+
+    assert [r['name'] for r in store.query(kml_hash, (-97.0, 32.0, -95.0, 34.0), limit=3)] == ['P0-0', 'P0-1', 'P0-2']
+    assert len(store.query(kml_hash)) == 100
+    assert store.bounds(kml_hash) == pytest.approx((-96.0, 33.0, -95.951, 33.049))
+
+
+def test_polygon_by_id_keeps_holes_exactly(store):
+    content = kml(placemark('Park', -96.123456789, 33.987654321, hole=True))
+    kml_hash, _ = store.add(content, 'park.kml')
+    record = store.get(kml_hash, 'kml_polygon_0')
+
+    assert record['name'] == 'Park'
+    np.testing.assert_array_equal(record['parts'][0]['coordinates'][0], [-96.123456789, 33.987654321])
+    assert len(record['parts'][0]['holes']) == 1
+    with pytest.raises(KeyError):
+        store.get(kml_hash, 'kml_polygon_1')
+    with pytest.raises(KeyError):
+        store.bounds('not stored')
+
+
+def test_kml_without_polygons_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.add(kml(), 'empty.kml')
+    assert store.list() == []
@@ -0,0 +1,70 @@
+import time
+
+from shapely.geometry import MultiPolygon, Polygon, box
+
+from records import AddressTable, GeocodeResult
+from result_store import ResultStore, geometry_hash, result_key
+
+SQUARE = [(-96.0, 33.0), (-95.99, 33.0), (-95.99, 33.01), (-96.0, 33.01)]
+
+
+def table(*addresses):
+    result = AddressTable()
+    for i, address in enumerate(addresses):
+        result.append(33.0 + i * 1e-4, -96.0, GeocodeResult(address, '75001', 'Addison', 'Texas', 'United States'))
+    return result
+
+
+def test_hash_ignores_orientation_start_vertex_and_float_noise():
+    reference = geometry_hash(Polygon(SQUARE))
+
+    assert geometry_hash(Polygon(SQUARE[::-1])) == reference
+    assert geometry_hash(Polygon(SQUARE[2:] + SQUARE[:2])) == reference
+    assert geometry_hash(Polygon([(x + 1e-10, y - 1e-10) for x, y in SQUARE])) == reference
+    assert geometry_hash(Polygon([(x + 1e-5, y) for x, y in SQUARE])) != reference
+
+
+def test_hash_of_invalid_geometry():
+    bow_tie = Polygon([(0, 0), (1, 1), (1, 0), (0, 1)])
+    overlapping = MultiPolygon([box(0, 0, 2, 2), box(1, 1, 3, 3)])
+
+    assert geometry_hash(bow_tie) == geometry_hash(Polygon([(1, 1), (1, 0), (0, 1), (0, 0)]))
+    assert geometry_hash(overlapping) != geometry_hash(box(0, 0, 3, 3))
+
+
+def test_key_depends_on_every_setting():
+    keys = {
+        result_key(Polygon(SQUARE), 0.0002, 'grid', 'nominatim.openstreetmap.org'),
+        result_key(Polygon(SQUARE), 0.0005, 'grid', 'nominatim.openstreetmap.org'),
+        result_key(Polygon(SQUARE), 0.0002, 'streets:20:12', 'nominatim.openstreetmap.org'),
+        result_key(Polygon(SQUARE), 0.0002, 'grid', '10.0.0.5:8080'),
+    }
+    assert len(keys) == 4
+
+
+def test_stored_table_round_trips(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite3'))
+    store.put('key', 'Block', table('1 Main St', '2 Main St'))
+    stored, created = store.get('key')
+
+    assert [r.address for r in stored.results] == ['1 Main St', '2 Main St']
+    assert stored.results[0].city == 'Addison'
+    assert list(stored.latitudes) == [33.0, 33.0001]
+    assert created <= time.time()
+    assert store.get('other') is None
+    assert store.stats()[0] == 1
+
+
+def test_results_expire_after_max_age(tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    ResultStore(path).put('old', 'Block', table('1 Main St'))
+    store = ResultStore(path, max_age=0.05)
+    assert store.get('old') is not None
+
+    time.sleep(0.06)
+    assert store.get('old') is None
+    store.put('new', 'Block', table('2 Main St'))
+
+    # Storing a result deletes the expired ones
+    assert store.stats()[0] == 1
+    assert ResultStore(path).get('old') is None
@@ -0,0 +1,93 @@
+import gzip
+import math
+
+import pytest
+import shapely
+from shapely.geometry import LineString, box
+
+from engine import main
+from streets import METERS_PER_DEGREE, StreetIndex, load_street_index, load_street_lines, street_sample_points, street_sampler
+
+# About 1.1 km wide and 560 m tall, with a street across the middle
+AREA = box(-96.01, 33.0, -96.0, 33.005)
+MAIN_STREET = LineString([(-96.02, 33.0025), (-95.99, 33.0025)])
+
+OSM = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="33.0025" lon="-96.02"/>
+  <node id="2" lat="33.0025" lon="-96.005"/>
+  <node id="3" lat="33.0025" lon="-95.99"/>
+  <node id="4" lat="34.0" lon="-90.0"/>
+  <node id="5" lat="34.0" lon="-90.01"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>
+  <way id="11"><nd ref="1"/><nd ref="3"/><tag k="highway" v="motorway"/></way>
+  <way id="12"><nd ref="4"/><nd ref="5"/><tag k="highway" v="living_street"/></way>
+  <relation id="20"><member type="way" ref="10" role=""/></relation>
+</osm>
+'''
+
+
+def test_points_run_along_both_sides_at_the_spacing():
+    points = street_sample_points(AREA, [MAIN_STREET], spacing=20.0, offset=12.0)
+    lats = sorted({lat for lat, _ in points})
+    offset = 12.0 / METERS_PER_DEGREE
+
+    assert lats == pytest.approx([33.0025 - offset, 33.0025 + offset], abs=1e-6)
+    x_scale = METERS_PER_DEGREE * math.cos(math.radians(33.0025))
+    north = sorted(lon for lat, lon in points if lat > 33.0025)
+    assert (north[1] - north[0]) * x_scale == pytest.approx(20.0, rel=0.01)
+    # One point per 20 m of the ~934 m of street inside the area, on each side
+    assert len(points) == pytest.approx(2 * 0.01 * x_scale / 20, abs=4)
+
+
+def test_points_stay_inside_the_polygon():
+    corner = shapely.Polygon([(-96.01, 33.0), (-96.0, 33.0), (-96.01, 33.005)])
+    points = street_sample_points(corner, [MAIN_STREET])
+    lats, lons = zip(*points)
+
+    assert points
+    assert shapely.contains_xy(corner, lons, lats).all()
+
+
+def test_no_streets_give_no_points():
+    assert street_sample_points(AREA, []) == []
+    assert street_sample_points(AREA, [LineString([(-90.0, 34.0), (-90.01, 34.0)])]) == []
+
+
+def test_stratified_sampler_keeps_every_point():
+    plain = next(street_sampler([MAIN_STREET])(AREA))
+    stratified = next(street_sampler([MAIN_STREET], stratified=True)(AREA))
+
+    assert sorted(stratified) == sorted(plain)
+    assert stratified != plain
+
+
+@pytest.mark.parametrize('name', ['area.osm', 'area.osm.gz'])
+def test_residential_ways_are_read_and_clipped(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(gzip.compress(OSM.encode()) if name.endswith('.gz') else OSM.encode())
+
+    everything = load_street_lines(str(path))
+    assert sorted(len(line.coords) for line in everything) == [2, 3]
+
+    # Node 3 lies outside the box, so the way is cut where it leaves
+    clipped = load_street_lines(str(path), (-96.02, 33.0, -96.005, 33.005))
+    assert [list(line.coords) for line in clipped] == [[(-96.02, 33.0025), (-96.005, 33.0025)]]
+
+
+def test_index_returns_the_streets_of_an_area(tmp_path):
+    path = tmp_path / 'area.osm'
+    path.write_text(OSM)
+    index = load_street_index(str(path))
+
+    assert len(index) == 2
+    assert [line.bounds[1] for line in index.query(AREA.bounds)] == [33.0025]
+    assert index.query((0.0, 0.0, 1.0, 1.0)) == []
+    assert StreetIndex([MAIN_STREET]).query(AREA.bounds) == [MAIN_STREET]
+
+
+def test_cli_rejects_tiled_street_sampling(tmp_path, capsys):
+    with pytest.raises(SystemExit) as info:
+        main([str(tmp_path / 'areas.kml'), '--streets', str(tmp_path / 'area.osm'), '--tiled'])
+    assert info.value.code == 2
+    assert '--tiled' in capsys.readouterr().err